@@ -0,0 +1,105 @@
+"""
+Compares frames/s and accuracy of the camera movement estimation against the previous per-feature Python loop.
+Frames are a synthetic textured pitch panned by a known offset per frame.
+
+Run from the root of the project:
+python benchmarks/camera_movement_benchmark.py --frames 200 --width 1920 --height 1080
+"""
+from typing import List, Tuple
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+sys.path.append(os.path.abspath("."))
+from camera_movement import CameraMovementEstimator
+from utils import get_distance
+
+def synthetic_pan(num_frames: int, width: int, height: int, seed: int=0) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Frames cut from a larger random texture at a moving offset, and the true camera movement per frame.
+    """
+    rng = np.random.default_rng(seed)
+
+    steps = rng.uniform(-12, 12, size=(num_frames, 2)).round()
+    steps[0] = 0
+    offsets = np.cumsum(steps, axis=0).astype(int)
+    offsets -= offsets.min(axis=0)
+    margin = offsets.max(axis=0)
+
+    texture = cv2.GaussianBlur((rng.random((height + margin[1], width + margin[0])) * 255).astype(np.uint8), (5, 5), 0)
+    texture = cv2.cvtColor(texture, cv2.COLOR_GRAY2BGR)
+
+    frames = [np.ascontiguousarray(texture[y:y+height, x:x+width]) for x, y in offsets]
+
+    # content moves opposite to the crop offset
+    return frames, -steps
+
+def legacy_camera_movement(estimator: CameraMovementEstimator, frames: List[np.ndarray]) -> List[List[float]]:
+    """
+    Previous implementation: full resolution, Python loop over every feature pair.
+    """
+    features = dict(estimator.features, minDistance=10, mask=cv2.resize(estimator.features["mask"], frames[0].shape[1::-1], interpolation=cv2.INTER_NEAREST))
+    camera_movement = [[0, 0]] * len(frames)
+
+    old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
+    old_features = cv2.goodFeaturesToTrack(old_gray, **features)
+
+    for frame_num in range(1, len(frames)):
+        frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
+        new_features, _, _ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **estimator.lk_params)
+
+        max_distance = 0
+        camera_movement_x, camera_movement_y = 0, 0
+
+        for new, old in zip(new_features, old_features):
+            new_features_point = new.ravel()
+            old_features_point = old.ravel()
+
+            distance = get_distance(new_features_point, old_features_point)
+
+            if distance > max_distance:
+                max_distance = distance
+                camera_movement_x = new_features_point[0] - old_features_point[0]
+                camera_movement_y = new_features_point[1] - old_features_point[1]
+
+        if max_distance > estimator.minimum_distance:
+            camera_movement[frame_num] = [camera_movement_x, camera_movement_y]
+            old_features = cv2.goodFeaturesToTrack(frame_gray, **features)
+
+        old_gray = frame_gray.copy()
+
+    return camera_movement
+
+def run(name: str, function, frames: List[np.ndarray], truth: np.ndarray) -> None:
+    start_time = time.perf_counter()
+    movement = np.asarray(function(frames), dtype=np.float32)
+    duration = time.perf_counter() - start_time
+
+    # error only on frames above the minimum distance, smaller movements are reported as 0 by design
+    moving = np.hypot(truth[:, 0], truth[:, 1]) > 5
+    error = np.abs(movement[moving] - truth[moving]).mean()
+
+    print(f"{name:<28} {len(frames) / duration:>10.1f} frames/s {error:>10.3f} px mean error")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Camera movement estimation benchmark.")
+    parser.add_argument("--frames", type=int, default=200, help="Number of synthetic frames")
+    parser.add_argument("--width", type=int, default=1920, help="Frame width")
+    parser.add_argument("--height", type=int, default=1080, help="Frame height")
+
+    args = parser.parse_args()
+
+    frames, truth = synthetic_pan(args.frames, args.width, args.height)
+    classes = []
+
+    print(f"{args.frames} frames at {args.width}x{args.height}")
+
+    legacy = CameraMovementEstimator(frames[0], classes, verbose=False, scale=1)
+    run("legacy (loop, full res)", lambda frames: legacy_camera_movement(legacy, frames), frames, truth)
+
+    for scale in (1, 0.5, 0.25):
+        for estimator_name in ("max", "median"):
+            estimator = CameraMovementEstimator(frames[0], classes, verbose=False, scale=scale, estimator=estimator_name)
+            run(f"{estimator_name} (scale {scale})", estimator.get_camera_movement, frames, truth)
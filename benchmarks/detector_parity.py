@@ -0,0 +1,89 @@
+"""
+Checks that the ONNX Runtime backend detects the same boxes as the PyTorch backend and compares their frames/s.
+Boxes of both backends are matched per frame by IoU, the check fails if a box has no match with at least --min-iou
+(boxes with a confidence close to the threshold may only be found by one backend and are ignored).
+
+Run from the root of the project:
+python benchmarks/detector_parity.py --video demos/demo1.mp4 --frames 50 --int8
+"""
+from typing import List, Tuple
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import supervision as sv
+import ultralytics
+from scipy.optimize import linear_sum_assignment
+sys.path.append(os.path.abspath("."))
+from trackers.onnx_detector import OnnxDetector
+from utils import read_video
+
+def detect(model, frames: List[np.ndarray], conf: float, batch_size: int) -> Tuple[List[sv.Detections], float]:
+    """
+    Detections in the format the Tracker uses and frames/s.
+    """
+    model.predict(source=frames[:batch_size], conf=conf, verbose=False)    # warm-up
+
+    predictions = []
+    start_time = time.time()
+    for i in range(0, len(frames), batch_size):
+        predictions += model.predict(source=frames[i:i+batch_size], conf=conf, verbose=False)
+    fps = len(frames) / (time.time() - start_time)
+
+    return [sv.Detections.from_ultralytics(prediction) for prediction in predictions], fps
+
+def compare(reference: List[sv.Detections], detections: List[sv.Detections], margin: float) -> Tuple[np.ndarray, int]:
+    """
+    IoU of every matched reference box and the number of reference boxes without a match of the same class.
+    margin: reference boxes with a confidence below conf + margin may be missing.
+    """
+    ious = []
+    missing = 0
+
+    for expected, actual in zip(reference, detections):
+        iou = sv.box_iou_batch(expected.xyxy, actual.xyxy)
+        iou[expected.class_id[:, None] != actual.class_id[None, :]] = 0
+        rows, columns = linear_sum_assignment(-iou)
+
+        matched = np.zeros(len(expected), dtype=bool)
+        matched[rows[iou[rows, columns] > 0]] = True
+        ious.append(iou[rows, columns][matched[rows]])
+
+        missing += np.sum(~matched & (expected.confidence >= margin))
+
+    return np.concatenate(ious) if ious else np.zeros(0), missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity of the ONNX Runtime and PyTorch detector backends.")
+
+    parser.add_argument("--video", type=str, required=True)
+    parser.add_argument("--model", type=str, default="models/best.pt")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--int8", action="store_true", help="Also check the INT8-quantized model (lower --min-iou expected)")
+    parser.add_argument("--conf", type=float, default=0.15)
+    parser.add_argument("--min-iou", type=float, default=0.95)
+
+    args = parser.parse_args()
+
+    frames = read_video(args.video, False)[0][:args.frames]
+
+    reference, reference_fps = detect(ultralytics.YOLO(args.model), frames, args.conf, args.batch_size)
+    print(f"pytorch: {reference_fps:.2f} frames/s, {sum(len(d) for d in reference)} boxes")
+
+    failed = False
+    for int8 in [False, True] if args.int8 else [False]:
+        name = "onnx int8" if int8 else "onnx"
+        detector = OnnxDetector(OnnxDetector.export(args.model, int8, verbose=False), args.threads)
+        detections, fps = detect(detector, frames, args.conf, args.batch_size)
+
+        ious, missing = compare(reference, detections, args.conf + 0.05)
+        min_iou = ious.min() if len(ious) else 1.0
+        print(f"{name}: {fps:.2f} frames/s, {sum(len(d) for d in detections)} boxes, min IoU {min_iou:.4f}, mean IoU {ious.mean() if len(ious) else 1.0:.4f}, {missing} missing")
+
+        if not int8 and (min_iou < args.min_iou or missing > 0):
+            failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,87 @@
+"""
+Tradeoff of keyframe detection (KeyframeDetector): inference calls, frames/s and agreement of the boxes with detecting every frame.
+Boxes of every frame are matched by IoU to the boxes of the full detection (same class), recall and precision are computed
+for the persons only, the ball is not propagated but interpolated.
+
+Run from the root of the project:
+python benchmarks/keyframe_benchmark.py --video demos/demo1.mp4 --frames 250 --strides 2 4 8
+"""
+from typing import List, Tuple
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import supervision as sv
+from scipy.optimize import linear_sum_assignment
+sys.path.append(os.path.abspath("."))
+from trackers import Tracker, KeyframeDetector
+from utils import read_video
+
+def detect(tracker: Tracker, frames: List[np.ndarray], window_size: int) -> Tuple[List[sv.Detections], float]:
+    """
+    Detections of the frames in windows like the streaming mode and frames/s.
+    """
+    tracker.detect_frames(frames[:tracker.batch_size])    # warm-up
+    tracker.frame_index = 0
+
+    detections = []
+    start_time = time.time()
+    for i in range(0, len(frames), window_size):
+        detections += tracker.detect(frames[i:i+window_size])
+
+    return detections, len(frames) / (time.time() - start_time)
+
+def compare(reference: List[sv.Detections], detections: List[sv.Detections], ball_id: int, min_iou: float) -> Tuple[float, float, float]:
+    """
+    Recall, precision and mean IoU of the matched boxes without the ball.
+    """
+    num_matched, num_expected, num_actual = 0, 0, 0
+    ious = []
+
+    for expected, actual in zip(reference, detections):
+        expected = expected[expected.class_id != ball_id]
+        actual = actual[actual.class_id != ball_id]
+
+        iou = sv.box_iou_batch(expected.xyxy, actual.xyxy)
+        iou[expected.class_id[:, None] != actual.class_id[None, :]] = 0
+        rows, columns = linear_sum_assignment(-iou)
+        matched = iou[rows, columns] >= min_iou
+
+        num_matched += matched.sum()
+        num_expected += len(expected)
+        num_actual += len(actual)
+        ious.append(iou[rows, columns][matched])
+
+    ious = np.concatenate(ious) if ious else np.zeros(0)
+
+    return num_matched / max(num_expected, 1), num_matched / max(num_actual, 1), ious.mean() if len(ious) else 1.0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inference calls and accuracy of keyframe detection compared to detecting every frame.")
+
+    parser.add_argument("--video", type=str, required=True)
+    parser.add_argument("--model", type=str, default="models/best.pt")
+    parser.add_argument("--frames", type=int, default=250)
+    parser.add_argument("--window-size", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--strides", nargs="+", type=int, default=[2, 4, 8])
+    parser.add_argument("--min-iou", type=float, default=0.5)
+
+    args = parser.parse_args()
+
+    frames = read_video(args.video, False)[0][:args.frames]
+
+    tracker = Tracker(args.model, [], verbose=False, batch_size=args.batch_size)
+    reference, reference_fps = detect(tracker, frames, args.window_size)
+    ball_id = {v: k for k, v in tracker.cls_names.items()}["ball"]
+    print(f"every frame: {len(frames)} inference frames, {reference_fps:.2f} frames/s")
+
+    for stride in args.strides:
+        keyframes = KeyframeDetector(stride)
+        tracker = Tracker(args.model, [], verbose=False, batch_size=args.batch_size, keyframes=keyframes)
+        detections, fps = detect(tracker, frames, args.window_size)
+
+        recall, precision, mean_iou = compare(reference, detections, ball_id, args.min_iou)
+        print(f"stride {stride}: {keyframes.num_keyframes} inference frames ({keyframes.num_forced} forced, {len(frames) / max(keyframes.num_keyframes, 1):.2f}x fewer), "
+              f"{fps:.2f} frames/s, recall {recall:.3f}, precision {precision:.3f}, mean IoU {mean_iou:.3f}")
@@ -0,0 +1,191 @@
+"""
+End-to-end benchmark of the stages of process_video on synthetic footage (see synthetic_footage.py) at several resolutions and clip lengths:
+frames/s of every stage, wall time and peak memory, compared with a stored baseline.
+Every configuration runs repeats times in fresh processes (the fastest run of every stage counts), the stub detector replaces the model unless --model is given.
+
+Stages (metrics names): decode (read_video), inference (model calls), detect (detection incl. pre- and postprocessing), track (ByteTrack of get_object_tracks),
+camera_movement (get_camera_movement), team_assignment (TeamAssigner.get_teams), possession (PlayerBallAssigner.get_player_and_possession),
+annotate (drawing of the overlays), encode (save_video).
+
+The baseline stores frames/s and seconds per stage, frames/s and peak memory per configuration and the machine, detector and encoder
+it was measured with. The comparison is refused on another machine or with another detector or encoder (see the machine of the baseline,
+e.g. --encoder ffmpeg), record a baseline for the machine instead.
+
+Run from the root of the project:
+python benchmarks/pipeline_benchmark.py --baseline benchmarks/baseline.json --encoder ffmpeg
+python benchmarks/pipeline_benchmark.py --save-baseline benchmarks/baseline.json --encoder ffmpeg     # after an intended change of the performance
+"""
+from typing import Dict, List, Tuple
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.abspath("."))
+
+CLASSES = [0, 1, 2, 3, 4]
+MIN_SECONDS = 0.05      # shorter stages are dominated by noise, not compared
+
+def run_config(width: int, height: int, num_frames: int, model_path: str, batch_size: int, encoder: str) -> Dict:
+    """
+    Processes the synthetic clip like process_video (whole video in memory) and returns the metrics summary of the run.
+    """
+    from utils import read_video, save_video, metrics, OverlayRenderer
+    from trackers import Tracker, register_model
+    from team_assignment import TeamAssigner
+    from player_ball_assignment import PlayerBallAssigner
+    from camera_movement import CameraMovementEstimator
+    from benchmarks.synthetic_footage import get_clip, StubDetector
+
+    path = get_clip(width, height, num_frames)
+    if model_path is None:
+        model_path = "stub"
+        register_model(model_path, StubDetector())
+
+    metrics.reset()
+
+    frames, fps, _, _ = read_video(path, False)
+
+    tracker = Tracker(model_path, CLASSES, False, batch_size=batch_size)
+    tracks = tracker.get_object_tracks(frames)
+    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+    tracker.add_position_to_tracks(tracks)
+
+    camera_movement_estimator = CameraMovementEstimator(frames[0], CLASSES, False)
+    camera_movement_per_frame = camera_movement_estimator.get_camera_movement(frames)
+    camera_movement_estimator.adjust_positions_to_tracks(tracks, camera_movement_per_frame)
+
+    TeamAssigner().get_teams(frames, tracks)
+
+    player_assigner = PlayerBallAssigner()
+    player_assigner.get_player_and_possession(tracks)
+
+    output = OverlayRenderer(in_place=True).render(frames, [tracker.annotation_layer(tracks, player_assigner.possession_counts),
+                                                            camera_movement_estimator.camera_movement_layer(camera_movement_per_frame)])
+    with tempfile.TemporaryDirectory() as directory:
+        save_video(output, os.path.join(directory, "output.mp4"), fps, False, encoder)
+
+    summary = metrics.summary()
+    summary["num_frames"] = len(frames)
+    summary["fps"] = round(len(frames) / summary["wall_time"], 2)
+
+    return summary
+
+def best_of(runs: List[Dict]) -> Dict:
+    """
+    Fastest result of every stage and of the whole run over the repeats, less sensitive to noise of other processes.
+    """
+    best = dict(max(runs, key=lambda run: run["fps"]))
+    best["peak_rss_mb"] = min(run["peak_rss_mb"] for run in runs)
+    best["stages"] = {stage: max((run["stages"][stage] for run in runs if stage in run["stages"]), key=lambda stats: stats["fps"])
+                      for stage in runs[0]["stages"]}
+
+    return best
+
+def baseline_summary(results: Dict) -> Dict:
+    """
+    Numbers of the results that compare() uses, without the latency histograms.
+    """
+    return {config: {"fps": result["fps"], "peak_rss_mb": result["peak_rss_mb"],
+                     "stages": {stage: {"fps": stats["fps"], "seconds": stats["seconds"]} for stage, stats in result["stages"].items()}}
+            for config, result in results.items()}
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Regressions: a stage (or the whole run) is slower than tolerance times its baseline frames/s, or the peak memory grew by more than tolerance.
+    Stages that took less than MIN_SECONDS in the baseline are skipped.
+    """
+    regressions = []
+
+    for config, result in results.items():
+        if config not in baseline:
+            continue
+        expected = baseline[config]
+
+        if result["fps"] < expected["fps"] * (1 - tolerance):
+            regressions.append(f"{config} total: {result['fps']:.2f} frames/s, baseline {expected['fps']:.2f}")
+        if result["peak_rss_mb"] > expected["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{config} peak memory: {result['peak_rss_mb']:.0f} MB, baseline {expected['peak_rss_mb']:.0f} MB")
+
+        for stage, stats in result["stages"].items():
+            expected_stats = expected["stages"].get(stage)
+            if expected_stats is None or expected_stats["seconds"] < MIN_SECONDS:
+                continue
+            if stats["fps"] < expected_stats["fps"] * (1 - tolerance):
+                regressions.append(f"{config} {stage}: {stats['fps']:.2f} frames/s, baseline {expected_stats['fps']:.2f}")
+
+    return regressions
+
+def print_table(results: Dict) -> None:
+    stages = list(dict.fromkeys(stage for result in results.values() for stage in result["stages"]))
+    print(f"{'config':<16}{'total':>10}{'memory':>10}" + "".join(f"{stage:>17}" for stage in stages))
+    print(f"{'':<16}{'frames/s':>10}{'MB':>10}" + "".join(f"{'frames/s':>17}" for _ in stages))
+
+    for config, result in results.items():
+        row = f"{config:<16}{result['fps']:>10.2f}{result['peak_rss_mb']:>10.0f}"
+        row += "".join(f"{result['stages'][stage]['fps']:>17.2f}" if stage in result["stages"] else f"{'-':>17}" for stage in stages)
+        print(row)
+
+def parse_resolution(resolution: str) -> Tuple[int, int]:
+    width, height = resolution.split("x")
+    return int(width), int(height)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage frames/s and memory of the pipeline on synthetic footage, compared with a baseline.")
+
+    parser.add_argument("--resolutions", nargs="+", type=str, default=["640x360", "1280x720", "1920x1080"])
+    parser.add_argument("--frames", nargs="+", type=int, default=[50, 150], help="Clip lengths")
+    parser.add_argument("--model", type=str, help="Model instead of the stub detector, e.g. models/best.pt")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per configuration, the fastest counts")
+    parser.add_argument("--encoder", choices=["opencv", "ffmpeg", "pyav"], default="opencv", help="Encoder of save_video")
+    parser.add_argument("--baseline", type=str, help="Baseline to compare with, exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown (and memory growth) relative to the baseline")
+    parser.add_argument("--save-baseline", type=str, help="Save the results as the new baseline")
+    parser.add_argument("--output", type=str, help="Save the results as JSON")
+
+    args = parser.parse_args()
+
+    results = {}
+    for resolution in args.resolutions:
+        width, height = parse_resolution(resolution)
+        for num_frames in args.frames:
+            runs = []
+            for _ in range(args.repeats):
+                # fresh process: peak memory of this configuration only, and the imports are not shared
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    runs.append(executor.submit(run_config, width, height, num_frames, args.model, args.batch_size, args.encoder).result())
+            results[f"{resolution}x{num_frames}"] = best_of(runs)
+
+    print_table(results)
+
+    machine = {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(), "detector": args.model or "stub", "encoder": args.encoder}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"machine": machine, "results": results}, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"machine": machine, "results": baseline_summary(results)}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        if baseline["machine"] != machine:
+            # frames/s of another machine or encoder say nothing about a regression
+            differences = ", ".join(f"{key} {baseline['machine'].get(key)} (now {value})" for key, value in machine.items() 
+                                    if baseline["machine"].get(key) != value)
+            print(f"Not compared, the baseline was measured with {differences}. Record a baseline on this machine with --save-baseline.")
+            sys.exit(2)
+
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions (tolerance {args.tolerance:.0%}).")
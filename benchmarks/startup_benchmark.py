@@ -0,0 +1,59 @@
+"""
+Startup latency: import of main and main.py --help in fresh processes, and the first (cold) and second (warm) process_video call
+on a short part of a video in this process. The second call reuses the loaded model (load_model) and the imported modules.
+
+Run from the root of the project:
+python benchmarks/startup_benchmark.py --video demos/demo1.mp4 --duration 2
+"""
+from typing import List
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+sys.path.append(os.path.abspath("."))
+
+def run_fresh(command: List[str], repeats: int) -> float:
+    """
+    Median wall time of the command in a new process.
+    """
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start_time)
+
+    return statistics.median(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold and warm startup latency of the analysis.")
+
+    parser.add_argument("--video", type=str, required=True)
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds of the video to process")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--repeats", type=int, default=5)
+
+    args = parser.parse_args()
+
+    interpreter = run_fresh([sys.executable, "-c", "pass"], args.repeats)
+    import_main = run_fresh([sys.executable, "-c", "import main"], args.repeats)
+    help = run_fresh([sys.executable, "main.py", "--help"], args.repeats)
+    print(f"interpreter: {interpreter:.3f} s, import main: {import_main:.3f} s, main.py --help: {help:.3f} s (median of {args.repeats} fresh processes)")
+
+    start_time = time.perf_counter()
+    from main import process_video
+    print(f"import in this process: {time.perf_counter() - start_time:.3f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.mp4")
+
+        times = []
+        for _ in range(2):
+            start_time = time.perf_counter()
+            process_video(args.video, [0, 1, 2, 3, 4], False, use_cache=False, backend=args.backend, time_range=(None, args.duration),
+                          output_path=output_path)
+            times.append(time.perf_counter() - start_time)
+
+    print(f"process_video on {args.duration} s: cold {times[0]:.2f} s, warm {times[1]:.2f} s, startup overhead {times[0] - times[1]:.2f} s")
@@ -0,0 +1,182 @@
+"""
+Deterministic synthetic football footage for the benchmarks, generated offline without the demo videos:
+a striped and textured green pitch with lines, 2 teams of coloured player blobs with goalkeepers and referees,
+a small ball passed between the players and a simulated camera pan.
+StubDetector finds the objects by their colours, so the whole pipeline runs without model weights.
+
+Write a clip:
+python benchmarks/synthetic_footage.py --output cache/benchmarks/clip.mp4 --width 1280 --height 720 --frames 250
+"""
+from typing import List
+import os
+import argparse
+import numpy as np
+import cv2
+
+# BGR colours of the objects, the detection ranges of the stub detector leave room for compression artifacts
+TEAM_COLOURS = [(30, 30, 220), (220, 90, 30)]     # red, blue
+GOALKEEPER_COLOUR = (30, 150, 250)                 # orange
+REFEREE_COLOUR = (30, 220, 220)                    # yellow
+SHORTS_COLOUR = (20, 20, 20)
+BALL_COLOUR = (255, 255, 255)
+LINE_COLOUR = (190, 200, 190)                      # darker than the ball
+
+# class IDs of data.yaml: ball: 0, goalkeeper: 1, player: 2, referee: 3
+NAMES = {0: "ball", 1: "goalkeeper", 2: "player", 3: "referee"}
+COLOUR_RANGES = [
+    (2, (0, 0, 170), (80, 90, 255)),         # red shirts
+    (2, (170, 40, 0), (255, 140, 80)),       # blue shirts
+    (1, (0, 110, 200), (80, 190, 255)),      # orange shirts
+    (3, (0, 180, 180), (80, 255, 255)),      # yellow shirts
+    (0, (230, 230, 230), (255, 255, 255))    # ball
+]
+
+def make_pitch(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Pitch of 1.5 times the frame width: mowing stripes, grass texture (features for the camera movement) and lines.
+    """
+    pitch_width = int(width * 1.5)
+    pitch = np.zeros((height, pitch_width, 3), dtype=np.uint8)
+
+    stripe_width = max(pitch_width // 12, 1)
+    stripes = (np.arange(pitch_width) // stripe_width) % 2
+    pitch[:, :, 1] = np.where(stripes, 150, 130)[None, :]
+    pitch[:, :, 0] = 40
+    pitch[:, :, 2] = 45
+
+    texture = rng.integers(-18, 18, size=(height, pitch_width), dtype=np.int16)
+    texture = cv2.GaussianBlur(texture.astype(np.float32), (0, 0), max(height / 720, 0.5))
+    pitch[:, :, 1] = np.clip(pitch[:, :, 1] + texture, 0, 255).astype(np.uint8)
+
+    thickness = max(height // 240, 1)
+    cv2.line(pitch, (pitch_width // 2, 0), (pitch_width // 2, height), LINE_COLOUR, thickness)
+    cv2.circle(pitch, (pitch_width // 2, height // 2), height // 6, LINE_COLOUR, thickness)
+    cv2.rectangle(pitch, (thickness, height // 4), (pitch_width // 10, height * 3 // 4), LINE_COLOUR, thickness)
+    cv2.rectangle(pitch, (pitch_width - pitch_width // 10, height // 4), (pitch_width - thickness, height * 3 // 4), LINE_COLOUR, thickness)
+
+    return pitch
+
+class SyntheticMatch:
+    """
+    Positions of the players, referees and the ball in pitch coordinates for every frame and the camera offset.
+    Same seed, size and number of frames give the same footage.
+    """
+    def __init__(self, width: int=1920, height: int=1080, num_frames: int=250, seed: int=0) -> None:
+        self.width = width
+        self.height = height
+        self.num_frames = num_frames
+        self.scale = height / 1080      # sizes are laid out for full HD
+
+        rng = np.random.default_rng(seed)
+        self.pitch = make_pitch(width, height, rng)
+        pitch_width = self.pitch.shape[1]
+
+        # 2 teams of 10 players and a goalkeeper, 1 referee
+        self.colours = [TEAM_COLOURS[i // 10] for i in range(20)] + [GOALKEEPER_COLOUR, GOALKEEPER_COLOUR, REFEREE_COLOUR]
+        num_objects = len(self.colours)
+        self.size = np.array([40, 90]) * self.scale
+
+        # smooth random walks inside the pitch, reflected at the borders
+        start = rng.uniform([0.05, 0.2], [0.95, 0.85], size=(num_objects, 2)) * [pitch_width, height]
+        start[20] = [pitch_width * 0.04, height * 0.5]      # goalkeepers in front of the goals
+        start[21] = [pitch_width * 0.94, height * 0.5]
+        velocity = np.cumsum(rng.normal(0, 0.3, size=(num_frames, num_objects, 2)), axis=0) * self.scale
+        velocity = np.clip(velocity, -6 * self.scale, 6 * self.scale)
+        velocity[:, 20:22] *= 0.2
+        low, high = np.zeros(2), np.array([pitch_width, height]) - self.size
+        self.positions = self._reflect(start + np.cumsum(velocity, axis=0), low, high)     # top left corners, (num_frames, num_objects, 2)
+
+        # camera follows the action with a slow pan
+        t = np.arange(num_frames)
+        self.camera_x = ((pitch_width - width) / 2 * (1 + np.sin(2 * np.pi * t / 300))).astype(int)
+
+        # ball at the feet of one player, passed to another one every 40 frames and invisible in some frames (occlusions)
+        holders = rng.integers(0, 20, size=num_frames // 40 + 1)
+        self.ball_holder = holders[t // 40]
+        self.ball_visible = rng.random(num_frames) > 0.1
+
+    @staticmethod
+    def _reflect(positions: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        span = high - low
+        positions = np.mod(positions - low, 2 * span)
+        return low + np.where(positions > span, 2 * span - positions, positions)
+
+    def frame(self, frame_num: int) -> np.ndarray:
+        x = self.camera_x[frame_num]
+        frame = self.pitch[:, x:x+self.width].copy()
+        width, height = self.size.astype(int)
+
+        for i, (px, py) in enumerate(self.positions[frame_num]):
+            px, py = int(px) - x, int(py)
+            if px + width < 0 or px >= self.width:
+                continue
+            cv2.rectangle(frame, (px, py), (px + width, py + height * 5 // 9), self.colours[i], -1)
+            cv2.rectangle(frame, (px, py + height * 5 // 9), (px + width, py + height), SHORTS_COLOUR, -1)
+
+        if self.ball_visible[frame_num]:
+            px, py = self.positions[frame_num, self.ball_holder[frame_num]]
+            cv2.circle(frame, (int(px + width * 1.2) - x, int(py + height * 1.05)), max(int(6 * self.scale), 2), BALL_COLOUR, -1)
+
+        return frame
+
+    def write(self, path: str, fps: int=25) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (self.width, self.height))
+        for frame_num in range(self.num_frames):
+            out.write(self.frame(frame_num))
+        out.release()
+
+def get_clip(width: int, height: int, num_frames: int, directory: str="cache/benchmarks", seed: int=0) -> str:
+    """
+    Path of the synthetic clip, written on the first call.
+    """
+    path = os.path.join(directory, f"synthetic_{width}x{height}_{num_frames}_{seed}.mp4")
+    if not os.path.isfile(path):
+        SyntheticMatch(width, height, num_frames, seed).write(path)
+
+    return path
+
+class StubDetector:
+    """
+    Detector with the predict() interface of ultralytics.YOLO for the benchmarks without model weights:
+    finds the shirts and the ball of SyntheticMatch by their colours (the players' boxes include the shorts).
+    """
+    def __init__(self) -> None:
+        self.names = NAMES
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        boxes = []
+        min_area = 20 * (frame.shape[0] / 1080) ** 2
+
+        for class_id, low, high in COLOUR_RANGES:
+            mask = cv2.inRange(frame, low, high)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for contour in contours:
+                x, y, w, h = cv2.boundingRect(contour)
+                if w * h < min_area:
+                    continue
+                if class_id != 0:
+                    h = h * 9 // 5      # shirt --> whole player
+                boxes.append([x, y, x + w, y + h, 0.9, class_id])
+
+        return np.array(boxes, dtype=np.float32).reshape(-1, 6)
+
+    def predict(self, source: List[np.ndarray], conf: float=0.25, **kwargs) -> List:
+        import torch
+        from ultralytics.engine.results import Results
+
+        frames = source if isinstance(source, list) else [source]
+        return [Results(orig_img=frame, path="", names=self.names, boxes=torch.from_numpy(self.detect(frame))) for frame in frames]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a deterministic synthetic football clip.")
+
+    parser.add_argument("--output", type=str, required=True)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    SyntheticMatch(args.width, args.height, args.frames, args.seed).write(args.output)
@@ -1,10 +1,11 @@
-from typing import List, Dict
+from typing import List, Tuple
 import cv2
 import numpy as np
 import time
 from datetime import datetime
 import logging
-from utils import get_distance, options
+from utils import options, transparent_box, OverlayRenderer, Layer, metrics
+from trackers import TrackStore
 
 file_handler = logging.FileHandler("logs/camera_movement.log")
 file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
@@ -17,8 +18,18 @@ logger.addHandler(file_handler)
 logger.addHandler(stream_handler)
 
 class CameraMovementEstimator():
-    def __init__(self, frame: np.ndarray, classes: List[int], verbose: bool=True) -> None:
+    """
+    Estimates the camera movement per frame with Lucas Kanade optical flow of corner features.
+    scale: factor to downscale the grayscale frames for feature detection and optical flow, movements are returned in pixels of the original frames.
+    estimator: "max" takes the displacement of the feature that moved the most, "median" the median displacement of the tracked features (robust against single outliers).
+    """
+    def __init__(self, frame: np.ndarray, classes: List[int], verbose: bool=True, scale: float=0.5, estimator: str="max") -> None:
+        if estimator not in ("max", "median"):
+            raise ValueError(f"Unknown estimator '{estimator}', valid options are: max, median.")
+
         self.minimum_distance = 5       # minimum the camera needs to move
+        self.scale = scale
+        self.estimator = estimator
 
         # lucas kanade optical flow
         self.lk_params = dict(
@@ -32,11 +43,13 @@ class CameraMovementEstimator():
         mask_features = np.zeros_like(first_frame_grayscale)
         mask_features[:, 0:20] = 1
         mask_features[:, frame.shape[0]-150:frame.shape[0]] = 1 
+        # same area in the downscaled frames
+        mask_features = cv2.resize(mask_features, self.get_grayscale(frame).shape[::-1], interpolation=cv2.INTER_NEAREST)
 
         self.features = dict(
             maxCorners = 100,       # maximum number of corners (features) to be detected
             qualityLevel = 0.3,     # only corners above this level
-            minDistance = 10,       # ensures that corners are not too close to each other --> better distribution of the corners
+            minDistance = max(1, int(10 * scale)),     # ensures that corners are not too close to each other --> better distribution of the corners
             blockSize = 7,          # window size for corner detection
             mask = mask_features    # area of the image
         )
@@ -44,50 +57,85 @@ class CameraMovementEstimator():
         self.classes = classes
         self.verbose = verbose
 
-    def adjust_positions_to_tracks(self, tracks: Dict[str, List[Dict]], camera_movement_per_frame: List[List[float]]) -> None:
-        for object, object_tracks in tracks.items():
-            for frame_num, track_dict in enumerate(object_tracks):
-                for tracker_id, track in track_dict.items():
-                    position = track["position"]
-                    camera_movement = camera_movement_per_frame[frame_num]
-                    position_adjusted = (position[0] - camera_movement[0], position[1] - camera_movement[1])    # x - camera_x, y - camera_y
-                    
-                    tracks[object][frame_num][tracker_id]["position_adjusted"] = position_adjusted
-
-    def get_camera_movement(self, frames: List[np.ndarray]) -> List[List[float]]:
+        # last grayscale frame and its features, to continue the estimation in the next call (streaming)
+        self.old_gray = None
+        self.old_features = None
+
+    def get_grayscale(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Downscaled grayscale frame, input of the feature detection and optical flow.
+        """
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if self.scale != 1:
+            frame_gray = cv2.resize(frame_gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        return frame_gray
+
+    def estimate_movement(self, displacements: np.ndarray, tracked: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Camera movement (x, y) and its distance from the displacements of all features.
+        tracked: features that optical flow found in the new frame.
+        """
+        if self.estimator == "median":
+            if not tracked.any():
+                return np.zeros(2, dtype=np.float32), 0.0
+            movement = np.median(displacements[tracked], axis=0)
+            return movement, float(np.hypot(*movement))
+
+        distances = np.hypot(displacements[:, 0], displacements[:, 1])    # eucledian distances of all features at once
+        i = np.argmax(distances)
+
+        return displacements[i], float(distances[i])
+
+    def adjust_positions_to_tracks(self, tracks: TrackStore, camera_movement_per_frame: np.ndarray) -> None:
+        camera_movement_per_frame = np.asarray(camera_movement_per_frame, dtype=np.float32).reshape(-1, 2)
+
+        for _, object_tracks in tracks.items():
+            camera_movement = camera_movement_per_frame[object_tracks.frame]   # camera movement of the frame of every row
+            object_tracks.position_adjusted = object_tracks.position - camera_movement     # x - camera_x, y - camera_y
+
+    @metrics.timed("camera_movement", lambda self, frames, *args, **kwargs: len(frames))
+    def get_camera_movement(self, frames: List[np.ndarray], resume: bool=False) -> np.ndarray:
+        """
+        Camera movement (x, y) per frame.
+        resume: continue from the last frame of the previous call instead of starting with zero movement (streaming).
+        """
         start_time = time.time()
 
         if self.verbose:
             logger.info(f"Starting camera movement detection at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-        camera_movement = [[0, 0]] * len(frames) # x, y
-
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)  # convert image to gray
-        old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)   # ** to expand dictionary into the parameters
+        camera_movement = np.zeros((len(frames), 2), dtype=np.float32) # x, y
 
-        for frame_num in range(1, len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            new_features, _, _ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **self.lk_params)
+        if resume and self.old_gray is not None:
+            old_gray, old_features = self.old_gray, self.old_features
+            first_frame = 0
+        else:
+            old_gray = self.get_grayscale(frames[0])
+            old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)   # ** to expand dictionary into the parameters
+            first_frame = 1
 
-            max_distance = 0
-            camera_movement_x, camera_movement_y = 0, 0
+        for frame_num in range(first_frame, len(frames)):
+            frame_gray = self.get_grayscale(frames[frame_num])
 
-            for i, (new, old) in enumerate(zip(new_features, old_features)):
-                new_features_point = new.ravel()
-                old_features_point = old.ravel()
+            if old_features is None:    # no corners found, e.g. uniform frame
+                old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+                old_gray = frame_gray
+                continue
 
-                distance = get_distance(new_features_point, old_features_point)
+            new_features, status, _ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **self.lk_params)
 
-                if distance > max_distance:
-                    max_distance = distance
-                    camera_movement_x = new_features_point[0] - old_features_point[0]
-                    camera_movement_y = new_features_point[1] - old_features_point[1]
+            displacements = (new_features - old_features).reshape(-1, 2) / self.scale     # in pixels of the original frame
+            movement, distance = self.estimate_movement(displacements, status.ravel() == 1)
 
-            if max_distance > self.minimum_distance:
-                camera_movement[frame_num] = [camera_movement_x, camera_movement_y]
+            if distance > self.minimum_distance:
+                camera_movement[frame_num] = movement
                 old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
 
-            old_gray = frame_gray.copy()
+            old_gray = frame_gray
+
+        self.old_gray, self.old_features = old_gray, old_features
 
         if self.verbose:
             logger.info(f"Processed camera movement in {len(frames)} frames in {time.time() - start_time:.2f} seconds.")
@@ -97,26 +145,26 @@ class CameraMovementEstimator():
 
         return camera_movement
     
-    def draw_camera_movement(self, frames: List[np.ndarray], camera_movement_per_frame: List[List[float]]) -> List[np.ndarray]:
-        output_frames = []
-
-        if options["stats"] in self.classes:
-            for frame_num, frame in enumerate(frames):
-                frame = frame.copy()
-
-                overlay = frame.copy()
-
-                cv2.rectangle(overlay, pt1=(0, 0), pt2=(500, 100), color=(255, 255, 255), thickness=cv2.FILLED)
-                alpha = 0.4
-                cv2.addWeighted(src1=overlay, alpha=alpha, src2=frame, beta=1-alpha, gamma=0, dst=frame) 
-
-                x_movement, y_movement = camera_movement_per_frame[frame_num]
+    def draw_camera_movement(self, frames: List[np.ndarray], camera_movement_per_frame: np.ndarray) -> List[np.ndarray]:
+        """
+        Annotated copies of the frames, see camera_movement_layer() to draw into the frames with the other overlays in one pass (OverlayRenderer).
+        """
+        layer = self.camera_movement_layer(camera_movement_per_frame)
+        return list(OverlayRenderer(in_place=True).render([frame.copy() for frame in frames], [layer]))
+
+    def camera_movement_layer(self, camera_movement_per_frame: np.ndarray) -> Layer:
+        """
+        Draws the camera movement of a frame in place, None if the stats are not shown.
+        """
+        if options["stats"] not in self.classes:
+            return None
+
+        def draw(frame: np.ndarray, frame_num: int) -> None:
+            transparent_box(frame, (0, 0), (500, 100), (255, 255, 255))
+
+            x_movement, y_movement = camera_movement_per_frame[frame_num]
     
-                frame = cv2.putText(frame, text=f"Camera Movement X: {x_movement:.2f}", org=(10, 30), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(0, 0, 0), thickness=3)
-                frame = cv2.putText(frame, text=f"Camera Movement Y: {y_movement:.2f}", org=(10, 60), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(0, 0, 0), thickness=3)
-
-                output_frames.append(frame)
-        else:
-            output_frames = frames.copy()
+            cv2.putText(frame, text=f"Camera Movement X: {x_movement:.2f}", org=(10, 30), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(0, 0, 0), thickness=3)
+            cv2.putText(frame, text=f"Camera Movement Y: {y_movement:.2f}", org=(10, 60), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(0, 0, 0), thickness=3)
 
-        return output_frames
\ No newline at end of file
+        return draw
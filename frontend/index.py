@@ -1,12 +1,27 @@
 import streamlit as st
 import time
+import json
 import os
 import sys
 sys.path.append(os.path.abspath("."))
-from main import process_video
+from pipeline import JobQueue, WorkerPool
+from utils import NESTED_STAGES
+
+NUM_WORKERS = int(os.environ.get("MATCHVISION_WORKERS", 2))     # videos processed at the same time
 
 st.set_page_config(page_title="Football Analysis")
 
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    # one queue and worker pool for all sessions of the server, the workers keep the model loaded
+    queue = JobQueue("output/jobs/jobs.db")
+    WorkerPool(queue, NUM_WORKERS).start()
+    return queue
+
+job_queue = get_job_queue()
+if "jobs" not in st.session_state:
+    st.session_state.jobs = []      # job IDs of this session, newest first
+
 # menu
 st.sidebar.title("Settings")
 
@@ -37,7 +52,6 @@ st.sidebar.write("Choose from 2 demo videos.")
 uploaded_video = None
 demo_video = None
 start_analysis = None
-processed = False
 
 demo = st.sidebar.toggle("Demo", value=False)
 
@@ -51,22 +65,12 @@ if demo:
 
     #preview demo video
     st.sidebar.video(demo_video)
-    
-    if demo_video:
-        with open(demo_video, "rb") as f:
-            demo_video_bytes = f.read()
 
     start_analysis = st.sidebar.button("Start Analysis", key="demo")
 
     if start_analysis:
-        with st.spinner("Processing ..."):
-            process_video(demo_video_bytes, classes)
-            processed = True
-        placeholder = st.empty()
-        with placeholder.container():
-            st.success("Video processing complete.")
-            time.sleep(3)
-        placeholder.empty()
+        st.session_state.jobs.insert(0, job_queue.submit(demo_video, classes))
+        st.sidebar.success("Video queued, see the tab **Results**.")
 
 st.sidebar.write("\n")
 
@@ -80,14 +84,8 @@ if uploaded_video:
     start_analysis = st.sidebar.button("Start Analysis", key="upload")
 
     if start_analysis:
-        with st.spinner("Processing ..."):
-            process_video(uploaded_video.read(), classes) 
-            processed = True
-        placeholder = st.empty()
-        with placeholder.container():
-            st.success("Video processing complete.")
-            time.sleep(1)
-        placeholder.empty()
+        st.session_state.jobs.insert(0, job_queue.submit(uploaded_video.getvalue(), classes))
+        st.sidebar.success("Video queued, see the tab **Results**.")
 
 # main page
 st.title("MatchVision - automated analysis")
@@ -101,23 +99,71 @@ with tab1:
     1. Select the desired output options.
     2. Upload a video or select a demo video. 
     3. Click on **Start Analysis**.
-    4. Go to the tab **Results** to see the output video.
+    4. Go to the tab **Results** to follow the progress and see the output video, several videos can be queued.
                 
     For best results, the video should not contain multiple camera perspectives.
     """)
 
+jobs = [job_queue.status(job_id) for job_id in st.session_state.jobs]
+
 with tab2:
-    if processed:
-        st.video("output/output.mp4")
+    for job in jobs:
+        st.write(f"**{os.path.basename(job['input_path'])}** ({job['id']})")
+
+        if job["status"] == "queued":
+            st.progress(0.0, text=f"Queued, {job['queue_position']} videos ahead")
+        elif job["status"] == "running":
+            st.progress(min(job["progress"], 1.0), text=f"Processing {job['num_frames']} frames ...")
+        elif job["status"] == "failed":
+            st.error(f"Processing failed: {job['error']}")
+        else:
+            st.success(f"Video processing complete in {job['finished'] - job['started']:.1f} seconds.")
+            st.video(job_queue.result(job["id"]))
 
 with tab3:
-    log_files_list = ["logs/tracking.log", "logs/camera_movement.log", "logs/memory_access.log"]
-
-    selected_log_file = st.selectbox("Select Log File", log_files_list)
-
+    # time and throughput of every stage of the last finished video
+    finished_jobs = [job for job in jobs if job["status"] == "done"]
     try:
-        with open(selected_log_file, "r") as log_file:
-            log_contents = log_file.read()
-        st.text_area("Logs", log_contents, height=450)
+        if not finished_jobs:
+            raise FileNotFoundError
+        with open(finished_jobs[0]["metrics_path"], "r") as metrics_file:
+            summary = json.load(metrics_file)
+
+        col1, col2 = st.columns(2)
+        col1.metric("Wall Time", f"{summary['wall_time']:.1f} s")
+        col2.metric("Peak Memory", f"{summary['peak_rss_mb']:.0f} MB")
+
+        stages = summary["stages"]
+        # nested stages (e.g. inference in detect) would be counted twice
+        total_seconds = sum(stage["seconds"] for name, stage in stages.items() if name not in NESTED_STAGES) or 1
+        labels = [f"{name} (in {NESTED_STAGES[name]})" if name in NESTED_STAGES else name for name in stages]
+        st.dataframe({
+            "stage": labels,
+            "calls": [stage["calls"] for stage in stages.values()],
+            "frames": [stage["frames"] for stage in stages.values()],
+            "seconds": [stage["seconds"] for stage in stages.values()],
+            "frames/s": [stage["fps"] for stage in stages.values()],
+            "share": [f"{stage['seconds'] / total_seconds:.1%}" for stage in stages.values()],
+            "p50 (s)": [stage["latency_p50"] for stage in stages.values()],
+            "p95 (s)": [stage["latency_p95"] for stage in stages.values()]
+        }, hide_index=True)
+        st.bar_chart({"seconds": {label: stage["seconds"] for label, stage in zip(labels, stages.values())}})
     except FileNotFoundError:
-        st.error(f"Log file '{selected_log_file}' not found.")
\ No newline at end of file
+        st.info("Stage metrics are shown after the first analysis.")
+
+    with st.expander("Log Files"):
+        log_files_list = ["logs/tracking.log", "logs/camera_movement.log", "logs/memory_access.log"]
+
+        selected_log_file = st.selectbox("Select Log File", log_files_list)
+
+        try:
+            with open(selected_log_file, "r") as log_file:
+                log_contents = log_file.read()
+            st.text_area("Logs", log_contents, height=450)
+        except FileNotFoundError:
+            st.error(f"Log file '{selected_log_file}' not found.")
+
+# follow the progress of the queued and running videos
+if any(job["status"] in ("queued", "running") for job in jobs):
+    time.sleep(1)
+    st.rerun()
@@ -1,36 +1,158 @@
-from typing import Union, List
+from typing import Dict, Union, List, Tuple
 import os
 import argparse
+import cProfile
 import warnings
-from utils import read_video, save_video, options
-from trackers import Tracker
-from team_assignment import TeamAssigner
+from utils import read_video, save_video, options, OverlayRenderer, FrameStore, metrics
+from team_assignment import TeamAssigner, TeamModel
 from player_ball_assignment import PlayerBallAssigner
 from camera_movement import CameraMovementEstimator
 
-def process_video(data: Union[str, bytes], classes: List[int], verbose: bool=True) -> None:
-    frames, fps, _, _ = read_video(data, verbose)
+def process_video(data: Union[str, bytes, int], classes: List[int], verbose: bool=True, window_size: int=None, pipelined: bool=False, use_cache: bool=True, 
+                  team_update_interval: int=None, team_model_path: str=None, stats_path: str=None, 
+                  batch_size: int=20, imgsz: int=None, autotune: bool=False, memory_budget_mb: int=None, 
+                  backend: str="torch", int8: bool=False, threads: int=None, shards: int=None, overlap: int=25, 
+                  live: bool=False, max_latency: float=1.0, realtime: bool=False, ball_method: str="linear", ball_max_gap: int=None, 
+                  ball_roi_size: int=None, keyframe_stride: int=None, camera_estimator: str="max", encoder: str="opencv", encoder_options: Dict=None, 
+                  time_range: Tuple[float, float]=None, stride: int=1, scale: float=None, analysis_path: str=None, 
+                  metrics_path: str=None, output_path: str="output/output.mp4", frame_store_dir: str=None) -> None:
+    """
+    window_size: process the video as a stream of windows with this number of frames instead of loading the whole video into memory.
+    pipelined: run decoding, detection, tracking/annotation and encoding of the windows concurrently.
+    use_cache: reuse the detections of previous runs on the same video, model and confidence threshold.
+    team_update_interval: update the team colours and the teams of the players every team_update_interval frames instead of fixing them on the first frame.
+    team_model_path: team model to resume from if the file exists, saved after processing (incremental team assignment, every 10 frames if team_update_interval is not set).
+    stats_path: CSV file for the per-frame ball possession statistics.
+    batch_size, imgsz: detection batch size and input size of the model (None for the training size).
+    autotune: benchmark batch sizes and image sizes on the first frames instead, the result is cached per host and model.
+    memory_budget_mb: memory limit for the autotuning.
+    backend: "torch" or "onnx" (ONNX Runtime, faster on CPU), the model is exported to ONNX on the first run.
+    int8, threads: INT8-quantized ONNX model and number of ONNX Runtime threads.
+    shards: detect and track segments of the video in this number of processes, overlapping by overlap frames to stitch the tracker IDs.
+            The segments are detected without the cache and the autotuning.
+    live: data is a live source (webcam index, RTSP/HTTP URL or file), processed in batches of at most window_size (default 8) frames
+          with at most max_latency seconds delay, frames are dropped under overload. realtime: read a file source at its fps (stand-in for a camera).
+    ball_method, ball_max_gap: filling of the frames without a ball detection (see BallInterpolator), live streams use "velocity" instead of "linear".
+    ball_roi_size: search the ball in crops of this size around its predicted position at full resolution (see BallRoiDetector), 
+                   e.g. with a reduced imgsz for the full frames.
+    keyframe_stride: run the model only on every keyframe_stride-th frame and on scene changes, the boxes in between are moved with optical flow
+                     (see KeyframeDetector).
+    camera_estimator: "max" (feature that moved the most) or "median" (median of the features, robust against outliers) camera movement per frame.
+    encoder: "opencv", "ffmpeg" (ffmpeg process) or "pyav" encoder of the output video, 
+             encoder_options: preset, crf, threads, fragmented (MP4 readable while written) and segment_time (ffmpeg only), see get_video_writer.
+    time_range: only decode and process this (start, end) range in seconds, None for the beginning or the end.
+    stride, scale: process every stride-th frame, downscaled by scale at decode time (analysis-only runs), not with shards or live.
+    analysis_path: analysis only, the tracks, ball possession and camera movement are saved to this .npz file instead of rendering the video
+                   (render it later with render_analysis), not with live.
+    metrics_path: wall time, frames/s, latency histograms of the stages and peak RSS of the run, Prometheus text format for .prom files, else JSON.
+    output_path: path of the annotated video, e.g. one per job.
+    frame_store_dir: keep the decoded frames in a memory-mapped file in this directory instead of in RAM (see FrameStore),
+                     only used if the whole video is processed at once.
+    """
+    # imported here: ultralytics, torch and supervision take seconds to load, e.g. not needed for --help
+    from trackers import Tracker, DetectionCache, DetectionTuner, OnnxDetector, BallInterpolator, BallRoiDetector, KeyframeDetector
+    from pipeline import process_video_stream, process_video_pipelined, process_video_sharded, process_live, save_analysis, analyze_video_stream
 
-    tracker = Tracker("models/best.pt", classes, verbose)
+    metrics.reset()
+    cache = DetectionCache(verbose=verbose) if use_cache else None
+    encoder_options = {"encoder": encoder, **(encoder_options or {})}
+    decode_options = {"time_range": time_range, "stride": stride, "scale": scale}
+    camera_options = {"estimator": camera_estimator}
+    team_assigner = _team_assigner(team_update_interval, team_model_path)
+
+    tuner = DetectionTuner(memory_budget_mb=memory_budget_mb, verbose=verbose) if autotune else None
+    model_path = OnnxDetector.export("models/best.pt", int8, verbose) if backend == "onnx" else "models/best.pt"
+    ball_interpolator = BallInterpolator(ball_method, ball_max_gap)
+    ball_roi = BallRoiDetector(ball_roi_size) if ball_roi_size else None
+    keyframes = KeyframeDetector(keyframe_stride) if keyframe_stride else None
+    tracker = Tracker(model_path, classes, verbose, cache, tuner, batch_size, imgsz, threads, ball_interpolator, ball_roi, keyframes)
+
+    if live:
+        if analysis_path is not None:
+            raise ValueError("Analysis only is not supported with live sources.")
+        processor = process_live(data, classes, output_path, window_size or 8, max_latency, realtime=realtime, verbose=verbose, 
+                                 team_assigner=team_assigner, tracker=tracker, encoder_options=encoder_options, 
+                                 camera_options=camera_options)
+        _save_results(team_assigner, processor.player_assigner, team_model_path, stats_path, metrics_path)
+        return
+
+    if shards:
+        if time_range is not None or stride != 1 or scale is not None:
+            raise ValueError("Time range, stride and scale are not supported with shards.")
+        tracker_options = {"model_path": model_path, "batch_size": batch_size, "imgsz": imgsz, "threads": threads, "keyframes": keyframes}
+        player_assigner = process_video_sharded(data, classes, shards, overlap, window_size or 100, verbose, team_assigner, tracker_options, ball_interpolator, 
+                                                encoder_options, analysis_path, output_path, camera_options)
+        _save_results(team_assigner, player_assigner, team_model_path, stats_path, metrics_path)
+        return
+
+    if pipelined or window_size:
+        if analysis_path is not None:
+            # nothing to encode, no need for the pipeline stages
+            processor = analyze_video_stream(data, classes, analysis_path, window_size or 100, verbose, cache, team_assigner, tracker, decode_options, 
+                                             camera_options)
+        elif pipelined:
+            processor = process_video_pipelined(data, classes, window_size or 100, verbose=verbose, cache=cache, team_assigner=team_assigner, tracker=tracker, 
+                                                encoder_options=encoder_options, decode_options=decode_options, output_path=output_path, 
+                                                camera_options=camera_options)
+        else:
+            processor = process_video_stream(data, classes, window_size, verbose, cache, team_assigner, tracker, encoder_options, decode_options, output_path, 
+                                             camera_options)
+
+        _save_results(team_assigner, processor.player_assigner, team_model_path, stats_path, metrics_path)
+        return
+
+    frame_store = FrameStore(frame_store_dir) if frame_store_dir else None
+    frames, fps, _, _ = read_video(data, verbose, frame_store, **decode_options)
+
+    tracker.set_video(data, decode_options)
     tracks = tracker.get_object_tracks(frames)
+    tracker.save_cache()
+
+    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
     tracker.add_position_to_tracks(tracks)
 
-    camera_movement_estimator = CameraMovementEstimator(frames[0], classes, verbose)
+    camera_movement_estimator = CameraMovementEstimator(frames[0], classes, verbose, **camera_options)
     camera_movement_per_frame = camera_movement_estimator.get_camera_movement(frames)
     camera_movement_estimator.adjust_positions_to_tracks(tracks, camera_movement_per_frame)
 
-    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
-
-    team_assigner = TeamAssigner()
     team_assigner.get_teams(frames, tracks)
 
     player_assigner = PlayerBallAssigner()
     player_assigner.get_player_and_possession(tracks)
 
-    output = tracker.draw_annotations(frames, tracks, player_assigner.ball_possession)
-    output = camera_movement_estimator.draw_camera_movement(output, camera_movement_per_frame)
+    if analysis_path is not None:
+        save_analysis(analysis_path, tracks, camera_movement_per_frame, player_assigner, tracker.interpolation_tracker, fps, decode_options)
+        if frame_store is not None:
+            frame_store.close()
+        _save_results(team_assigner, player_assigner, team_model_path, stats_path, metrics_path)
+        return
+
+    # frames aren't needed after rendering, all overlays are drawn into them in one pass
+    output = OverlayRenderer(in_place=True).render(frames, [tracker.annotation_layer(tracks, player_assigner.possession_counts), 
+                                                            camera_movement_estimator.camera_movement_layer(camera_movement_per_frame)])
 
-    save_video(output, "output/output.mp4", fps, verbose)
+    save_video(output, output_path, fps, verbose, **encoder_options)
+    if frame_store is not None:
+        frame_store.close()
+
+    _save_results(team_assigner, player_assigner, team_model_path, stats_path, metrics_path)
+
+def _save_results(team_assigner: TeamAssigner, player_assigner: PlayerBallAssigner, team_model_path: str, stats_path: str, metrics_path: str=None) -> None:
+    if metrics_path:
+        metrics.save(metrics_path)
+    if team_model_path:
+        team_assigner.save_team_model(team_model_path)
+    if stats_path:
+        player_assigner.save_possession_stats(stats_path)
+
+def _team_assigner(team_update_interval: int, team_model_path: str) -> TeamAssigner:
+    if team_model_path and os.path.isfile(team_model_path):
+        return TeamAssigner(update_interval=team_update_interval, team_model=TeamModel.load(team_model_path))
+
+    if team_model_path and not team_update_interval:
+        team_update_interval = 10   # model only exists in incremental mode
+
+    return TeamAssigner(update_interval=team_update_interval)
 
 def _video(path: str) -> None:
     if not path.lower().endswith(".mp4"):
@@ -60,11 +182,81 @@ if __name__ == "__main__":
     parser.add_argument("--video", type=str, help="Video path of the video (must be .mp4)")
     parser.add_argument("--tracks", nargs="+", type=str, help="Select the objects to visualise: players, goalkeepers, referees, ball")
     parser.add_argument("--verbose", action="store_true", help="Model output and logging")
+    parser.add_argument("--window-size", type=int, help="Stream the video in windows of this number of frames to limit memory usage")
+    parser.add_argument("--no-cache", action="store_true", help="Run the detection even if the results of a previous run on the same video are cached")
+    parser.add_argument("--team-update-interval", type=int, help="Update the team colours and the teams of the players every N frames (long matches, changing lighting)")
+    parser.add_argument("--team-model", type=str, help="Team model file to resume from if it exists, saved after processing")
+    parser.add_argument("--stats-output", type=str, help="CSV file for the per-frame ball possession statistics")
+    parser.add_argument("--batch-size", type=int, default=20, help="Number of frames per detection batch")
+    parser.add_argument("--imgsz", type=int, help="Input size of the detection model, training size of the model if left out")
+    parser.add_argument("--autotune", action="store_true", help="Benchmark batch sizes and image sizes on this machine, cached per host and model")
+    parser.add_argument("--memory-budget", type=int, help="Memory limit in MB for --autotune")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Detection backend, onnx runs the exported model with ONNX Runtime")
+    parser.add_argument("--int8", action="store_true", help="INT8-quantized model for the onnx backend")
+    parser.add_argument("--threads", type=int, help="Number of CPU threads of the onnx backend")
+    parser.add_argument("--shards", type=int, help="Detect and track segments of the video in this number of processes (long matches, many cores)")
+    parser.add_argument("--overlap", type=int, default=25, help="Frames that neighbouring segments of --shards overlap to stitch the tracker IDs")
+    parser.add_argument("--live", type=str, help="Live source instead of --video: webcam index, RTSP/HTTP URL or file")
+    parser.add_argument("--max-latency", type=float, default=1.0, help="Maximum delay in seconds of --live, frames are dropped under overload")
+    parser.add_argument("--realtime", action="store_true", help="Read a --live file at its fps, as a stand-in for a camera")
+    parser.add_argument("--ball-method", choices=["linear", "velocity", "kalman"], default="linear", help="Filling of the frames without a ball detection")
+    parser.add_argument("--ball-max-gap", type=int, help="Longest gap in frames without a ball detection that is filled")
+    parser.add_argument("--ball-roi", type=int, help="Search the ball in crops of this size in pixels around its predicted position at full resolution")
+    parser.add_argument("--keyframe-stride", type=int, help="Run the model only on every N-th frame and on scene changes, boxes in between are propagated with optical flow")
+    parser.add_argument("--camera-estimator", choices=["max", "median"], default="max", help="Camera movement per frame from the feature that moved the most or the median of the features")
+    parser.add_argument("--encoder", choices=["opencv", "ffmpeg", "pyav"], default="opencv", help="Encoder of the output video, ffmpeg pipes the frames into an ffmpeg process")
+    parser.add_argument("--preset", type=str, help="x264 preset of the ffmpeg/pyav encoder, e.g. ultrafast to medium")
+    parser.add_argument("--crf", type=int, help="Quality of the ffmpeg/pyav encoder, lower is better")
+    parser.add_argument("--encoder-threads", type=int, help="Number of threads of the ffmpeg/pyav encoder")
+    parser.add_argument("--fragmented", action="store_true", help="Fragmented MP4 output of the ffmpeg/pyav encoder that can be read while it is written")
+    parser.add_argument("--segment-time", type=float, help="Write the output in segments of this many seconds (ffmpeg encoder)")
+    parser.add_argument("--start-time", type=float, help="Start of the processed part of the video in seconds")
+    parser.add_argument("--end-time", type=float, help="End of the processed part of the video in seconds")
+    parser.add_argument("--stride", type=int, default=1, help="Process only every N-th frame, the others are skipped at decode time")
+    parser.add_argument("--scale", type=float, help="Downscale the frames by this factor at decode time, e.g. 0.5 for analysis-only runs")
+    parser.add_argument("--analysis-output", type=str, help="Analysis only: save tracks, ball possession and camera movement to this .npz file instead of rendering the video")
+    parser.add_argument("--render", type=str, help="Render --video from an .npz file of --analysis-output with the overlays of --tracks, without detection and tracking")
+    parser.add_argument("--metrics-output", type=str, help="Stage timings, latency histograms and peak RSS of the run, Prometheus text format for .prom files, else JSON")
+    parser.add_argument("--profile", type=str, help="Run under cProfile and write the statistics to this file (e.g. for snakeviz)")
+    parser.add_argument("--frame-store", type=str, help="Keep the decoded frames in a memory-mapped file in this directory instead of in RAM (long matches without --window-size)")
+    parser.add_argument("--pipelined", action="store_true", help="Run decoding, detection, tracking/annotation and encoding concurrently (streams in windows of 100 frames if --window-size is left out)")
 
     args = parser.parse_args()
+    encoder_options = {"preset": args.preset, "crf": args.crf, "threads": args.encoder_threads, "fragmented": args.fragmented, "segment_time": args.segment_time}
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
     
-    if args.video and args.tracks:
+    if args.render and args.video and args.tracks:
+        _video(args.video)
+        classes = _classes(args.tracks)
+
+        from pipeline import render_analysis
+        render_analysis(args.video, args.render, classes, verbose=args.verbose, encoder_options={"encoder": args.encoder, **encoder_options})
+        if args.metrics_output:
+            metrics.save(args.metrics_output)
+    elif args.video and args.tracks:
         _video(args.video)
         classes = _classes(args.tracks)
         
-        process_video(args.video, classes, args.verbose)
\ No newline at end of file
+        process_video(args.video, classes, args.verbose, args.window_size, args.pipelined, not args.no_cache, args.team_update_interval, args.team_model, args.stats_output, 
+                      args.batch_size, args.imgsz, args.autotune, args.memory_budget, 
+                      args.backend, args.int8, args.threads, args.shards, args.overlap, ball_method=args.ball_method, ball_max_gap=args.ball_max_gap, 
+                      ball_roi_size=args.ball_roi, keyframe_stride=args.keyframe_stride, camera_estimator=args.camera_estimator, encoder=args.encoder, 
+                      encoder_options=encoder_options, time_range=(args.start_time, args.end_time) if args.start_time or args.end_time else None, stride=args.stride, scale=args.scale, 
+                      analysis_path=args.analysis_output, metrics_path=args.metrics_output, frame_store_dir=args.frame_store)
+    elif args.live and args.tracks:
+        classes = _classes(args.tracks)
+        source = int(args.live) if args.live.isdigit() else args.live     # webcam index
+
+        process_video(source, classes, args.verbose, args.window_size, use_cache=False, team_update_interval=args.team_update_interval, 
+                      team_model_path=args.team_model, stats_path=args.stats_output, batch_size=args.batch_size, imgsz=args.imgsz, 
+                      backend=args.backend, int8=args.int8, threads=args.threads, live=True, max_latency=args.max_latency, realtime=args.realtime, 
+                      ball_method=args.ball_method, ball_max_gap=args.ball_max_gap, ball_roi_size=args.ball_roi, 
+                      keyframe_stride=args.keyframe_stride, camera_estimator=args.camera_estimator, encoder=args.encoder, encoder_options=encoder_options, 
+                      metrics_path=args.metrics_output)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
\ No newline at end of file
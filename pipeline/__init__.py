@@ -0,0 +1,23 @@
+import importlib
+
+# exports and their modules, imported on first access: e.g. the frontend only needs the job queue, the workers load the rest
+_exports = {
+    "process_video_stream": ".streaming",
+    "process_video_pipelined": ".streaming",
+    "process_video_sharded": ".sharding",
+    "process_live": ".live",
+    "save_analysis": ".analysis",
+    "load_analysis": ".analysis",
+    "analyze_video_stream": ".analysis",
+    "render_analysis": ".analysis",
+    "JobQueue": ".jobs",
+    "WorkerPool": ".jobs"
+}
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_exports[name], __name__), name)
+
+def __dir__():
+    return list(_exports)
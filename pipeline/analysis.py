@@ -0,0 +1,134 @@
+from typing import Dict, List, Tuple, Union
+import time
+import logging
+import itertools
+import numpy as np
+from utils import stream_video, frame_windows, save_video, OverlayRenderer
+from trackers import Tracker, TrackStore, TrackTable, DetectionCache
+from team_assignment import TeamAssigner
+from player_ball_assignment import PlayerBallAssigner
+from camera_movement import CameraMovementEstimator
+from .streaming import WindowProcessor
+
+logger = logging.getLogger("tracker")
+
+def save_analysis(path: str, tracks: TrackStore, camera_movement_per_frame: np.ndarray, player_assigner: PlayerBallAssigner, 
+                  ball_interpolated: np.ndarray, fps: float, decode_options: Dict=None) -> None:
+    """
+    Writes everything needed to render the video later to a compressed .npz file: all track columns ("players.bbox", ...),
+    the camera movement, the ball possession per frame, the frames with an interpolated ball, the fps and the decode options of the frames.
+    """
+    decode_options = decode_options or {}
+    time_range = decode_options.get("time_range") or (None, None)
+
+    np.savez_compressed(path, 
+                        num_frames=tracks.num_frames, 
+                        camera_movement=camera_movement_per_frame, 
+                        ball_possession=player_assigner.ball_possession, 
+                        possession_counts=player_assigner.possession_counts, 
+                        ball_interpolated=ball_interpolated,
+                        fps=fps,
+                        time_range=np.array([np.nan if t is None else t for t in time_range], dtype=np.float64),    # NaN: beginning/end of the video
+                        stride=decode_options.get("stride") or 1,
+                        scale=decode_options.get("scale") or np.nan,
+                        **tracks.to_dict())
+
+def load_analysis(path: str) -> Dict:
+    """
+    Counterpart of save_analysis: tracks (TrackStore), camera_movement, ball_possession, possession_counts, ball_interpolated, fps and decode_options.
+    """
+    with np.load(path) as f:
+        arrays = {key: f[key] for key in f.files}
+
+    num_frames = int(arrays.pop("num_frames"))
+    time_range = tuple(None if np.isnan(t) else float(t) for t in arrays.pop("time_range"))
+    scale = float(arrays.pop("scale"))
+
+    analysis = {key: arrays.pop(key) for key in ("camera_movement", "ball_possession", "possession_counts", "ball_interpolated")}
+    analysis["fps"] = float(arrays.pop("fps"))
+    analysis["decode_options"] = {"time_range": time_range if time_range != (None, None) else None, 
+                                  "stride": int(arrays.pop("stride")), 
+                                  "scale": None if np.isnan(scale) else scale}
+    analysis["tracks"] = TrackStore.from_dict(num_frames, arrays)      # remaining arrays are the track columns
+
+    return analysis
+
+def concatenate_windows(num_frames: int, windows: List[Tuple[int, TrackStore]]) -> TrackStore:
+    """
+    Tracks of the whole video from the tracks of its windows, windows: (index of the first frame, tracks).
+    """
+    offsets = [offset for offset, _ in windows]
+    objects = windows[0][1].tables.keys() if windows else ("players", "referees", "ball")
+
+    return TrackStore(num_frames, {object: TrackTable.concatenate(num_frames, [tracks[object] for _, tracks in windows], offsets) if windows 
+                                   else TrackTable(num_frames, np.zeros(0), np.zeros(0), np.zeros((0, 4)))
+                                   for object in objects})
+
+def analyze_video_stream(data: Union[str, bytes], classes: List[int], analysis_path: str, window_size: int=100, verbose: bool=True, 
+                         cache: DetectionCache=None, team_assigner: TeamAssigner=None, tracker: Tracker=None, decode_options: Dict=None, 
+                         camera_options: Dict=None) -> WindowProcessor:
+    """
+    Streaming analysis without rendering and encoding: tracks, ball possession and camera movement are written to analysis_path (see save_analysis).
+    Only the tracks are kept for the whole video, the frames are processed in windows.
+    """
+    start_time = time.time()
+
+    frames, fps = stream_video(data, verbose, **(decode_options or {}))
+
+    processor = WindowProcessor(classes, verbose, cache, team_assigner, tracker, camera_options=camera_options)
+    processor.tracker.set_video(data, decode_options)
+
+    windows = []
+    camera_movement = []
+    ball_interpolated = []
+
+    for window in itertools.chain(frame_windows(frames, window_size), [None]):     # None finishes the last window
+        for analyzed_window, tracks, camera_movement_per_frame in processor.analyze(window):
+            windows.append((processor.frame_offset, tracks))
+            camera_movement.append(camera_movement_per_frame)
+            ball_interpolated.append(processor.tracker.interpolation_tracker)
+
+            processor.frame_offset += len(analyzed_window)
+
+    processor.tracker.save_cache()
+
+    num_frames = processor.frame_offset
+    save_analysis(analysis_path, concatenate_windows(num_frames, windows), 
+                  np.concatenate(camera_movement) if camera_movement else np.zeros((0, 2)), processor.player_assigner, 
+                  np.concatenate(ball_interpolated) if ball_interpolated else np.zeros(0, dtype=bool), fps, decode_options)
+
+    if verbose:
+        logger.info(f"[Analysis] Analysed {num_frames} frames in {time.time() - start_time:.2f} seconds, saved to {analysis_path}.")
+
+    return processor
+
+def render_analysis(data: Union[str, bytes], analysis_path: str, classes: List[int], output_path: str="output/output.mp4", verbose: bool=True, 
+                    encoder_options: Dict=None) -> None:
+    """
+    Renders the video of a saved analysis (see save_analysis) with the overlays of classes, without detection and tracking.
+    data: the analysed video, decoded with the same time range, stride and scale as in the analysis.
+    """
+    start_time = time.time()
+
+    analysis = load_analysis(analysis_path)
+    tracks = analysis["tracks"]
+
+    frames, _ = stream_video(data, verbose, **analysis["decode_options"])
+    first_frame = next(frames, None)
+    if first_frame is None:
+        raise ValueError("The video has no frames.")
+    frames = itertools.chain([first_frame], frames)
+
+    tracker = Tracker("models/best.pt", classes, verbose)     # only for drawing, the model is not loaded
+    tracker.interpolation_tracker = analysis["ball_interpolated"]
+    camera_movement_estimator = CameraMovementEstimator(first_frame, classes, verbose)
+
+    # one pass over the video, the layers index the tracks of the whole video
+    output = OverlayRenderer(in_place=True).render(itertools.islice(frames, tracks.num_frames), 
+                                                   [tracker.annotation_layer(tracks, analysis["possession_counts"]), 
+                                                    camera_movement_estimator.camera_movement_layer(analysis["camera_movement"])])
+
+    save_video(output, output_path, analysis["fps"], verbose, **(encoder_options or {}))
+
+    if verbose:
+        logger.info(f"[Analysis] Rendered {tracks.num_frames} frames of {analysis_path} in {time.time() - start_time:.2f} seconds.")
@@ -0,0 +1,241 @@
+from typing import Dict, List, Union
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import closing
+import psutil
+from utils import get_frame_count, metrics
+from trackers import load_model
+
+logger = logging.getLogger("memory_access")
+
+# stages that count processed frames while a job runs, the progress is their mean share of the frames of the video
+PROGRESS_STAGES = ("decode", "inference", "track", "encode")
+ANALYSIS_PROGRESS_STAGES = ("decode", "inference", "track")
+
+class JobQueue:
+    """
+    Local job queue in a SQLite database, shared by the frontend sessions and the worker processes.
+    Every job gets its own directory with the input video, the output video and the stage metrics.
+    Job states: queued --> running --> done / failed. A running job is owned by the worker process that claimed it
+    (pid and start time of the process, pids are reused).
+    """
+    def __init__(self, path: str="output/jobs/jobs.db") -> None:
+        self.path = path
+        self.directory = os.path.dirname(path)
+        os.makedirs(self.directory, exist_ok=True)
+
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")      # readers (status polling) don't block the workers
+            connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, status TEXT, classes TEXT, options TEXT, input_path TEXT, output_path TEXT, metrics_path TEXT,
+                num_frames INTEGER, progress REAL, error TEXT, submitted REAL, started REAL, finished REAL, owner_pid INTEGER, owner_started REAL)""")
+
+            # databases of earlier versions without the owner of the running jobs
+            columns = [row["name"] for row in connection.execute("PRAGMA table_info(jobs)")]
+            for column, column_type in (("owner_pid", "INTEGER"), ("owner_started", "REAL")):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per call: the queue is used from several threads and processes
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def submit(self, data: Union[str, bytes], classes: List[int], **options) -> str:
+        """
+        Queues the video (path or bytes) with the keyword arguments of process_video, e.g. window_size. Returns the job ID.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job_directory = os.path.join(self.directory, job_id)
+        os.makedirs(job_directory)
+
+        if isinstance(data, bytes):
+            input_path = os.path.join(job_directory, "input.mp4")
+            with open(input_path, "wb") as f:
+                f.write(data)
+        else:
+            input_path = data
+
+        with closing(self._connect()) as connection:
+            connection.execute("INSERT INTO jobs VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, 0, NULL, ?, NULL, NULL, NULL, NULL)",
+                               (job_id, json.dumps(classes), json.dumps(options), input_path, os.path.join(job_directory, "output.mp4"),
+                                os.path.join(job_directory, "metrics.json"), get_frame_count(input_path), time.time()))
+
+        return job_id
+
+    def status(self, job_id: str) -> Dict:
+        """
+        State of the job: status, progress (0 to 1), error, paths and times.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"Unknown job {job_id}.")
+            # number of jobs before this one
+            queue_position = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND submitted < ?", 
+                                                (row["submitted"],)).fetchone()[0] if row["status"] == "queued" else None
+
+        job = dict(row)
+        job["classes"] = json.loads(job["classes"])
+        job["options"] = json.loads(job["options"])
+        job["queue_position"] = queue_position
+
+        return job
+
+    def result(self, job_id: str) -> str:
+        """
+        Path of the output video of a finished job.
+        """
+        job = self.status(job_id)
+
+        if job["status"] == "failed":
+            raise RuntimeError(f"Job {job_id} failed: {job['error']}")
+        if job["status"] != "done":
+            raise ValueError(f"Job {job_id} is not finished yet ({job['status']}).")
+
+        return job["output_path"]
+
+    def claim(self) -> Union[Dict, None]:
+        """
+        Marks the oldest queued job as running, owned by this process, and returns it, None if the queue is empty. Used by the workers.
+        """
+        process = psutil.Process()
+
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")       # no other worker can claim the same job
+            row = connection.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY submitted LIMIT 1").fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute("UPDATE jobs SET status = 'running', started = ?, owner_pid = ?, owner_started = ? WHERE id = ?", 
+                               (time.time(), process.pid, process.create_time(), row["id"]))
+            connection.execute("COMMIT")
+
+        return self.status(row["id"])
+
+    def set_progress(self, job_id: str, progress: float) -> None:
+        with closing(self._connect()) as connection:
+            connection.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def finish(self, job_id: str, error: str=None) -> None:
+        with closing(self._connect()) as connection:
+            connection.execute("UPDATE jobs SET status = ?, progress = ?, error = ?, finished = ? WHERE id = ?",
+                               ("failed" if error else "done", 0 if error else 1, error, time.time(), job_id))
+
+    def requeue_running(self) -> List[str]:
+        """
+        Jobs of workers that died (e.g. server restart) are queued again, jobs of running workers (e.g. of another server) are left alone.
+        Returns the IDs of the queued jobs.
+        """
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute("SELECT id, owner_pid, owner_started FROM jobs WHERE status = 'running'").fetchall()
+            orphans = [row["id"] for row in rows if not _is_alive(row["owner_pid"], row["owner_started"])]
+            connection.executemany("UPDATE jobs SET status = 'queued', progress = 0, started = NULL, owner_pid = NULL, owner_started = NULL WHERE id = ?", 
+                                   [(job_id,) for job_id in orphans])
+            connection.execute("COMMIT")
+
+        return orphans
+
+def _is_alive(pid: int, started: float) -> bool:
+    """
+    True if the process with the pid still runs and is not a newer process with a reused pid.
+    """
+    if pid is None:
+        return False
+    try:
+        return abs(psutil.Process(pid).create_time() - started) < 1e-3
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+def get_progress(summary: Dict, num_frames: int, analysis_only: bool=False) -> float:
+    """
+    Progress from the frames processed by the stages so far (metrics summary of the run).
+    """
+    stages = ANALYSIS_PROGRESS_STAGES if analysis_only else PROGRESS_STAGES
+    frames = [min(summary["stages"].get(stage, {"frames": 0})["frames"] / max(num_frames, 1), 1) for stage in stages]
+
+    return sum(frames) / len(frames)
+
+def _report_progress(queue: JobQueue, job: Dict, stop: threading.Event, interval: float) -> None:
+    analysis_only = job["options"].get("analysis_path") is not None
+
+    while not stop.wait(interval):
+        queue.set_progress(job["id"], get_progress(metrics.summary(), job["num_frames"], analysis_only))
+
+def _run_worker(path: str, stop: multiprocessing.Event, interval: float) -> None:
+    """
+    Processes one job after another until stop is set. The model stays loaded between the jobs (see load_model).
+    """
+    from main import process_video     # main imports this package
+
+    queue = JobQueue(path)
+    if os.path.isfile("models/best.pt"):
+        load_model("models/best.pt")
+
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            stop.wait(interval)
+            continue
+
+        metrics.reset()     # no progress of the previous job
+        progress_stop = threading.Event()
+        progress_thread = threading.Thread(target=_report_progress, args=(queue, job, progress_stop, interval), daemon=True)
+        progress_thread.start()
+
+        error = None
+        try:
+            process_video(job["input_path"], job["classes"], verbose=False, output_path=job["output_path"], metrics_path=job["metrics_path"],
+                          **job["options"])
+        except Exception as e:
+            logger.exception(f"[Jobs] Job {job['id']} failed.")
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            progress_stop.set()
+            progress_thread.join()
+
+        queue.finish(job["id"], error)
+
+class WorkerPool:
+    """
+    Worker processes that run the jobs of the queue, every worker runs one job at a time.
+    """
+    def __init__(self, queue: JobQueue, workers: int=2, interval: float=0.5) -> None:
+        """
+        interval: seconds between polls of an empty queue and between progress updates.
+        """
+        self.queue = queue
+        self.workers = workers
+        self.interval = interval
+        self.context = multiprocessing.get_context("spawn")     # no forked torch/CUDA state
+        self.stop_event = self.context.Event()
+        self.processes = []
+
+    def start(self) -> None:
+        requeued = self.queue.requeue_running()
+        if requeued:
+            logger.info(f"[Jobs] Queued {len(requeued)} jobs of stopped workers again.")
+
+        for _ in range(self.workers):
+            process = self.context.Process(target=_run_worker, args=(self.queue.path, self.stop_event, self.interval), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+        logger.info(f"[Jobs] Started {self.workers} workers.")
+
+    def stop(self) -> None:
+        """
+        Workers finish their current job first.
+        """
+        self.stop_event.set()
+        for process in self.processes:
+            process.join()
+        self.processes = []
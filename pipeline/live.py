@@ -0,0 +1,70 @@
+from typing import Dict, Union, List
+import time
+import logging
+import numpy as np
+from utils import LiveCapture, get_video_writer
+from trackers import Tracker
+from team_assignment import TeamAssigner
+from .streaming import WindowProcessor
+
+logger = logging.getLogger("tracker")
+
+def process_live(source: Union[int, str], classes: List[int], output_path: str="output/output.mp4", batch_size: int=8, max_latency: float=1.0,
+                 buffer_size: int=32, realtime: bool=False, max_frames: int=None, verbose: bool=True, team_assigner: TeamAssigner=None,
+                 tracker: Tracker=None, encoder_options: Dict=None, camera_options: Dict=None) -> WindowProcessor:
+    """
+    Annotates a live source (webcam index, RTSP/HTTP URL, or a file with realtime=True as stand-in) until it ends, max_frames or Ctrl+C.
+    The latest frames are processed in small batches of at most batch_size frames, the state spans the whole stream (WindowProcessor).
+    The ball is extrapolated from the previous frames instead of interpolated.
+    Under overload, frames are dropped: frames that would be older than max_latency seconds after processing (estimated from the previous batches),
+    older frames if more than batch_size are waiting, and frames that don't fit into the buffer of the capture.
+    The newest frame is always processed, even if the processing alone takes longer than max_latency.
+    encoder_options: encoder and its options for the output video (see get_video_writer), e.g. fragmented MP4 or segments to watch while processing.
+    camera_options: settings of the CameraMovementEstimator (see WindowProcessor).
+    Returns the processor with the state of the whole stream, e.g. the ball possession.
+    """
+    capture = LiveCapture(source, buffer_size, realtime)
+    writer = get_video_writer(output_path, capture.fps, **(encoder_options or {}))
+    processor = WindowProcessor(classes, verbose, team_assigner=team_assigner, tracker=tracker, causal=True, camera_options=camera_options)
+
+    num_processed = 0
+    num_late = 0
+    batch_time = 0.0        # moving average of the processing time of a batch
+    latencies = []
+    start_time = time.time()
+
+    try:
+        while not capture.ended and (max_frames is None or num_processed < max_frames):
+            frames = capture.read(buffer_size)
+            if not frames:
+                continue
+
+            # skip frames that can't be shown in time anymore, newest frames first
+            deadline = time.time() + batch_time - max_latency
+            batch = [(capture_time, frame) for capture_time, frame in frames if capture_time >= deadline][-batch_size:] or frames[-1:]
+            num_late += len(frames) - len(batch)
+
+            batch_start = time.time()
+            output = processor.process([frame for _, frame in batch])
+
+            for frame in output:
+                writer.write(frame)
+
+            done = time.time()
+            batch_time = 0.8 * batch_time + 0.2 * (done - batch_start) if num_processed else done - batch_start
+            latencies += [done - capture_time for capture_time, _ in batch]
+            num_processed += len(batch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.release()
+        if writer.num_frames > 0:
+            writer.release()
+
+    if verbose and latencies:
+        latencies = np.array(latencies)
+        logger.info(f"[Live] Processed {num_processed} of {capture.num_frames} frames in {time.time() - start_time:.2f} seconds, "
+                    f"dropped {capture.num_dropped} (buffer full) and {num_late} (too late), "
+                    f"latency mean {latencies.mean():.3f} seconds, 95th percentile {np.percentile(latencies, 95):.3f} seconds.")
+
+    return processor
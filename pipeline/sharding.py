@@ -0,0 +1,279 @@
+from typing import Dict, List, Tuple, Union
+import os
+import math
+import time
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import supervision as sv
+import torch
+from scipy.optimize import linear_sum_assignment
+from utils import stream_video, get_frame_count, frame_windows, save_video, OverlayRenderer, metrics
+from trackers import Tracker, TrackStore, TrackTable, BallInterpolator
+from team_assignment import TeamAssigner
+from player_ball_assignment import PlayerBallAssigner
+from camera_movement import CameraMovementEstimator
+from .analysis import save_analysis, concatenate_windows
+
+logger = logging.getLogger("tracker")
+
+def _init_worker(threads: int) -> None:
+    # every worker gets its share of the cores instead of all of them
+    torch.set_num_threads(threads)
+
+def _process_segment(path: str, classes: List[int], start: int, end: int, head: int, tail: int, window_size: int, tracker_options: Dict, 
+                     camera_options: Dict) -> Dict:
+    """
+    Detection, tracking and camera movement of the frames start to end (None: end of the video) in a worker process.
+    Also returns the mean shirt colour of every track in the first head and the last tail frames (overlaps with the neighbour segments) for the stitching
+    and the stage metrics of the worker.
+    """
+    metrics.reset()     # workers are reused for several segments
+    tracker = Tracker(classes=classes, verbose=False, **tracker_options)
+    team_assigner = TeamAssigner()      # only used for the shirt colours
+    camera_movement_estimator = None
+
+    frames, _ = stream_video(path, False, start, end)
+    tail_start = end - start - tail if end is not None else math.inf
+
+    tables = {"players": [], "referees": [], "ball": []}
+    camera_movement = []
+    window_offsets = []
+    overlap_rows = {"head": {"players": [], "referees": []}, "tail": {"players": [], "referees": []}}    # (tracker_ids, colours) per window
+
+    offset = 0
+    for window in frame_windows(frames, window_size):
+        if camera_movement_estimator is None:
+            camera_movement_estimator = CameraMovementEstimator(window[0], classes, False, **camera_options)
+
+        tracks = tracker.get_object_tracks(window)
+        camera_movement.append(camera_movement_estimator.get_camera_movement(window, resume=True))
+
+        for object, table in tracks.items():
+            tables[object].append(table)
+
+            if object == "ball":
+                continue
+
+            frame = table.frame + offset
+            for part, in_overlap in (("head", frame < head), ("tail", frame >= tail_start)):
+                rows = np.flatnonzero(in_overlap)
+                crops = [team_assigner.get_shirt_crop(window[table.frame[row]], table.bbox[row]) for row in rows]
+                overlap_rows[part][object].append((table.tracker_id[rows], team_assigner.get_player_colours(crops)))
+
+        window_offsets.append(offset)
+        offset += len(window)
+
+    colours = {part: {object: _mean_colours(rows) for object, rows in objects.items()} for part, objects in overlap_rows.items()}
+
+    return {
+        "tracks": TrackStore(offset, {object: TrackTable.concatenate(offset, parts, window_offsets) for object, parts in tables.items()}),
+        "camera_movement": np.concatenate(camera_movement),
+        "colours": colours,
+        "cls_names": tracker.cls_names,
+        "metrics": metrics.summary()
+    }
+
+def _mean_colours(rows: List[Tuple[np.ndarray, np.ndarray]]) -> Dict[int, np.ndarray]:
+    """
+    Mean colour per tracker ID.
+    """
+    tracker_ids = np.concatenate([ids for ids, _ in rows]) if rows else np.zeros(0, dtype=np.int32)
+    colours = np.concatenate([colours for _, colours in rows]) if rows else np.zeros((0, 3))
+
+    unique_ids, inverse = np.unique(tracker_ids, return_inverse=True)
+    sums = np.zeros((len(unique_ids), 3))
+    np.add.at(sums, inverse, colours)
+    counts = np.bincount(inverse, minlength=len(unique_ids))[:, None]
+
+    return dict(zip(unique_ids.tolist(), sums / counts))
+
+def stitch_ids(previous: TrackTable, current: TrackTable, overlap: int, previous_colours: Dict[int, np.ndarray], current_colours: Dict[int, np.ndarray],
+               min_iou: float=0.5, max_colour_distance: float=0.25) -> Dict[int, int]:
+    """
+    Matches the tracker IDs of the current segment to the IDs of the previous segment in the overlap frames:
+    previous: last overlap frames, current: first overlap frames.
+    Score of a pair: mean box IoU over the overlap frames minus the distance of the shirt colours (0 to 1, normalised by the largest BGR distance).
+    Returns current ID --> previous ID for the pairs with mean IoU of at least min_iou and a colour distance of at most max_colour_distance.
+    """
+    first_frame = previous.num_frames - overlap
+
+    previous_rows = slice(previous.frame_offsets[first_frame], len(previous))
+    current_rows = slice(0, current.frame_offsets[overlap])
+    previous_ids = np.unique(previous.tracker_id[previous_rows])
+    current_ids = np.unique(current.tracker_id[current_rows])
+
+    if len(previous_ids) == 0 or len(current_ids) == 0:
+        return {}
+
+    # sum of the IoU of every pair over the overlap frames
+    iou_sum = np.zeros((len(previous_ids), len(current_ids)))
+    for frame_num in range(overlap):
+        previous_frame = previous.frame_slice(first_frame + frame_num)
+        current_frame = current.frame_slice(frame_num)
+
+        iou = sv.box_iou_batch(previous.bbox[previous_frame], current.bbox[current_frame])
+        rows = np.searchsorted(previous_ids, previous.tracker_id[previous_frame])
+        columns = np.searchsorted(current_ids, current.tracker_id[current_frame])
+        iou_sum[np.ix_(rows, columns)] += iou
+
+    mean_iou = iou_sum / overlap
+
+    previous_colour = np.array([previous_colours.get(i, np.full(3, np.nan)) for i in previous_ids.tolist()])
+    current_colour = np.array([current_colours.get(i, np.full(3, np.nan)) for i in current_ids.tolist()])
+    colour_distance = np.linalg.norm(previous_colour[:, None] - current_colour[None, :], axis=2) / np.sqrt(3 * 255**2)
+    colour_distance = np.nan_to_num(colour_distance, nan=0.0)     # no colour: decided by the IoU
+
+    rows, columns = linear_sum_assignment(-(mean_iou - colour_distance))
+    matched = (mean_iou[rows, columns] >= min_iou) & (colour_distance[rows, columns] <= max_colour_distance)
+
+    return dict(zip(current_ids[columns[matched]].tolist(), previous_ids[rows[matched]].tolist()))
+
+def _map_ids(tracker_ids: np.ndarray, id_map: Dict[int, int]) -> np.ndarray:
+    unique_ids, inverse = np.unique(tracker_ids, return_inverse=True)
+    return np.array([id_map[i] for i in unique_ids.tolist()], dtype=np.int32)[inverse]
+
+def merge_segments(segments: List[Dict], starts: List[int], overlap: int) -> Tuple[TrackStore, np.ndarray]:
+    """
+    One global timeline of the segment results: tracks with video-wide tracker IDs and the camera movement.
+    starts: index of the first frame of every segment without the overlap (segment i covers starts[i] - overlap to starts[i+1]).
+    """
+    num_frames = starts[-1] + segments[-1]["tracks"].num_frames - (overlap if len(segments) > 1 else 0)
+
+    id_maps = [{} for _ in segments]     # per segment: object --> segment ID --> global ID
+    tables = {"players": [], "referees": [], "ball": []}
+    camera_movement = []
+
+    for i, segment in enumerate(segments):
+        head = overlap if i > 0 else 0      # overlap frames belong to the previous segment
+        tracks = segment["tracks"]
+
+        for object in tables:
+            if object == "ball":
+                id_maps[i][object] = {1: 1}     # only one ball
+            else:
+                stitched = {}
+                if i > 0:
+                    stitched = stitch_ids(segments[i-1]["tracks"][object], tracks[object], overlap,
+                                          segments[i-1]["colours"]["tail"][object], segment["colours"]["head"][object])
+                    stitched = {segment_id: id_maps[i-1][object][previous_id] for segment_id, previous_id in stitched.items()}
+
+                # new global IDs for the unmatched tracks
+                next_id = max([max(id_maps[j][object].values(), default=0) for j in range(i)], default=0) + 1
+                for segment_id in np.unique(tracks[object].tracker_id).tolist():
+                    if segment_id not in stitched:
+                        stitched[segment_id] = next_id
+                        next_id += 1
+                id_maps[i][object] = stitched
+
+            table = tracks[object].window(head, tracks.num_frames)
+            table.tracker_id = _map_ids(table.tracker_id, id_maps[i][object])
+            tables[object].append(table)
+
+        camera_movement.append(segment["camera_movement"][head:])
+
+    tracks = TrackStore(num_frames, {object: TrackTable.concatenate(num_frames, parts, starts) for object, parts in tables.items()})
+
+    return tracks, np.concatenate(camera_movement)
+
+def process_video_sharded(data: Union[str, bytes], classes: List[int], workers: int=None, overlap: int=25, window_size: int=100, verbose: bool=True,
+                          team_assigner: TeamAssigner=None, tracker_options: Dict=None, ball_interpolator: BallInterpolator=None, 
+                          encoder_options: Dict=None, analysis_path: str=None, output_path: str="output/output.mp4", 
+                          camera_options: Dict=None) -> PlayerBallAssigner:
+    """
+    Splits the video into one segment per worker that overlaps the previous segment by overlap frames.
+    Detection, tracking and camera movement run in a process pool, the segments are stitched into one timeline (stitch_ids, merge_segments).
+    Ball interpolation, team assignment, ball possession and rendering then run on the whole timeline in this process.
+    tracker_options: keyword arguments of the Tracker in the workers (model_path, batch_size, imgsz, threads, keyframes), every worker gets a copy.
+    encoder_options: encoder and its options for the output video (see get_video_writer).
+    analysis_path: save the tracks, possession and camera movement there (see save_analysis) instead of rendering the video.
+    camera_options: settings of the CameraMovementEstimator in the workers, e.g. {"estimator": "median"}.
+    Returns the ball possession of the whole video.
+    """
+    start_time = time.time()
+
+    workers = workers or os.cpu_count()
+    tracker_options = dict(tracker_options or {"model_path": "models/best.pt"})
+    threads = max(1, os.cpu_count() // workers)
+    tracker_options["threads"] = tracker_options.get("threads") or threads
+
+    temp_filename = None
+    if isinstance(data, bytes):
+        # workers open the video on their own
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as f:
+            f.write(data)
+            temp_filename = f.name
+    path = temp_filename or data
+
+    try:
+        num_frames = get_frame_count(path)
+        segment_length = max(overlap + 1, math.ceil(num_frames / workers))
+        starts = list(range(0, num_frames, segment_length)) or [0]
+        ends = starts[1:] + [None]      # frame count of the metadata can be inaccurate, last segment reads to the end
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(threads,)) as executor:
+            futures = [executor.submit(_process_segment, path, classes, max(0, start - overlap), end, overlap if start > 0 else 0, 
+                                       overlap if end is not None else 0, window_size, tracker_options, camera_options or {})
+                       for start, end in zip(starts, ends)]
+            segments = [future.result() for future in futures]
+
+        for segment in segments:
+            metrics.merge(segment["metrics"])      # stage times of the workers add up, wall time is the one of this process
+
+        if verbose:
+            logger.info(f"[Sharding] Detected and tracked {len(segments)} segments with {workers} workers in {time.time() - start_time:.2f} seconds.")
+
+        tracks, camera_movement_per_frame = merge_segments(segments, starts, overlap)
+
+        tracker = Tracker(tracker_options["model_path"], classes, verbose, ball_interpolator=ball_interpolator)
+        tracker.cls_names = segments[0]["cls_names"]
+        tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+        tracker.add_position_to_tracks(tracks)
+        interpolation_tracker = tracker.interpolation_tracker
+
+        frames, fps = stream_video(path, verbose)
+        team_assigner = team_assigner or TeamAssigner()
+        player_assigner = PlayerBallAssigner()
+        camera_movement_estimator = None
+        renderer = OverlayRenderer(in_place=True)      # decoded frames aren't needed after rendering
+
+        def analyze():
+            nonlocal camera_movement_estimator
+            offset = 0
+
+            for window in frame_windows(frames, window_size):
+                if camera_movement_estimator is None:
+                    camera_movement_estimator = CameraMovementEstimator(window[0], classes, verbose)
+                    camera_movement_estimator.adjust_positions_to_tracks(tracks, camera_movement_per_frame)
+
+                window_tracks = tracks.window(offset, offset + len(window))
+                team_assigner.get_teams(window, window_tracks)
+                player_assigner.get_player_and_possession(window_tracks)
+
+                yield offset, window, window_tracks
+
+                offset += len(window)
+
+        def annotate():
+            for offset, window, window_tracks in analyze():
+                tracker.interpolation_tracker = interpolation_tracker[offset:offset+len(window)]
+                yield from renderer.render(window, [tracker.annotation_layer(window_tracks, player_assigner.possession_counts, offset), 
+                                                    camera_movement_estimator.camera_movement_layer(camera_movement_per_frame[offset:offset+len(window)])])
+
+        if analysis_path is not None:
+            # teams and possession still need the frames, but nothing is rendered
+            windows = [(offset, window_tracks) for offset, _, window_tracks in analyze()]
+            save_analysis(analysis_path, concatenate_windows(tracks.num_frames, windows), camera_movement_per_frame, player_assigner, 
+                          interpolation_tracker, fps)
+        else:
+            save_video(annotate(), output_path, fps, verbose, **(encoder_options or {}))
+    finally:
+        if temp_filename is not None:
+            os.remove(temp_filename)
+
+    if verbose:
+        logger.info(f"[Sharding] Processed {tracks.num_frames} frames in {time.time() - start_time:.2f} seconds.")
+
+    return player_assigner
@@ -0,0 +1,158 @@
+from typing import Any, Callable, Iterable, List, Tuple
+import logging
+import queue
+import threading
+import time
+
+_END = object()     # marks the end of the stream in the queues
+
+class StageStats:
+    """
+    Throughput and queue statistics of a pipeline stage.
+    Input wait: stage is starved by the previous stage. Output wait: stage is blocked by the next stage (backpressure).
+    The stage with the most busy time and the least waiting is the bottleneck.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.frames = 0
+        self.busy_time = 0.0
+        self.input_wait_time = 0.0
+        self.output_wait_time = 0.0
+        self.queue_depth_sum = 0
+        self.queue_depth_max = 0
+
+    def log(self, logger: logging.Logger, queue_size: int) -> None:
+        fps = self.frames / self.busy_time if self.busy_time > 0 else 0.0
+        queue_depth_mean = self.queue_depth_sum / self.items if self.items > 0 else 0.0
+
+        logger.info(f"[Pipeline] Stage {self.name}: {self.frames} frames in {self.busy_time:.2f} seconds busy ({fps:.2f} frames/s), "
+                    f"waited {self.input_wait_time:.2f} seconds for input and {self.output_wait_time:.2f} seconds for output, "
+                    f"input queue depth mean {queue_depth_mean:.2f} max {self.queue_depth_max}/{queue_size}.")
+
+class Stage:
+    """
+    Step of the pipeline running in its own thread.
+    function: maps one item of the previous stage to the item for the next stage. None for the source stage.
+    """
+    def __init__(self, name: str, function: Callable[[Any], Any], logger: logging.Logger) -> None:
+        self.name = name
+        self.function = function
+        self.logger = logger
+        self.stats = StageStats(name)
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    # poll so that a failing stage can stop the others instead of blocking forever
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+def _run_source(stage: Stage, source: Iterable, q_out: queue.Queue, stop: threading.Event, errors: List[BaseException]) -> None:
+    stats = stage.stats
+    try:
+        iterator = iter(source)
+        while not stop.is_set():
+            start_time = time.time()
+            item = next(iterator, _END)
+            stats.busy_time += time.time() - start_time
+
+            if item is _END:
+                break
+
+            stats.items += 1
+            stats.frames += len(item)
+
+            start_time = time.time()
+            # item travels with its number of frames for the statistics of the next stages
+            _put(q_out, (len(item), item), stop)
+            stats.output_wait_time += time.time() - start_time
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(q_out, _END, stop)
+
+def _run_stage(stage: Stage, q_in: queue.Queue, q_out: queue.Queue, stop: threading.Event, errors: List[BaseException]) -> None:
+    stats = stage.stats
+    try:
+        while True:
+            stats.queue_depth_max = max(stats.queue_depth_max, q_in.qsize())
+            stats.queue_depth_sum += q_in.qsize()
+
+            start_time = time.time()
+            entry = _get(q_in, stop)
+            stats.input_wait_time += time.time() - start_time
+
+            if entry is _END:
+                break
+
+            num_frames, item = entry
+
+            start_time = time.time()
+            result = stage.function(item)
+            stats.busy_time += time.time() - start_time
+
+            stats.items += 1
+            stats.frames += num_frames
+
+            if q_out is not None:
+                start_time = time.time()
+                _put(q_out, (num_frames, result), stop)
+                stats.output_wait_time += time.time() - start_time
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        if q_out is not None:
+            _put(q_out, _END, stop)
+
+def run_pipeline(source: Tuple[Stage, Iterable], stages: List[Stage], queue_size: int=2, verbose: bool=True) -> List[StageStats]:
+    """
+    Runs the source and every stage concurrently, each in its own thread, connected by bounded queues.
+    A full queue blocks the stage in front of it (backpressure), so at most queue_size items wait between two stages.
+    Items of the source must support len() (number of frames). The result of the last stage is discarded.
+    Decoding, OpenCV and PyTorch release the GIL, so the stages overlap.
+    """
+    source_stage, iterable = source
+    stop = threading.Event()
+    errors = []
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    threads = [threading.Thread(target=_run_source, args=(source_stage, iterable, queues[0], stop, errors), name=source_stage.name, daemon=True)]
+    for i, stage in enumerate(stages):
+        q_out = queues[i+1] if i+1 < len(stages) else None
+        threads.append(threading.Thread(target=_run_stage, args=(stage, queues[i], q_out, stop, errors), name=stage.name, daemon=True))
+
+    start_time = time.time()
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    all_stages = [source_stage] + stages
+
+    if verbose:
+        for stage in all_stages:
+            stage.stats.log(stage.logger, queue_size)
+
+        bottleneck = max(all_stages, key=lambda stage: stage.stats.busy_time)
+        bottleneck.logger.info(f"[Pipeline] Finished in {time.time() - start_time:.2f} seconds, bottleneck stage: {bottleneck.name}.")
+
+    return [stage.stats for stage in all_stages]
@@ -0,0 +1,167 @@
+from typing import Dict, Union, List, Iterator, Tuple
+import logging
+import numpy as np
+import supervision as sv
+from utils import stream_video, frame_windows, get_video_writer, save_video, OverlayRenderer
+from trackers import Tracker, TrackStore, TrackTable, DetectionCache, BallInterpolator
+from team_assignment import TeamAssigner
+from player_ball_assignment import PlayerBallAssigner
+from camera_movement import CameraMovementEstimator
+from .stages import Stage, run_pipeline
+
+class WindowProcessor:
+    """
+    Runs the whole analysis on one window of frames after another.
+    State that spans the whole video (ByteTrack IDs, team colours, camera features, ball possession) is kept between the windows.
+    With the linear ball interpolator, a window is finished one window later, when a ball gap at its end can be closed with the next detection.
+    """
+    def __init__(self, classes: List[int], verbose: bool=True, cache: DetectionCache=None, team_assigner: TeamAssigner=None, tracker: Tracker=None, 
+                 causal: bool=False, camera_options: Dict=None) -> None:
+        """
+        tracker: tracker with custom detection settings (batch size, image size, tuner), else created with the cache.
+        causal: the ball position of a frame only depends on previous frames (live streams), predicted with constant velocity
+                if the ball interpolator of the tracker needs the next frames.
+        camera_options: settings of the CameraMovementEstimator, e.g. {"estimator": "median"}.
+        """
+        self.classes = classes
+        self.verbose = verbose
+        self.causal = causal
+        self.camera_options = camera_options or {}
+
+        self.tracker = tracker or Tracker("models/best.pt", classes, verbose, cache)
+        if causal and not self.tracker.ball_interpolator.causal:
+            self.tracker.ball_interpolator = BallInterpolator("velocity", self.tracker.ball_interpolator.max_gap or 25)
+        self.team_assigner = team_assigner or TeamAssigner()
+        self.player_assigner = PlayerBallAssigner()
+        self.camera_movement_estimator = None
+        self.renderer = OverlayRenderer(in_place=True)
+
+        self.frame_offset = 0        # index of the first frame of the window in the whole video
+        self.pending = None          # (window, tracks) that waits for the ball detections of the next window
+
+    def detect(self, window: List[np.ndarray]) -> List[sv.Detections]:
+        return self.tracker.detect(window)
+
+    def process(self, window: List[np.ndarray]=None, detections: List[sv.Detections]=None) -> List[np.ndarray]:
+        """
+        Returns the annotated frames of the finished windows (see analyze), drawn into the frames of the windows.
+        detections: predictions for the window if they were already computed, else detect() is called.
+        Call it without a window at the end of the video for the last window.
+        """
+        output = []
+
+        for window, tracks, camera_movement_per_frame in self.analyze(window, detections):
+            # the window isn't needed after rendering, all overlays are drawn into its frames in one pass
+            output += self.renderer.render(window, [self.tracker.annotation_layer(tracks, self.player_assigner.possession_counts, self.frame_offset), 
+                                                    self.camera_movement_estimator.camera_movement_layer(camera_movement_per_frame)])
+
+            self.frame_offset += len(window)
+
+        return output
+
+    def analyze(self, window: List[np.ndarray]=None, detections: List[sv.Detections]=None) -> List[Tuple[List[np.ndarray], TrackStore, np.ndarray]]:
+        """
+        Tracks the window and returns the finished windows with their tracks and camera movement, without rendering (used by process()).
+        With the linear ball interpolator, the window waits for the next call (at most one finished window per call),
+        None as window finishes the last one at the end of the video. frame_offset is advanced by the caller.
+        """
+        tracks = None
+        if window is not None:
+            if self.camera_movement_estimator is None:
+                self.camera_movement_estimator = CameraMovementEstimator(window[0], self.classes, self.verbose, **self.camera_options)
+
+            tracks = self.tracker.get_object_tracks(window, detections)
+
+            if self.tracker.ball_interpolator.causal:
+                return [self._finish(window, tracks)]
+
+        finished = [self._finish(*self.pending, tracks["ball"] if tracks is not None else None)] if self.pending is not None else []
+        self.pending = (window, tracks) if window is not None else None
+
+        return finished
+
+    def _finish(self, window: List[np.ndarray], tracks: TrackStore, next_ball_tracks: TrackTable=None) -> Tuple[List[np.ndarray], TrackStore, np.ndarray]:
+        tracks["ball"] = self.tracker.interpolate_ball_positions(tracks["ball"], next_ball_tracks)
+
+        self.tracker.add_position_to_tracks(tracks)
+
+        camera_movement_per_frame = self.camera_movement_estimator.get_camera_movement(window, resume=True)
+        self.camera_movement_estimator.adjust_positions_to_tracks(tracks, camera_movement_per_frame)
+
+        self.team_assigner.get_teams(window, tracks)
+
+        self.player_assigner.get_player_and_possession(tracks)
+
+        return window, tracks, camera_movement_per_frame
+
+def annotate_stream(frames: Iterator[np.ndarray], processor: WindowProcessor, window_size: int=100) -> Iterator[np.ndarray]:
+    """
+    Yields the annotated frames, only one window of frames, tracks and annotated frames is held in memory at a time.
+    """
+    for window in frame_windows(frames, window_size):
+        yield from processor.process(window)
+
+    yield from processor.process()
+
+def process_video_stream(data: Union[str, bytes], classes: List[int], window_size: int=100, verbose: bool=True, cache: DetectionCache=None, team_assigner: TeamAssigner=None, 
+                         tracker: Tracker=None, encoder_options: Dict=None, decode_options: Dict=None, output_path: str="output/output.mp4", 
+                         camera_options: Dict=None) -> WindowProcessor:
+    """
+    Streaming version of process_video: peak memory depends on the window size instead of the length of the video.
+    encoder_options: encoder and its options for the output video (see get_video_writer), OpenCV if None.
+    decode_options: time range, stride, scale and threading of the decoding (see VideoDecoder).
+    camera_options: settings of the CameraMovementEstimator (see WindowProcessor).
+    Returns the processor with the state of the whole video, e.g. the ball possession.
+    """
+    frames, fps = stream_video(data, verbose, **(decode_options or {}))
+
+    processor = WindowProcessor(classes, verbose, cache, team_assigner, tracker, camera_options=camera_options)
+    processor.tracker.set_video(data, decode_options)
+
+    save_video(annotate_stream(frames, processor, window_size), output_path, fps, verbose, **(encoder_options or {}))
+
+    processor.tracker.save_cache()
+
+    return processor
+
+def process_video_pipelined(data: Union[str, bytes], classes: List[int], window_size: int=100, queue_size: int=2, verbose: bool=True, cache: DetectionCache=None, 
+                            team_assigner: TeamAssigner=None, tracker: Tracker=None, encoder_options: Dict=None, decode_options: Dict=None, 
+                            output_path: str="output/output.mp4", camera_options: Dict=None) -> WindowProcessor:
+    """
+    Streaming with decoding, detection, tracking/annotation and encoding as concurrent stages.
+    At most queue_size windows wait between two stages, so peak memory is still bounded by the window size.
+    Per-stage statistics go to the loggers of the stages.
+    """
+    frames, fps = stream_video(data, verbose, **(decode_options or {}))
+
+    processor = WindowProcessor(classes, verbose, cache, team_assigner, tracker, camera_options=camera_options)
+    processor.tracker.set_video(data, decode_options)
+    writer = get_video_writer(output_path, fps, **(encoder_options or {}))
+
+    def write(window: List[np.ndarray]) -> None:
+        for frame in window:
+            writer.write(frame)
+
+    memory_access_logger = logging.getLogger("memory_access")
+    tracker_logger = logging.getLogger("tracker")
+
+    try:
+        run_pipeline(
+            source=(Stage("decode", None, memory_access_logger), frame_windows(frames, window_size)),
+            stages=[
+                Stage("detect", lambda window: (window, processor.detect(window)), tracker_logger),
+                Stage("track_annotate", lambda item: processor.process(*item), tracker_logger),
+                Stage("encode", write, memory_access_logger),
+            ],
+            queue_size=queue_size,
+            verbose=verbose
+        )
+        write(processor.process())     # last window, held back for the ball interpolation
+    finally:
+        # also if a stage failed: no ffmpeg process is left behind and the written frames are playable
+        if writer.num_frames > 0:
+            writer.release()
+
+    processor.tracker.save_cache()
+
+    return processor
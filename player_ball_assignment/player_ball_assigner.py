@@ -1,48 +1,115 @@
-from typing import List, Dict
+from typing import Dict, List
 import numpy as np
-from utils import get_center_of_bbox, get_distance
+from utils import metrics
+from trackers import TrackStore, TrackTable
 
 class PlayerBallAssigner():
+    """
+    Assigns the ball to the closest player in every frame and derives the ball possession per team.
+    All frames are computed at once on the columns of the track store.
+    """
     def __init__(self) -> None:
         self.max_player_ball_distance = 70  # pixels
         self.ball_possession = None
+        self.possession_counts = None       # frames in possession of team 1 and team 2 up to every frame (prefix sums), for the statistics overlay
 
-    def assign_ball_to_player(self, player_tracks: Dict, ball_bbox: List[float]) -> int:
-        ball_position = get_center_of_bbox(ball_bbox)
+    def assign_ball_to_players(self, players: TrackTable, ball: TrackTable) -> np.ndarray:
+        """
+        Row of the player closest to the ball in every frame, -1 if no player is close enough.
+        Computed for all frames at once.
+        """
+        # ball center per frame, NaN if there is no ball position in the frame
+        ball_positions = np.full((players.num_frames, 2), np.nan)
+        ball_positions[ball.frame] = ((ball.bbox[:, [0, 1]] + ball.bbox[:, [2, 3]]) / 2).astype(int)
 
-        min_distance = float("inf")     # used to find player closest to the ball
-        assigned_player = -1
-        
-        for player_id, player in player_tracks.items():
-            player_bbox = player["bbox"]
+        ball_position = ball_positions[players.frame]   # ball position in the frame of every player row
 
-            distance_left_foot = get_distance((player_bbox[0], player_bbox[3]), ball_position)   # assumption that foot is in the corner of the bbox
-            distance_right_foot = get_distance((player_bbox[2], player_bbox[3]), ball_position)
+        x1, _, x2, y2 = players.bbox.T
+        # assumption that foot is in the corner of the bbox, squared distances: no square root needed to compare
+        distance_y = (y2 - ball_position[:, 1]) ** 2
+        distance = np.minimum((x1 - ball_position[:, 0]) ** 2, (x2 - ball_position[:, 0]) ** 2) + distance_y     # closer foot
 
-            distance = min(distance_left_foot, distance_right_foot)
+        close = np.flatnonzero(distance < self.max_player_ball_distance ** 2)   # False for NaN: no ball in the frame
 
-            if distance < self.max_player_ball_distance:
-                if distance < min_distance:
-                    min_distance = distance
-                    assigned_player = player_id
+        # closest player per frame: sort close rows by frame, then distance, and take the first row of every frame
+        close = close[np.lexsort((distance[close], players.frame[close]))]
+        frames, first = np.unique(players.frame[close], return_index=True)
 
-        return assigned_player
+        assigned_rows = np.full(players.num_frames, -1)
+        assigned_rows[frames] = close[first]
+
+        return assigned_rows
     
-    def get_player_and_possession(self, tracks: Dict[str, List[Dict]]) -> None:
-        ball_possession = []
-
-        for frame_num, player in enumerate(tracks["players"]):
-            ball_bbox = tracks["ball"][frame_num][1]["bbox"]    # tracker_id 1
-            assigned_player = self.assign_ball_to_player(player, ball_bbox)
-
-            if assigned_player != -1:
-                # add new key has_ball 
-                tracks["players"][frame_num][assigned_player]["has_ball"] = True
-                ball_possession.append(tracks["players"][frame_num][assigned_player]["team"])    # current team in possesion in this frame
-            elif len(ball_possession) > 0:
-                ball_possession.append(ball_possession[-1])   # if ball not close to a player (e.g. pass played), last team in possesion
-            
-        # ball possession counter in ball_possession_box() requires numpy array
-        ball_possession = np.array(ball_possession)
-
-        self.ball_possession = ball_possession
\ No newline at end of file
+    @metrics.timed("possession", lambda self, tracks: tracks.num_frames)
+    def get_player_and_possession(self, tracks: TrackStore) -> None:
+        """
+        Repeated calls (streaming) append to the ball possession of the previous calls.
+        Ball possession: team in possession per frame, 0 before any team had the ball.
+        """
+        players = tracks["players"]
+
+        assigned_rows = self.assign_ball_to_players(players, tracks["ball"])
+        assigned = assigned_rows != -1
+
+        players.has_ball[assigned_rows[assigned]] = True
+
+        ball_possession = np.zeros(players.num_frames, dtype=int)
+        ball_possession[assigned] = players.team[assigned_rows[assigned]]    # current team in possession in this frame
+
+        # if ball not close to a player (e.g. pass played), last team in possession: forward fill with the last frame with a team
+        last_possession_frame = np.maximum.accumulate(np.where(ball_possession > 0, np.arange(len(ball_possession)), 0))
+        ball_possession = ball_possession[last_possession_frame]
+
+        if self.ball_possession is not None and len(self.ball_possession) > 0:
+            ball_possession[ball_possession == 0] = self.ball_possession[-1]    # last team in possession of the previous call
+
+        possession_counts = np.stack([np.cumsum(ball_possession == 1), np.cumsum(ball_possession == 2)], axis=1)
+
+        if self.ball_possession is not None:
+            if len(self.possession_counts) > 0:
+                possession_counts += self.possession_counts[-1]     # continue the counts of the previous call
+            ball_possession = np.concatenate([self.ball_possession, ball_possession])
+            possession_counts = np.concatenate([self.possession_counts, possession_counts])
+
+        self.ball_possession = ball_possession
+        self.possession_counts = possession_counts
+
+    def get_possession_spells(self) -> List[Dict[str, int]]:
+        """
+        Timeline of the ball possession: consecutive frames with the same team in possession.
+        end_frame is inclusive, frames before any team had the ball are not part of a spell.
+        """
+        if self.ball_possession is None or len(self.ball_possession) == 0:
+            return []
+
+        # a spell starts where the team changes
+        starts = np.flatnonzero(np.diff(self.ball_possession, prepend=-1) != 0)
+        ends = np.append(starts[1:], len(self.ball_possession)) - 1
+
+        return [{"team": int(self.ball_possession[start]), "start_frame": int(start), "end_frame": int(end), "num_frames": int(end - start + 1)}
+                for start, end in zip(starts, ends) if self.ball_possession[start] != 0]
+
+    def get_possession_stats(self) -> Dict[str, np.ndarray]:
+        """
+        Per-frame statistics table: team in possession, frames in possession and possession share (in %) of both teams up to the frame.
+        """
+        team_1_frames, team_2_frames = self.possession_counts.T
+        total = np.maximum(team_1_frames + team_2_frames, 1)    # 0 % before any team had the ball
+
+        return {
+            "frame": np.arange(len(self.ball_possession)),
+            "team_in_possession": self.ball_possession,
+            "team_1_frames": team_1_frames,
+            "team_2_frames": team_2_frames,
+            "team_1_possession": 100 * team_1_frames / total,
+            "team_2_possession": 100 * team_2_frames / total
+        }
+
+    def save_possession_stats(self, path: str) -> None:
+        """
+        Writes the per-frame statistics table as CSV.
+        """
+        stats = self.get_possession_stats()
+
+        np.savetxt(path, np.column_stack(list(stats.values())), delimiter=",", header=",".join(stats.keys()), comments="", 
+                   fmt=["%d", "%d", "%d", "%d", "%.2f", "%.2f"])
@@ -1,45 +1,115 @@
-from typing import List, Dict
+from typing import List, Tuple
+from collections import deque
 import numpy as np
-from sklearn.cluster import KMeans
+import cv2
+from utils import metrics
+from trackers import TrackStore, TrackTable
+from .team_model import TeamModel
 
 class TeamAssigner:
-    def __init__(self) -> None:
+    """
+    Assigns players to 2 teams by the colour of their shirts.
+    Shirt colours of many players are extracted at once with a vectorized 2-means on downsampled crops.
+    update_interval: incremental mode, every update_interval frames the shirt colours of all players update the team model and vote for the team of their track.
+                     None: the teams are fitted once on the first frame and fixed per player ID.
+    vote_window: in incremental mode, the team of a track is the majority of its last vote_window votes.
+    team_model: saved TeamModel to resume the incremental mode without fitting the teams again.
+    """
+    def __init__(self, crop_size: int=16, iterations: int=10, update_interval: int=None, vote_window: int=15, team_model: TeamModel=None) -> None:
         self.team_colours = {}   # key: team_id (1 or 2), value: colour
         self.player_team_dict = {}      # key: player_id, value: team_id
+        self.kmeans = None
 
-    def get_clusters(self, image: np.ndarray) -> KMeans:
-        image_2d = image.reshape(-1, 3)
+        self.crop_size = crop_size      # shirt crops are resized to crop_size x crop_size pixels
+        self.iterations = iterations    # fixed number of 2-means iterations
 
-        kmeans = KMeans(n_clusters=2, init="k-means++", random_state=0).fit(image_2d)
+        self.update_interval = update_interval if update_interval or team_model is None else 10
+        self.vote_window = vote_window
+        self.team_model = team_model
+        self.player_votes = {}          # key: player_id, value: last team votes
+        self.frame_offset = 0           # index of the first frame of the next get_teams call in the whole video
 
-        return kmeans
+        if team_model is not None:
+            self.team_colours = {1: team_model.centres[0], 2: team_model.centres[1]}
 
-    def get_player_colour(self, frame: np.ndarray, bbox: List[float]) -> np.ndarray:
-        image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-        top_half_image = image[0:int(image.shape[0]/2), :]  # only select shirt
+    def get_shirt_crop(self, frame: np.ndarray, bbox: np.ndarray) -> np.ndarray:
+        # bbox clipped to the frame and at least 1 pixel
+        x1, x2 = np.clip([int(bbox[0]), int(bbox[2])], 0, frame.shape[1] - 1)
+        y1, y2 = np.clip([int(bbox[1]), int(bbox[3])], 0, frame.shape[0] - 1)
+        image = frame[y1:max(y2, y1+1), x1:max(x2, x1+1)]
 
-        kmeans = self.get_clusters(top_half_image)
-        labels = kmeans.labels_ # 0 or 1
+        top_half_image = image[0:max(1, int(image.shape[0]/2)), :]  # only select shirt
+
+        return cv2.resize(top_half_image, (self.crop_size, self.crop_size), interpolation=cv2.INTER_AREA)
+
+    def get_clusters(self, images: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        2-means of the pixels of every image at once.
+        images: K x H x W x 3
+        Returns the cluster centres (K x 2 x 3) and the labels (K x H x W).
+        """
+        pixels = images.reshape(len(images), -1, 3).astype(np.float32)    # K x P x 3
+        pixel_sums = pixels.sum(axis=1)
+
+        # start: mean of the corners (probably background) and the center pixel (probably shirt)
+        corners = images[:, [0, 0, -1, -1], [0, -1, 0, -1]].astype(np.float32)    # K x 4 x 3
+        center = images[:, images.shape[1] // 2, images.shape[2] // 2].astype(np.float32)
+        centres = np.stack([corners.mean(axis=1), center], axis=1)                 # K x 2 x 3
+
+        for _ in range(self.iterations):
+            in_cluster_1 = self._nearest_cluster(pixels, centres)[:, :, None]      # K x P x 1
+
+            num_pixels_1 = in_cluster_1.sum(axis=1)
+            num_pixels_0 = pixels.shape[1] - num_pixels_1
+            sums_1 = np.einsum("kpc,kpo->kc", pixels, in_cluster_1.astype(np.float32))
+            sums_0 = pixel_sums - sums_1
+
+            # empty cluster keeps its centre
+            centres[:, 0] = np.where(num_pixels_0 > 0, sums_0 / np.maximum(num_pixels_0, 1), centres[:, 0])
+            centres[:, 1] = np.where(num_pixels_1 > 0, sums_1 / np.maximum(num_pixels_1, 1), centres[:, 1])
+
+        labels = self._nearest_cluster(pixels, centres).astype(int)
+
+        return centres, labels.reshape(images.shape[:3])
+
+    @staticmethod
+    def _nearest_cluster(pixels: np.ndarray, centres: np.ndarray) -> np.ndarray:
+        """
+        True where a pixel is closer to centre 1 than to centre 0.
+        |p - c1|^2 < |p - c0|^2  <=>  2 p * (c1 - c0) > |c1|^2 - |c0|^2
+        """
+        direction = centres[:, 1] - centres[:, 0]                                  # K x 3
+        threshold = (centres[:, 1] ** 2).sum(axis=1) - (centres[:, 0] ** 2).sum(axis=1)
+        return 2 * np.einsum("kpc,kc->kp", pixels, direction) > threshold[:, None]
+
+    def get_player_colours(self, crops: List[np.ndarray]) -> np.ndarray:
+        """
+        Shirt colour of every crop (get_shirt_crop), all crops in one batch.
+        """
+        if len(crops) == 0:
+            return np.zeros((0, 3), dtype=np.float32)
+
+        centres, labels = self.get_clusters(np.stack(crops))
 
-        # reshape labels back to image shape
-        clustered_image = labels.reshape(top_half_image.shape[0], top_half_image.shape[1])
         # look at corner points to check which cluster is the background
-        corner_clusters = [clustered_image[0, 0], clustered_image[0, -1], clustered_image[-1, 0], clustered_image[-1, -1]]
-        background_cluster = max(corner_clusters, key=corner_clusters.count)    # cluster with most appearances in the corners (assumption that corners are background)
+        corner_clusters = labels[:, [0, 0, -1, -1], [0, -1, 0, -1]]     # K x 4
+        # cluster with most appearances in the corners (assumption that corners are background), tie: cluster of the first corner
+        num_corners_1 = corner_clusters.sum(axis=1)
+        background_cluster = np.where(num_corners_1 == 2, corner_clusters[:, 0], (num_corners_1 > 2).astype(int))
         player_cluster = 1 - background_cluster
 
-        player_colour = kmeans.cluster_centers_[player_cluster] # "mean" colour of the player's shirt cluster
+        player_colours = centres[np.arange(len(crops)), player_cluster]     # "mean" colour of the player's shirt cluster
+
+        return player_colours
 
-        return player_colour
+    def get_player_colour(self, frame: np.ndarray, bbox: np.ndarray) -> np.ndarray:
+        return self.get_player_colours([self.get_shirt_crop(frame, bbox)])[0]
 
-    def assign_team_colour(self, frame: np.ndarray, tracks: Dict[str, List[Dict]]) -> None:
-        player_colours = []
+    def assign_team_colour(self, frame: np.ndarray, bboxes: np.ndarray) -> None:
+        from sklearn.cluster import KMeans     # slow to import, only needed for the first frame
 
         # get shirt colour of the players in the frame
-        for _, player in tracks.items():
-            bbox = player["bbox"]
-            player_colour = self.get_player_colour(frame, bbox)
-            player_colours.append(player_colour)
+        player_colours = self.get_player_colours([self.get_shirt_crop(frame, bbox) for bbox in bboxes])
 
         # of all slightly different colours, determine the 2 "mean" colours as team colours
         kmeans = KMeans(n_clusters=2, init="k-means++", random_state=0, n_init=10).fit(player_colours)
@@ -64,19 +134,103 @@ class TeamAssigner:
         
         return team_id
     
-    def get_teams(self, frames: np.ndarray, tracks: Dict[str, List[Dict]]) -> None:
+    def get_majority_team(self, player_id: int) -> int:
+        votes = self.player_votes[player_id]
+        team_1_votes = votes.count(1)
+        team_2_votes = len(votes) - team_1_votes
+
+        if team_1_votes == team_2_votes:    # tie: keep the team, new track: last vote
+            return self.player_team_dict.get(player_id, votes[-1])
+
+        return 1 if team_1_votes > team_2_votes else 2
+
+    def get_teams_incremental(self, frames: np.ndarray, players: TrackTable) -> None:
+        """
+        Shirt colours are sampled every update_interval frames and at the first appearance of a player ID.
+        Every sample votes for the team of its track and updates the team model.
+        Rows up to the next sample get the majority team of their track.
+        """
+        if len(players) == 0:
+            return
+
+        if self.team_model is None:
+            # first frame with players
+            first_frame = players.frame[0]
+            self.assign_team_colour(frames[first_frame], players.bbox[players.frame_slice(first_frame)])
+            self.team_model = TeamModel(self.kmeans.cluster_centers_)
+
+        # sample frames: every update_interval frames in the whole video and frames where a new player ID appears
+        player_ids, first_rows = np.unique(players.tracker_id, return_index=True)
+        new_frames = players.frame[[row for player_id, row in zip(player_ids, first_rows) if player_id not in self.player_votes]]
+        interval_frames = np.flatnonzero((np.arange(players.num_frames) + self.frame_offset) % self.update_interval == 0)
+        sample_frames = np.union1d(new_frames, interval_frames)
+
+        # shirt colours of all samples in one batch
+        sample_rows = np.flatnonzero(np.isin(players.frame, sample_frames))
+        colours = self.get_player_colours([self.get_shirt_crop(frames[players.frame[row]], players.bbox[row]) for row in sample_rows])
+
+        # segments from one sample frame to the next, frames before the first sample keep the current teams
+        boundaries = np.union1d(sample_frames, [0, players.num_frames])
+        num_sampled = 0
+
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            rows = players.frame_slice(start)
+            num_rows = rows.stop - rows.start
+
+            if start in sample_frames and num_rows > 0:
+                sample_colours = colours[num_sampled:num_sampled + num_rows]
+                num_sampled += num_rows
+
+                for player_id, team in zip(players.tracker_id[rows], self.team_model.predict(sample_colours)):
+                    self.player_votes.setdefault(player_id, deque(maxlen=self.vote_window)).append(team)
+                    self.player_team_dict[player_id] = self.get_majority_team(player_id)
+
+                self.team_model.update(sample_colours)
+                self.team_colours = {1: self.team_model.centres[0], 2: self.team_model.centres[1]}
+
+            # team of every row in the segment by looking up the team of its player ID
+            segment = slice(players.frame_offsets[start], players.frame_offsets[end])
+            segment_ids, inverse = np.unique(players.tracker_id[segment], return_inverse=True)
+            teams = np.array([self.player_team_dict[player_id] for player_id in segment_ids], dtype=np.int8)
+            players.team[segment] = teams[inverse]
+            players.team_colour[segment] = self.team_model.centres[players.team[segment] - 1]
+
+    def save_team_model(self, path: str) -> None:
+        if self.team_model is not None:
+            self.team_model.save(path)
+
+    @metrics.timed("team_assignment", lambda self, frames, tracks: len(frames))
+    def get_teams(self, frames: np.ndarray, tracks: TrackStore) -> None:
         """
         Called in main.
-        Adds keys to tracks.
+        Fills the team columns of the player tracks.
+        Team colours are fitted once, repeated calls (streaming) reuse them.
         """
-        # only assign teams if players found/player tracking selected
-        if len(tracks["players"][0]) > 0:  # default empty: [{}]
-            self.assign_team_colour(frames[0], tracks["players"][0])
+        players = tracks["players"]
 
-            for frame_num, player in enumerate(tracks["players"]):
-                for player_id, player_track in player.items():
-                    team = self.get_player_team(frames[frame_num], player_track["bbox"], player_id)
+        if self.update_interval:
+            self.get_teams_incremental(frames, players)
+            self.frame_offset += players.num_frames
+            return
 
-                    # add new keys team and team_colour
-                    tracks["players"][frame_num][player_id]["team"] = team
-                    tracks["players"][frame_num][player_id]["team_colour"] = self.team_colours[team]
+        # only assign teams if players found/player tracking selected
+        if self.kmeans is None and len(players.frame_rows(0)) > 0:
+            self.assign_team_colour(frames[0], players.bbox[players.frame_slice(0)])
+
+        if self.kmeans is not None and len(players) > 0:
+            # team of a player is determined at the first appearance of the player ID, rows are sorted by frame
+            player_ids, first_rows = np.unique(players.tracker_id, return_index=True)
+
+            # shirt colours of all new player IDs in one batch, known IDs are cached in player_team_dict
+            new = [i for i, player_id in enumerate(player_ids) if player_id not in self.player_team_dict]
+            if new:
+                crops = [self.get_shirt_crop(frames[players.frame[first_rows[i]]], players.bbox[first_rows[i]]) for i in new]
+                new_teams = self.kmeans.predict(self.get_player_colours(crops)) + 1     # + 1, because team_id 1 or 2, not 0 or 1
+                self.player_team_dict.update(zip(player_ids[new], new_teams))
+
+            # team of every row by looking up the team of its player ID
+            teams = np.array([self.player_team_dict[player_id] for player_id in player_ids])
+            players.team = teams[np.searchsorted(player_ids, players.tracker_id)].astype(np.int8)
+
+            team_colours = np.array([self.team_colours[1], self.team_colours[2]])
+            players.team_colour = team_colours[players.team - 1].astype(np.float32)
@@ -0,0 +1,65 @@
+from typing import Dict
+import json
+from collections import deque
+import numpy as np
+
+class TeamModel:
+    """
+    Online 2-means of shirt colours: the team colours follow drifting colours (lighting, shadows) over a long match.
+    Keeps a bounded reservoir of the most recent player colours and refits the centres on it, starting from the current centres,
+    so team 1 stays team 1.
+    Serialisable with save/load to resume without refitting over the footage.
+    """
+    def __init__(self, centres: np.ndarray, reservoir_size: int=500, iterations: int=3) -> None:
+        self.centres = np.asarray(centres, dtype=np.float64).reshape(2, 3)    # index 0: team 1, index 1: team 2
+        self.reservoir = deque(maxlen=reservoir_size)
+        self.reservoir_size = reservoir_size
+        self.iterations = iterations
+
+    def predict(self, colours: np.ndarray) -> np.ndarray:
+        """
+        Team ID (1 or 2) of every colour.
+        """
+        colours = np.asarray(colours, dtype=np.float64).reshape(-1, 3)
+        distances = ((colours[:, None, :] - self.centres[None, :, :]) ** 2).sum(axis=2)
+
+        return distances.argmin(axis=1) + 1
+
+    def update(self, colours: np.ndarray) -> None:
+        """
+        Adds the colours to the reservoir (oldest are dropped) and moves the centres to the means of the reservoir clusters.
+        """
+        self.reservoir.extend(np.asarray(colours, dtype=np.float64).reshape(-1, 3))
+
+        reservoir = np.array(self.reservoir)
+
+        for _ in range(self.iterations):
+            labels = self.predict(reservoir) - 1
+
+            for team in (0, 1):
+                if (labels == team).any():     # empty cluster keeps its centre
+                    self.centres[team] = reservoir[labels == team].mean(axis=0)
+
+    def to_dict(self) -> Dict:
+        return {
+            "centres": self.centres.tolist(),
+            "reservoir": np.array(self.reservoir).tolist(),
+            "reservoir_size": self.reservoir_size,
+            "iterations": self.iterations
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> "TeamModel":
+        team_model = cls(state["centres"], state["reservoir_size"], state["iterations"])
+        team_model.reservoir.extend(np.asarray(state["reservoir"], dtype=np.float64).reshape(-1, 3))
+
+        return team_model
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "TeamModel":
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
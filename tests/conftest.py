@@ -0,0 +1,6 @@
+import os
+import sys
+
+# tests run from the root of the project like main.py (logs/, models/, cache/)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.chdir(os.path.join(os.path.dirname(__file__), ".."))
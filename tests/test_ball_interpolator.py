@@ -0,0 +1,45 @@
+import numpy as np
+from trackers import BallInterpolator, TrackTable
+
+def ball_tracks(num_frames, frames, offset=0):
+    """
+    Ball moving along a line, detected in the frames (offset: first frame of the window in the video).
+    """
+    frames = np.array(frames, dtype=int)
+    position = (frames + offset).astype(float)
+    bbox = np.stack([position * 10, position * 5, position * 10 + 8, position * 5 + 8], axis=1).reshape(-1, 4)
+    return TrackTable(num_frames, frames, np.ones(len(frames)), bbox)
+
+def split_fill(interpolator, detected, num_frames, window_size):
+    """
+    Fills window by window like WindowProcessor: every window with the detections of the next one.
+    """
+    windows = [ball_tracks(min(window_size, num_frames - start), [frame - start for frame in detected if start <= frame < start + window_size], start)
+               for start in range(0, num_frames, window_size)]
+
+    filled = []
+    for i, window in enumerate(windows):
+        tracks = interpolator.fill(window, windows[i + 1] if i + 1 < len(windows) else None)
+        filled.append((i * window_size + tracks.frame, tracks.bbox, tracks.interpolated))
+
+    return [np.concatenate(column) for column in zip(*filled)]
+
+def test_gap_on_window_boundary_matches_single_pass():
+    detected = [0, 1, 2, 3, 4, 5, 6, 15, 16, 17, 18, 19]      # gap 7 to 14, windows of 10 frames
+    single = BallInterpolator().fill(ball_tracks(20, detected))
+
+    frames, bbox, interpolated = split_fill(BallInterpolator(), detected, 20, 10)
+
+    np.testing.assert_array_equal(frames, single.frame)
+    np.testing.assert_allclose(bbox, single.bbox)
+    np.testing.assert_array_equal(interpolated, single.interpolated)
+
+def test_gap_on_window_boundary_max_gap():
+    detected = [0, 1, 2, 3, 4, 5, 6, 15, 16, 17, 18, 19]      # gap of 8 frames
+    for max_gap in (5, 8):
+        single = BallInterpolator(max_gap=max_gap).fill(ball_tracks(20, detected))
+
+        frames, bbox, _ = split_fill(BallInterpolator(max_gap=max_gap), detected, 20, 10)
+
+        np.testing.assert_array_equal(frames, single.frame)
+        np.testing.assert_allclose(bbox, single.bbox)
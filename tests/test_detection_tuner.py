@@ -0,0 +1,40 @@
+import numpy as np
+from trackers.detection_tuner import DetectionTuner
+
+def fake_trial(model_path, threads, frames, batch_size, imgsz, conf, device):
+    """
+    Needs imgsz * batch_size MB, faster with larger batches.
+    """
+    return float(batch_size), imgsz * batch_size * 1024**2
+
+def test_configurations_over_budget_skipped(monkeypatch, tmp_path):
+    monkeypatch.setattr(DetectionTuner, "_trial", staticmethod(fake_trial))
+    tuner = DetectionTuner(str(tmp_path / "config.json"), batch_sizes=(1, 4), image_sizes=(640, 1280), memory_budget_mb=1000, 
+                           target_fps=0, sample_frames=4, verbose=False)
+
+    # 1280 is over the budget with every batch size, 640 only with batch size 4 (2560 MB)
+    config = tuner.tune("model.pt", [np.zeros((8, 8, 3), dtype=np.uint8)], "cpu", 0.15)
+
+    assert config == {"batch_size": 1, "imgsz": 640}
+
+def test_cpu_memory_of_every_configuration_measured_on_its_own(tmp_path):
+    frames = [np.full((360, 640, 3), 100, dtype=np.uint8)]
+    model_path = "yolov8n.yaml"      # untrained model built from the config, no weights needed
+
+    # large configuration first, like the tuner: its memory must not hide or inflate the small one
+    _, large = DetectionTuner._trial(model_path, None, frames * 8, 8, 1280, 0.15, "cpu")
+    _, small = DetectionTuner._trial(model_path, None, frames * 8, 8, 160, 0.15, "cpu")
+    assert 100 * 1024**2 < small < large      # footprint of the whole process, not the growth since the previous trial
+
+    budget_mb = (small + large) // 2 // 1024**2
+    tuner = DetectionTuner(str(tmp_path / "config.json"), batch_sizes=(8,), image_sizes=(160, 1280), memory_budget_mb=budget_mb, 
+                           target_fps=0, sample_frames=8, verbose=False)
+
+    assert tuner.tune(model_path, frames, "cpu", 0.15) == {"batch_size": 8, "imgsz": 160}
+
+def test_cache_key_depends_on_budget_and_candidates(tmp_path):
+    path = str(tmp_path / "config.json")
+    keys = {DetectionTuner(path).get_key("hash", "cpu"), DetectionTuner(path, memory_budget_mb=500).get_key("hash", "cpu"),
+            DetectionTuner(path, batch_sizes=(1, 4)).get_key("hash", "cpu"), DetectionTuner(path, target_fps=10).get_key("hash", "cpu")}
+
+    assert len(keys) == 4
@@ -0,0 +1,36 @@
+import sqlite3
+import pytest
+from pipeline import JobQueue
+from benchmarks.synthetic_footage import SyntheticMatch
+
+@pytest.fixture
+def queue(tmp_path):
+    video_path = str(tmp_path / "clip.mp4")
+    SyntheticMatch(320, 180, 5).write(video_path)
+    queue = JobQueue(str(tmp_path / "jobs" / "jobs.db"))
+    queue.video_path = video_path
+    return queue
+
+def test_requeue_only_jobs_of_stopped_workers(queue):
+    running_id = queue.submit(queue.video_path, [0])
+    orphan_id = queue.submit(queue.video_path, [0])
+    assert queue.claim()["id"] == running_id
+    assert queue.claim()["id"] == orphan_id
+
+    # worker of the orphan is gone (pid of a process that doesn't exist anymore)
+    with sqlite3.connect(queue.path) as connection:
+        connection.execute("UPDATE jobs SET owner_pid = ? WHERE id = ?", (2**22 + 1, orphan_id))
+
+    assert queue.requeue_running() == [orphan_id]
+    assert queue.status(running_id)["status"] == "running"
+    assert queue.status(orphan_id)["status"] == "queued"
+
+def test_database_without_owner_columns(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute("""CREATE TABLE jobs (
+            id TEXT PRIMARY KEY, status TEXT, classes TEXT, options TEXT, input_path TEXT, output_path TEXT, metrics_path TEXT,
+            num_frames INTEGER, progress REAL, error TEXT, submitted REAL, started REAL, finished REAL)""")
+        connection.execute("INSERT INTO jobs VALUES ('old', 'running', '[0]', '{}', 'in.mp4', 'out.mp4', 'metrics.json', 5, 0.5, NULL, 0, 0, NULL)")
+
+    assert JobQueue(path).requeue_running() == ["old"]
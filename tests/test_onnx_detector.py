@@ -0,0 +1,35 @@
+import os
+import shutil
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+
+MODEL_PATH = "models/best.pt"
+
+def boxes(results):
+    data = results[0].boxes.data.cpu().numpy()
+    return data[np.lexsort((data[:, 1], data[:, 0], data[:, 5]))]      # NMS order can differ for equal confidences
+
+def test_onnx_matches_pytorch(tmp_path):
+    if not os.path.isfile(MODEL_PATH) or os.path.getsize(MODEL_PATH) == 0:
+        pytest.skip(f"No model weights at {MODEL_PATH}.")
+
+    import ultralytics
+    from trackers import OnnxDetector
+    from benchmarks.synthetic_footage import SyntheticMatch
+
+    # exported next to a copy, the models directory stays untouched
+    model_path = str(tmp_path / "model.pt")
+    shutil.copy(MODEL_PATH, model_path)
+    detector = OnnxDetector(OnnxDetector.export(model_path, verbose=False))
+    model = ultralytics.YOLO(model_path)
+
+    frame = SyntheticMatch(1280, 720, 1).frame(0)
+    expected = boxes(model.predict(frame, conf=0.1, verbose=False, device="cpu"))
+    actual = boxes(detector.predict(frame, conf=0.1))
+
+    assert len(actual) == len(expected)
+    np.testing.assert_allclose(actual[:, :4], expected[:, :4], atol=1.0)     # pixels
+    np.testing.assert_allclose(actual[:, 4], expected[:, 4], atol=0.01)
+    np.testing.assert_array_equal(actual[:, 5], expected[:, 5])
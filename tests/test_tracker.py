@@ -0,0 +1,39 @@
+import numpy as np
+from trackers import Tracker, TrackStore, TrackTable
+from utils import OverlayRenderer, options
+
+NUM_FRAMES = 60
+WINDOW_SIZE = 20
+
+def ball_tracks():
+    """
+    Ball in every frame, detected in 0 to 4 and 45 to 59, interpolated in between (40 frames over the window boundaries).
+    """
+    frames = np.arange(NUM_FRAMES)
+    bbox = np.stack([frames + 10, np.full(NUM_FRAMES, 20), frames + 20, np.full(NUM_FRAMES, 30)], axis=1).astype(np.float32)
+    tracks = TrackStore(NUM_FRAMES, {object: TrackTable(NUM_FRAMES, np.zeros(0, dtype=int), np.zeros(0), np.zeros((0, 4))) for object in ("players", "referees")})
+    tracks["ball"] = TrackTable(NUM_FRAMES, frames, np.ones(NUM_FRAMES), bbox)
+    interpolated = (frames >= 5) & (frames < 45)
+
+    return tracks, interpolated
+
+def render(tracker, tracks, interpolated, window_size):
+    frames = []
+    for start in range(0, NUM_FRAMES, window_size):
+        end = min(start + window_size, NUM_FRAMES)
+        tracker.interpolation_tracker = interpolated[start:end]
+        window = [np.zeros((64, 96, 3), dtype=np.uint8) for _ in range(end - start)]
+        frames += OverlayRenderer(in_place=True).render(window, [tracker.annotation_layer(tracks.window(start, end), np.zeros((NUM_FRAMES, 2)), start)])
+
+    return frames
+
+def test_long_interpolated_gap_hidden_across_windows():
+    tracks, interpolated = ball_tracks()
+
+    single_pass = render(Tracker("models/best.pt", [options["ball"]], False), tracks, interpolated, NUM_FRAMES)
+    streaming = render(Tracker("models/best.pt", [options["ball"]], False), tracks, interpolated, WINDOW_SIZE)
+
+    drawn = [bool(frame.any()) for frame in single_pass]
+    assert drawn[30] is False and drawn[50] is True      # hidden after 25 interpolated frames, drawn again with a detection
+    for single_pass_frame, streaming_frame in zip(single_pass, streaming):
+        np.testing.assert_array_equal(streaming_frame, single_pass_frame)
@@ -0,0 +1,16 @@
+import pytest
+from utils import read_video
+from benchmarks.synthetic_footage import SyntheticMatch
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    SyntheticMatch(320, 180, 12).write(path, fps=25)
+    return path
+
+@pytest.mark.parametrize("stride, fps, num_frames", [(1, 25, 12), (2, 12.5, 6), (3, 25 / 3, 4)])
+def test_stride_keeps_fractional_fps(clip, stride, fps, num_frames):
+    frames, decoded_fps, _, _ = read_video(clip, False, stride=stride)
+
+    assert len(frames) == num_frames
+    assert decoded_fps == pytest.approx(fps)
@@ -1 +1,25 @@
-from .tracker import Tracker
\ No newline at end of file
+import importlib
+
+# exports and their modules, imported on first access: the light classes (e.g. TrackStore) don't load ultralytics, torch and supervision
+_exports = {
+    "Tracker": ".tracker",
+    "TrackStore": ".track_store",
+    "TrackTable": ".track_store",
+    "DetectionCache": ".detection_cache",
+    "get_hash": ".detection_cache",
+    "DetectionTuner": ".detection_tuner",
+    "OnnxDetector": ".onnx_detector",
+    "load_model": ".model_registry",
+    "register_model": ".model_registry",
+    "BallInterpolator": ".ball_interpolator",
+    "BallRoiDetector": ".ball_roi",
+    "KeyframeDetector": ".keyframe_detector"
+}
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_exports[name], __name__), name)
+
+def __dir__():
+    return list(_exports)
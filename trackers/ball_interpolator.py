@@ -0,0 +1,138 @@
+import numpy as np
+from .track_store import TrackTable
+
+class BallInterpolator:
+    """
+    Fills the frames without a ball detection, for a whole video at once or window by window (state is kept between the fill calls).
+    method: "linear" interpolates between the detections before and after a gap, before the first detection the first one is used
+            and after the last detection the last one is held (needs the frames after the gap, offline and streaming).
+            "velocity" continues the ball with the velocity between the last two detections,
+            "kalman" with a constant velocity Kalman filter of the detections (only previous frames, live streams).
+    max_gap: gaps longer than max_gap frames are not filled (no ball drawn, no ball possession), None fills every gap.
+    A gap at the end of a window is closed with the first detection of the next window if it is passed to fill (one window of delay),
+    else the last detection is held and the first max_gap frames of the gap are filled.
+    After every call, observed is True for the frames of the call with a detection.
+    """
+    def __init__(self, method: str="linear", max_gap: int=None, process_noise: float=1.0, measurement_noise: float=4.0) -> None:
+        if method not in ("linear", "velocity", "kalman"):
+            raise ValueError(f"Unknown interpolation method {method}.")
+
+        self.method = method
+        self.max_gap = max_gap
+        self.observed = None
+
+        self.frame_offset = 0       # index of the first frame of the next call in the whole video
+        self.history = []           # (frame, bbox) of the last two detections
+
+        # constant velocity model per bbox coordinate: state (position, velocity), covariance is the same for all coordinates
+        self.transition = np.array([[1.0, 1.0], [0.0, 1.0]])
+        self.process_noise = process_noise * np.array([[0.25, 0.5], [0.5, 1.0]])
+        self.measurement_noise = measurement_noise
+        self.state = None           # 4 x 2
+        self.covariance = None      # 2 x 2
+        self.state_frame = None     # frame of the state
+
+    @property
+    def causal(self) -> bool:
+        return self.method != "linear"
+
+    def fill(self, ball_tracks: TrackTable, next_ball_tracks: TrackTable=None) -> TrackTable:
+        """
+        Ball tracks with a row for every filled frame, interpolated column marks the rows without a detection.
+        next_ball_tracks: detections of the next window (streaming), only used by "linear" to interpolate a gap at the end of this window.
+        """
+        num_frames = ball_tracks.num_frames
+        frames = self.frame_offset + np.arange(num_frames)      # frames in the whole video
+
+        self.observed = np.zeros(num_frames, dtype=bool)
+        self.observed[ball_tracks.frame] = True
+
+        if self.method == "linear":
+            positions = self._interpolate(frames, ball_tracks, next_ball_tracks)
+        else:
+            positions = self._predict(frames, ball_tracks)
+
+        self.frame_offset += num_frames
+
+        # still NaN if the gap is too long or there is no ball at all
+        filled = np.flatnonzero(~np.isnan(positions[:, 0]))
+
+        filled_tracks = TrackTable(num_frames, filled, np.ones(len(filled)), positions[filled])     # ID 1 as there is only one ball
+        filled_tracks.interpolated = ~self.observed[filled]
+
+        return filled_tracks
+
+    def _interpolate(self, frames: np.ndarray, ball_tracks: TrackTable, next_ball_tracks: TrackTable=None) -> np.ndarray:
+        # detections of this call, the last detection of the previous calls and the first one of the next call
+        known_frames = np.concatenate([np.array([frame for frame, _ in self.history[-1:]], dtype=int), frames[ball_tracks.frame]])
+        known_bboxes = np.concatenate([np.array([bbox for _, bbox in self.history[-1:]]).reshape(-1, 4), ball_tracks.bbox])
+        if next_ball_tracks is not None and len(next_ball_tracks.frame) > 0:
+            known_frames = np.append(known_frames, self.frame_offset + len(frames) + next_ball_tracks.frame[0])
+            known_bboxes = np.concatenate([known_bboxes, next_ball_tracks.bbox[:1]])
+
+        positions = np.full((len(frames), 4), np.nan)
+        if len(known_frames) == 0:
+            return positions
+
+        # np.interp holds the first and the last value at the edges (like bfill and ffill)
+        for coordinate in range(4):
+            positions[:, coordinate] = np.interp(frames, known_frames, known_bboxes[:, coordinate])
+
+        if self.max_gap is not None:
+            # previous and next detection of every frame, gap length = frames between them
+            next_index = np.searchsorted(known_frames, frames)
+            previous_frame = np.where(next_index > 0, known_frames[np.maximum(next_index - 1, 0)], -np.inf)
+            next_frame = np.where(next_index < len(known_frames), known_frames[np.minimum(next_index, len(known_frames) - 1)], np.inf)
+
+            # open gaps at the edges: distance to the detection on the known side
+            gap = np.where(np.isinf(previous_frame), next_frame - frames, np.where(np.isinf(next_frame), frames - previous_frame, next_frame - previous_frame - 1))
+            positions[~self.observed & (gap > self.max_gap)] = np.nan
+
+        self.history = (self.history + list(zip(frames[ball_tracks.frame], ball_tracks.bbox)))[-2:]
+
+        return positions
+
+    def _predict(self, frames: np.ndarray, ball_tracks: TrackTable) -> np.ndarray:
+        positions = np.full((len(frames), 4), np.nan)
+        positions[ball_tracks.frame] = ball_tracks.bbox
+
+        for frame_num, frame in enumerate(frames):
+            if self.method == "kalman":
+                self._kalman_step(frame, positions[frame_num] if self.observed[frame_num] else None)
+
+            if self.observed[frame_num]:
+                self.history = (self.history + [(frame, positions[frame_num])])[-2:]
+                continue
+
+            if not self.history or (self.max_gap is not None and frame - self.history[-1][0] > self.max_gap):
+                continue
+
+            if self.method == "kalman":
+                positions[frame_num] = self.state[:, 0]
+            else:
+                last_frame, last_bbox = self.history[-1]
+                velocity = (last_bbox - self.history[0][1]) / max(last_frame - self.history[0][0], 1)     # zero with one detection
+                positions[frame_num] = last_bbox + velocity * (frame - last_frame)
+
+        return positions
+
+    def _kalman_step(self, frame: int, bbox: np.ndarray) -> None:
+        """
+        Predicts the state of the frame and corrects it with the detection if there is one.
+        """
+        if self.state is None:
+            if bbox is not None:
+                self.state = np.stack([bbox, np.zeros(4)], axis=1)
+                self.covariance = np.diag([self.measurement_noise, 100.0])     # unknown velocity
+                self.state_frame = frame
+            return
+
+        for _ in range(frame - self.state_frame):
+            self.state = self.state @ self.transition.T
+            self.covariance = self.transition @ self.covariance @ self.transition.T + self.process_noise
+        self.state_frame = frame
+
+        if bbox is not None:
+            gain = self.covariance[:, 0] / (self.covariance[0, 0] + self.measurement_noise)     # only the position is measured
+            self.state += np.outer(bbox - self.state[:, 0], gain)
+            self.covariance -= np.outer(gain, self.covariance[0])
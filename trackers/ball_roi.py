@@ -0,0 +1,102 @@
+from typing import List, Tuple
+import numpy as np
+import supervision as sv
+
+class BallRoiDetector:
+    """
+    The ball is tiny in broadcast frames: instead of running the whole frame at a high input size, the full-frame prediction
+    runs at a reduced input size (enough for the players) and the ball is searched in a high-resolution crop of roi_size pixels
+    around its position predicted from the last two ball detections, predicted at the native resolution of the crop.
+    If the ball was not found for lost_after frames, the whole frame is searched in overlapping tiles of roi_size pixels (every tile_interval frames).
+    """
+    def __init__(self, roi_size: int=640, lost_after: int=5, tile_interval: int=5, tile_overlap: float=0.2, batch_size: int=4) -> None:
+        self.roi_size = roi_size
+        self.lost_after = lost_after
+        self.tile_interval = tile_interval
+        self.tile_overlap = tile_overlap
+        self.batch_size = batch_size    # frames per crop batch, the crops of a batch are placed with the detections before the batch
+
+        self.history = []           # (frame, center) of the last two ball detections
+        self.frame_index = 0        # index of the next frame in the whole video
+        self.last_tile_frame = None # frame of the last tile search
+        self.num_crops = 0          # predicted crops, for the cost compared to full-frame predictions
+
+    def get_roi(self, frame_index: int, shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        """
+        Crops (x1, y1, x2, y2) to search the ball in: one around the predicted position, tiles if the ball is lost, none between tile searches.
+        """
+        height, width = shape[:2]
+        size_x, size_y = min(self.roi_size, width), min(self.roi_size, height)
+
+        frames_lost = frame_index - self.history[-1][0] if self.history else np.inf
+        if frames_lost > self.lost_after:
+            if self.last_tile_frame is not None and frame_index - self.last_tile_frame < self.tile_interval:
+                return []
+            self.last_tile_frame = frame_index
+            return self.get_tiles(shape)
+
+        last_frame, last_center = self.history[-1]
+        velocity = (last_center - self.history[0][1]) / max(last_frame - self.history[0][0], 1)     # zero with one detection
+        center_x, center_y = last_center + velocity * (frame_index - last_frame)
+
+        x1 = int(np.clip(center_x - size_x / 2, 0, width - size_x))
+        y1 = int(np.clip(center_y - size_y / 2, 0, height - size_y))
+
+        return [(x1, y1, x1 + size_x, y1 + size_y)]
+
+    def get_tiles(self, shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        height, width = shape[:2]
+        size_x, size_y = min(self.roi_size, width), min(self.roi_size, height)
+        step = max(1, int(self.roi_size * (1 - self.tile_overlap)))
+
+        # last tile of a row/column ends at the frame border
+        xs = sorted(set(list(range(0, width - size_x, step)) + [width - size_x]))
+        ys = sorted(set(list(range(0, height - size_y, step)) + [height - size_y]))
+
+        return [(x, y, x + size_x, y + size_y) for y in ys for x in xs]
+
+    def refine(self, model, frames: List[np.ndarray], detections: List[sv.Detections], ball_id: int, conf: float, device: str=None) -> List[sv.Detections]:
+        """
+        Replaces the ball detections of the full-frame predictions with the most confident ball in the crops of the frame.
+        Frames without a ball in the crops keep the full-frame detections.
+        model: ultralytics.YOLO or OnnxDetector.
+        """
+        for batch_start in range(0, len(frames), self.batch_size):
+            batch = range(batch_start, min(batch_start + self.batch_size, len(frames)))
+
+            rois = [(frame_num, roi) for frame_num in batch for roi in self.get_roi(self.frame_index + frame_num, frames[frame_num].shape)]
+            crops = [frames[frame_num][y1:y2, x1:x2] for frame_num, (x1, y1, x2, y2) in rois]
+
+            best = {}   # frame_num --> (confidence, detection of the ball in frame coordinates)
+            for start in range(0, len(crops), self.batch_size):
+                predictions = model.predict(source=crops[start:start+self.batch_size], imgsz=self.roi_size, conf=conf, verbose=False, device=device)
+
+                for (frame_num, (x1, y1, _, _)), prediction in zip(rois[start:start+self.batch_size], predictions):
+                    crop_detections = sv.Detections.from_ultralytics(prediction)
+                    crop_detections = crop_detections[crop_detections.class_id == ball_id]
+
+                    if len(crop_detections) > 0:
+                        ball = crop_detections[[int(np.argmax(crop_detections.confidence))]]
+                        if frame_num not in best or ball.confidence[0] > best[frame_num][0]:
+                            ball.xyxy = ball.xyxy + np.array([x1, y1, x1, y1], dtype=ball.xyxy.dtype)
+                            best[frame_num] = (ball.confidence[0], ball)
+
+            self.num_crops += len(crops)
+
+            for frame_num in batch:
+                is_ball = detections[frame_num].class_id == ball_id
+
+                if frame_num in best:
+                    detections[frame_num] = sv.Detections.merge([detections[frame_num][~is_ball], best[frame_num][1]])
+                    ball_xyxy = best[frame_num][1].xyxy[0]
+                elif is_ball.any():
+                    ball_xyxy = detections[frame_num].xyxy[is_ball][np.argmax(detections[frame_num].confidence[is_ball])]
+                else:
+                    continue
+
+                center = np.array([(ball_xyxy[0] + ball_xyxy[2]) / 2, (ball_xyxy[1] + ball_xyxy[3]) / 2])
+                self.history = (self.history + [(self.frame_index + frame_num, center)])[-2:]
+
+        self.frame_index += len(frames)
+
+        return detections
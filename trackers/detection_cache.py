@@ -0,0 +1,158 @@
+from typing import Dict, Union
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+import supervision as sv
+
+logger = logging.getLogger("tracker")
+
+def get_hash(data: Union[str, bytes]) -> str:
+    """
+    Content hash of a file path or bytes, same video gives the same hash for both.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+
+    if isinstance(data, bytes):
+        hasher.update(data)
+    elif isinstance(data, str):
+        with open(data, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):     # 1 MB chunks, the file isn't loaded at once
+                hasher.update(chunk)
+    else:
+        raise ValueError("Input data must be either bytes or a string file path.")
+
+    return hasher.hexdigest()
+
+class CachedDetections:
+    """
+    Detections of a whole video in columnar arrays, memory-mapped from the cache directory.
+    Detections of frame i are the rows frame_offsets[i]:frame_offsets[i+1].
+    """
+    def __init__(self, path: str) -> None:
+        self.xyxy = np.load(os.path.join(path, "xyxy.npy"), mmap_mode="r")
+        self.confidence = np.load(os.path.join(path, "confidence.npy"), mmap_mode="r")
+        self.class_id = np.load(os.path.join(path, "class_id.npy"), mmap_mode="r")
+        self.frame_offsets = np.load(os.path.join(path, "frame_offsets.npy"))
+
+        with open(os.path.join(path, "names.json"), "r") as f:
+            self.names = {int(k): v for k, v in json.load(f).items()}    # json keys are strings
+
+    def __len__(self) -> int:
+        return len(self.frame_offsets) - 1
+
+    def frame(self, frame_num: int) -> sv.Detections:
+        start, end = self.frame_offsets[frame_num], self.frame_offsets[frame_num+1]
+
+        # copies: tracking changes the class IDs in place, memory map is read-only
+        return sv.Detections(xyxy=np.array(self.xyxy[start:end]), 
+                             confidence=np.array(self.confidence[start:end]), 
+                             class_id=np.array(self.class_id[start:end]))
+
+class DetectionRecorder:
+    """
+    Collects the detections of the frames in order, written to the cache once the whole video is detected.
+    """
+    def __init__(self) -> None:
+        self.xyxy = []
+        self.confidence = []
+        self.class_id = []
+
+    def __len__(self) -> int:
+        return len(self.xyxy)
+
+    def add(self, detections: sv.Detections) -> None:
+        # copies: tracking changes the class IDs in place
+        self.xyxy.append(detections.xyxy.astype(np.float32))
+        self.confidence.append(detections.confidence.astype(np.float32))
+        self.class_id.append(detections.class_id.astype(np.int32))
+
+class DetectionCache:
+    """
+    On-disk cache of the model predictions, keyed by video content hash, model weights checksum, confidence threshold and input size.
+    Every entry is a directory of columnar .npy files (xyxy, confidence, class_id, frame_offsets) and names.json.
+    If the cache exceeds max_size_mb, the least recently used entries are deleted.
+    """
+    def __init__(self, directory: str="cache/detections", max_size_mb: int=2048, verbose: bool=True) -> None:
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 * 1024
+        self.verbose = verbose
+
+    @staticmethod
+    def get_key(video_hash: str, model_hash: str, conf: float, imgsz: int=None, variant: str=None) -> str:
+        """
+        variant: detection mode that changes the predictions, e.g. ball crops.
+        """
+        key = f"{video_hash}_{model_hash}_{conf:.3f}"
+        key = f"{key}_{imgsz}" if imgsz else key      # predictions depend on the input size of the model
+        return f"{key}_{variant}" if variant else key
+
+    def load(self, key: str) -> CachedDetections:
+        """
+        None if there is no entry for the key.
+        """
+        path = os.path.join(self.directory, key)
+
+        if not os.path.isdir(path):
+            return None
+
+        os.utime(path)     # modification time is the last access for the eviction
+
+        if self.verbose:
+            logger.info(f"Loaded detections from cache entry {key}.")
+
+        return CachedDetections(path)
+
+    def save(self, key: str, recorder: DetectionRecorder, names: Dict[int, str]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+        num_detections = [len(xyxy) for xyxy in recorder.xyxy]
+        frame_offsets = np.concatenate([[0], np.cumsum(num_detections)]).astype(np.int64)
+
+        # write into a temporary directory first, a cancelled run must not leave an incomplete entry
+        temp_path = os.path.join(self.directory, f".{key}.{os.getpid()}.tmp")
+        os.makedirs(temp_path, exist_ok=True)
+
+        np.save(os.path.join(temp_path, "xyxy.npy"), np.concatenate(recorder.xyxy).reshape(-1, 4) if len(recorder) else np.zeros((0, 4), np.float32))
+        np.save(os.path.join(temp_path, "confidence.npy"), np.concatenate(recorder.confidence) if len(recorder) else np.zeros(0, np.float32))
+        np.save(os.path.join(temp_path, "class_id.npy"), np.concatenate(recorder.class_id) if len(recorder) else np.zeros(0, np.int32))
+        np.save(os.path.join(temp_path, "frame_offsets.npy"), frame_offsets)
+
+        with open(os.path.join(temp_path, "names.json"), "w") as f:
+            json.dump(names, f)
+
+        path = os.path.join(self.directory, key)
+        if os.path.isdir(path):     # written by a concurrent run in the meantime
+            shutil.rmtree(temp_path)
+        else:
+            os.replace(temp_path, path)
+
+        if self.verbose:
+            logger.info(f"Saved detections of {len(recorder)} frames to cache entry {key}.")
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Deletes least recently used entries until the cache is smaller than the maximum size.
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            if key.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(path), size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):    # oldest access first
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+            if self.verbose:
+                logger.info(f"Evicted cache entry {os.path.basename(path)} ({size / 1024**2:.1f} MB).")
@@ -0,0 +1,140 @@
+from typing import Dict, List, Tuple
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import psutil
+import torch
+from .model_registry import load_model
+
+logger = logging.getLogger("tracker")
+
+class DetectionTuner:
+    """
+    Benchmarks batch sizes and input resolutions of the model on the current machine and picks the best configuration:
+    the largest resolution that reaches target_fps (small objects like the ball are detected better at a higher resolution),
+    at that resolution the batch size with the most frames/s. If no resolution reaches target_fps, the fastest configuration.
+    Configurations that exceed the memory budget are skipped: peak GPU memory of the configuration on CUDA,
+    else the peak RSS of a fresh process that runs only this configuration (memory freed by an earlier configuration stays with the process).
+    The result is cached in a JSON file per host, device, model and tuning parameters, later runs on the same machine skip the benchmark.
+    """
+    def __init__(self, path: str="cache/detection_config.json", batch_sizes: Tuple[int]=(1, 4, 8, 16, 32),
+                 image_sizes: Tuple[int]=(640, 960, 1280), memory_budget_mb: int=None, target_fps: float=25.0,
+                 sample_frames: int=32, verbose: bool=True) -> None:
+        self.path = path
+        self.batch_sizes = sorted(batch_sizes)
+        self.image_sizes = sorted(image_sizes, reverse=True)
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.target_fps = target_fps
+        self.sample_frames = sample_frames
+        self.verbose = verbose
+
+    def get_key(self, model_hash: str, device: str) -> str:
+        # another budget or other candidates can select another configuration
+        budget = self.memory_budget // 1024**2 if self.memory_budget else None
+        return (f"{socket.gethostname()}_{device}_{model_hash}_batch{'-'.join(map(str, self.batch_sizes))}_imgsz{'-'.join(map(str, self.image_sizes))}"
+                f"_fps{self.target_fps:g}_frames{self.sample_frames}_budget{budget}")
+
+    def load(self, key: str) -> Dict[str, int]:
+        """
+        Cached configuration {"batch_size": ..., "imgsz": ...}, None if the machine and model were not tuned yet.
+        """
+        return self._read().get(key)
+
+    def save(self, key: str, config: Dict[str, int]) -> None:
+        configs = self._read()
+        configs[key] = config
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(configs, f, indent=4)
+        os.replace(temp_path, self.path)     # atomic, parallel runs never read a partial file
+
+    def _read(self) -> Dict[str, Dict[str, int]]:
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def tune(self, model_path: str, frames: List[np.ndarray], device: str, conf: float, threads: int=None) -> Dict[str, int]:
+        """
+        Benchmarks the configurations of the model (see load_model) on the first sample_frames frames (repeated if there are fewer).
+        """
+        frames = [frames[i % len(frames)] for i in range(self.sample_frames)]
+
+        # per resolution: (frames/s, batch size) of the fastest batch size
+        results = {}
+
+        for imgsz in self.image_sizes:
+            for batch_size in self.batch_sizes:
+                batch_size = min(batch_size, len(frames))
+                fps, memory = self._trial(model_path, threads, frames, batch_size, imgsz, conf, device)
+
+                if self.verbose:
+                    logger.info(f"[Tuner] Batch size {batch_size}, image size {imgsz}: {fps:.2f} frames/s, {memory / 1024**2:.0f} MB")
+
+                if self.memory_budget and memory > self.memory_budget:
+                    break       # larger batch sizes need even more memory
+
+                if imgsz not in results or fps > results[imgsz][0]:
+                    results[imgsz] = (fps, batch_size)
+
+        if not results:
+            raise ValueError("No configuration fits into the memory budget.")
+
+        reaching_target = [imgsz for imgsz in self.image_sizes if imgsz in results and results[imgsz][0] >= self.target_fps]
+        imgsz = reaching_target[0] if reaching_target else max(results, key=lambda imgsz: results[imgsz][0])
+        fps, batch_size = results[imgsz]
+
+        if self.verbose:
+            logger.info(f"[Tuner] Selected batch size {batch_size}, image size {imgsz} ({fps:.2f} frames/s) on {device}.")
+
+        return {"batch_size": batch_size, "imgsz": imgsz}
+
+    @staticmethod
+    def _trial(model_path: str, threads: int, frames: List[np.ndarray], batch_size: int, imgsz: int, conf: float, device: str) -> Tuple[float, int]:
+        """
+        Frames/s and memory in bytes of the configuration.
+        CUDA: peak GPU memory of the trial in this process. CPU (MPS shares the system memory): peak RSS of a fresh process,
+        the RSS of this process keeps the memory of the previous trials.
+        """
+        if device == "cuda":
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats()      # the peak of a previous (larger) configuration isn't counted again
+            start_memory = torch.cuda.memory_allocated()
+            fps = _benchmark(load_model(model_path, threads), frames, batch_size, imgsz, conf, device)
+            return fps, torch.cuda.max_memory_allocated() - start_memory
+
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            return executor.submit(_process_trial, model_path, threads, frames, batch_size, imgsz, conf, device).result()
+
+def _benchmark(model: object, frames: List[np.ndarray], batch_size: int, imgsz: int, conf: float, device: str) -> float:
+    model.predict(source=frames[:batch_size], imgsz=imgsz, conf=conf, verbose=False, device=device)   # warm-up, e.g. CUDA kernels of the input shape
+
+    start_time = time.time()
+    for i in range(0, len(frames), batch_size):
+        model.predict(source=frames[i:i+batch_size], imgsz=imgsz, conf=conf, verbose=False, device=device)
+
+    return len(frames) / (time.time() - start_time)
+
+def _process_trial(model_path: str, threads: int, frames: List[np.ndarray], batch_size: int, imgsz: int, conf: float, device: str) -> Tuple[float, int]:
+    """
+    Trial in a fresh process: frames/s and peak RSS of the whole process (model, sample frames and the predictions of the configuration).
+    """
+    fps = _benchmark(load_model(model_path, threads), frames, batch_size, imgsz, conf, device)
+    return fps, _peak_rss()
+
+def _peak_rss() -> int:
+    if sys.platform == "win32":
+        return psutil.Process().memory_info().peak_wset
+    import resource     # Unix only
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024     # bytes on macOS, KB on Linux
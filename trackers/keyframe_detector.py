@@ -0,0 +1,129 @@
+from typing import Callable, List
+import numpy as np
+import cv2
+import supervision as sv
+
+class KeyframeDetector:
+    """
+    Runs the model only on keyframes, the boxes of the frames in between are propagated from the previous frame with sparse optical flow
+    (median displacement of a few points inside every box), consecutive frames at 25-50 fps are almost the same.
+    Keyframes: every stride frames and on scene changes (mean absolute difference of thumbnails above scene_threshold).
+    Detection is also forced if more than max_lost of the boxes can't be followed or they move more than max_motion pixels per frame.
+    The tracker (ByteTrack) then gets detections for every frame as before.
+    """
+    def __init__(self, stride: int=4, scene_threshold: float=30.0, max_lost: float=0.3, max_motion: float=40.0, scale: float=0.5) -> None:
+        self.stride = stride
+        self.scene_threshold = scene_threshold
+        self.max_lost = max_lost
+        self.max_motion = max_motion
+        self.scale = scale      # optical flow on downscaled frames
+
+        self.lk_params = dict(
+            winSize = (15, 15),
+            maxLevel = 2,
+            criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        )
+
+        # state of the previous frame (streaming)
+        self.previous_gray = None
+        self.previous_thumbnail = None
+        self.previous_detections = None
+        self.frames_since_keyframe = 0
+
+        self.is_keyframe = None     # keyframe mask of the last call
+        self.num_frames = 0
+        self.num_keyframes = 0
+        self.num_forced = 0         # keyframes forced by lost boxes or fast motion
+
+    def get_thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def schedule(self, frames: List[np.ndarray]) -> np.ndarray:
+        """
+        Keyframes known before the detection: stride and scene changes.
+        """
+        is_keyframe = np.zeros(len(frames), dtype=bool)
+        frames_since_keyframe = self.frames_since_keyframe
+
+        for frame_num, frame in enumerate(frames):
+            thumbnail = self.get_thumbnail(frame)
+
+            scene_change = self.previous_thumbnail is None or np.abs(thumbnail - self.previous_thumbnail).mean() > self.scene_threshold
+            if scene_change or frames_since_keyframe + 1 >= self.stride:
+                is_keyframe[frame_num] = True
+                frames_since_keyframe = 0
+            else:
+                frames_since_keyframe += 1
+
+            self.previous_thumbnail = thumbnail
+
+        self.frames_since_keyframe = frames_since_keyframe
+
+        return is_keyframe
+
+    def detect(self, frames: List[np.ndarray], predict: Callable[[List[np.ndarray]], List[sv.Detections]]) -> List[sv.Detections]:
+        """
+        predict: detections of a list of frames (model).
+        """
+        is_keyframe = self.schedule(frames)
+
+        # scheduled keyframes in batches
+        keyframes = np.flatnonzero(is_keyframe)
+        keyframe_detections = dict(zip(keyframes.tolist(), predict([frames[i] for i in keyframes]) if len(keyframes) else []))
+
+        detections = []
+        for frame_num, frame in enumerate(frames):
+            gray = cv2.cvtColor(cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+            if frame_num in keyframe_detections:
+                frame_detections = keyframe_detections[frame_num]
+            else:
+                frame_detections = self.propagate(gray)
+                if frame_detections is None:
+                    # boxes lost or moving too fast
+                    frame_detections = predict([frame])[0]
+                    is_keyframe[frame_num] = True
+                    self.num_forced += 1
+
+            detections.append(frame_detections)
+            self.previous_gray = gray
+            self.previous_detections = frame_detections
+
+        self.is_keyframe = is_keyframe
+        self.num_frames += len(frames)
+        self.num_keyframes += int(is_keyframe.sum())
+
+        return detections
+
+    def propagate(self, gray: np.ndarray) -> sv.Detections:
+        """
+        Boxes of the previous frame moved by the optical flow of 5 points inside every box, None if detection is needed.
+        """
+        previous = self.previous_detections
+        if len(previous) == 0:
+            return previous
+
+        # center and 4 points around it in the upper body (shirt, less leg movement)
+        x1, y1, x2, y2 = (previous.xyxy * self.scale).T
+        width, height = x2 - x1, y2 - y1
+        offsets = np.array([[0.5, 0.5], [0.3, 0.3], [0.7, 0.3], [0.3, 0.6], [0.7, 0.6]])
+        points = np.stack([x1[:, None] + offsets[:, 0] * width[:, None], y1[:, None] + offsets[:, 1] * height[:, None]], axis=2)  # boxes x 5 x 2
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, points.reshape(-1, 1, 2).astype(np.float32), None, **self.lk_params)
+
+        displacement = (new_points.reshape(-1, 5, 2) - points) / self.scale
+        tracked = status.reshape(-1, 5).astype(bool)
+
+        # median displacement of the tracked points per box, NaN if no point was tracked
+        displacement[~tracked] = np.nan
+        tracked_boxes = tracked.any(axis=1)
+        box_displacement = np.zeros((len(previous), 2))
+        box_displacement[tracked_boxes] = np.nanmedian(displacement[tracked_boxes], axis=1)
+
+        if 1 - tracked_boxes.mean() > self.max_lost or np.abs(box_displacement).max() > self.max_motion:
+            return None
+
+        propagated = previous[tracked_boxes]
+        propagated.xyxy = propagated.xyxy + np.tile(box_displacement[tracked_boxes], 2).astype(propagated.xyxy.dtype)
+
+        return propagated
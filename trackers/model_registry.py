@@ -0,0 +1,48 @@
+from typing import Dict, Tuple
+import time
+import logging
+import threading
+
+logger = logging.getLogger("tracker")
+
+_models: Dict[Tuple[str, int], object] = {}
+_lock = threading.Lock()
+
+def load_model(model_path: str, threads: int=None, verbose: bool=False) -> object:
+    """
+    Model of the path (ultralytics.YOLO or OnnxDetector), loaded once per process and shared by all trackers, e.g. of the jobs of a worker.
+    threads: number of ONNX Runtime threads (ONNX models only), part of the key.
+    """
+    onnx = model_path.endswith(".onnx")
+    key = (model_path, threads if onnx else None)
+
+    with _lock:
+        if key not in _models:
+            start_time = time.time()
+
+            # imported here, loading the backends takes seconds
+            if onnx:
+                from .onnx_detector import OnnxDetector
+                _models[key] = OnnxDetector(model_path, threads)
+            else:
+                import ultralytics
+                _models[key] = ultralytics.YOLO(model_path)
+
+            if verbose:
+                logger.info(f"Loaded {model_path} in {time.time() - start_time:.2f} seconds.")
+
+        return _models[key]
+
+def register_model(model_path: str, model: object, threads: int=None) -> None:
+    """
+    Registers a loaded model under the path, e.g. a stub detector with the predict() interface of ultralytics.YOLO for benchmarks.
+    """
+    with _lock:
+        _models[(model_path, threads if model_path.endswith(".onnx") else None)] = model
+
+def unload_models() -> None:
+    """
+    Frees the loaded models, e.g. after the weights file changed.
+    """
+    with _lock:
+        _models.clear()
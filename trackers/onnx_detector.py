@@ -0,0 +1,145 @@
+from typing import List, Tuple, Union
+import os
+import ast
+import logging
+import numpy as np
+import cv2
+
+logger = logging.getLogger("tracker")
+
+class OnnxDetector:
+    """
+    YOLO model exported to ONNX, run with ONNX Runtime instead of PyTorch eager mode (faster on CPU-only machines).
+    provider: "CPUExecutionProvider", or "OpenVINOExecutionProvider" with the onnxruntime-openvino package on Intel CPUs.
+    predict() has the interface of ultralytics.YOLO.predict, the Tracker and the tuner work with both backends.
+    Pre- and postprocessing (letterbox, NMS) follow ultralytics, so the detections match the PyTorch model.
+    """
+    def __init__(self, path: str, threads: int=None, provider: str="CPUExecutionProvider", iou: float=0.7, max_det: int=300) -> None:
+        import onnxruntime as ort       # optional dependency, only needed for this backend
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(path, options, providers=[provider])
+        self.input_name = self.session.get_inputs()[0].name
+        self.dynamic = isinstance(self.session.get_inputs()[0].shape[2], str)   # image size can change, e.g. by the tuner
+
+        # metadata written by the ultralytics export
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])        # e.g. {0: "ball", ...}
+        self.stride = int(metadata["stride"])
+        self.imgsz = ast.literal_eval(metadata["imgsz"])[0]
+
+        self.iou = iou
+        self.max_det = max_det
+
+    @staticmethod
+    def export(model_path: str, int8: bool=False, verbose: bool=True) -> str:
+        """
+        Exports the PyTorch model once next to it, e.g. models/best.pt --> models/best.onnx (models/best.int8.onnx).
+        int8: dynamic INT8 quantization of the weights, smaller and faster on CPU with a small loss of accuracy.
+        Returns the path of the ONNX model, exported again only if the PyTorch model is newer.
+        """
+        onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+        target_path = os.path.splitext(model_path)[0] + (".int8.onnx" if int8 else ".onnx")
+
+        if os.path.isfile(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(model_path):
+            return target_path
+
+        if not os.path.isfile(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(model_path):
+            import ultralytics      # PyTorch is only needed for the export, not for running the ONNX model
+
+            ultralytics.YOLO(model_path).export(format="onnx", dynamic=True, simplify=False, verbose=verbose)
+
+            if verbose:
+                logger.info(f"Exported {model_path} to {onnx_path}.")
+
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(onnx_path, target_path, weight_type=QuantType.QUInt8)
+
+            if verbose:
+                logger.info(f"Quantized {onnx_path} to {target_path}.")
+
+        return target_path
+
+    def predict(self, source: Union[np.ndarray, List[np.ndarray]], imgsz: int=None, conf: float=0.25, verbose: bool=False, device: str=None) -> List:
+        """
+        Predictions of BGR frames of the same size in one batch, ultralytics Results.
+        device: ignored, set by the provider.
+        """
+        import torch
+        from ultralytics.engine.results import Results      # boxes as tensors like the PyTorch model, read by supervision
+
+        frames = source if isinstance(source, list) else [source]
+        imgsz = imgsz if imgsz and self.dynamic else self.imgsz
+
+        batch, gain, padding = self.preprocess(frames, imgsz)
+        output = self.session.run(None, {self.input_name: batch})[0]
+
+        results = []
+        for frame, prediction in zip(frames, output):
+            boxes = self.postprocess(prediction, conf, gain, padding, frame.shape)
+            results.append(Results(orig_img=frame, path="", names=self.names, boxes=torch.from_numpy(boxes)))
+
+        return results
+
+    def preprocess(self, frames: List[np.ndarray], imgsz: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+        """
+        Letterbox like ultralytics: resize the longer side to imgsz, pad the shorter side to the next multiple of the stride
+        (square imgsz if the model has a fixed input size). Returns the (B, 3, H, W) RGB batch in [0, 1], scale and (left, top) padding.
+        """
+        height, width = frames[0].shape[:2]
+        gain = min(imgsz / height, imgsz / width)
+        new_width, new_height = round(width * gain), round(height * gain)
+
+        pad_width, pad_height = imgsz - new_width, imgsz - new_height
+        if self.dynamic:
+            pad_width, pad_height = pad_width % self.stride, pad_height % self.stride
+        pad_width, pad_height = pad_width / 2, pad_height / 2
+
+        top, bottom = round(pad_height - 0.1), round(pad_height + 0.1)
+        left, right = round(pad_width - 0.1), round(pad_width + 0.1)
+
+        batch = []
+        for frame in frames:
+            if (width, height) != (new_width, new_height):
+                frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+            batch.append(cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114)))
+
+        batch = np.stack(batch)[..., ::-1].transpose(0, 3, 1, 2)      # BGR to RGB, BHWC to BCHW
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255
+
+        return batch, gain, (left, top)
+
+    def postprocess(self, prediction: np.ndarray, conf: float, gain: float, padding: Tuple[int, int], shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        prediction: (4 + classes, anchors) with xywh boxes and class scores.
+        Returns (N, 6) rows of x1, y1, x2, y2, confidence, class in the coordinates of the frame.
+        """
+        prediction = prediction.T
+        class_ids = prediction[:, 4:].argmax(axis=1)
+        confidences = prediction[np.arange(len(prediction)), 4 + class_ids]
+
+        keep = confidences > conf
+        boxes, confidences, class_ids = prediction[keep, :4], confidences[keep], class_ids[keep]
+
+        # NMS per class: boxes of different classes are shifted apart so they never overlap
+        offsets = class_ids[:, None] * 7680.0
+        xywh = np.hstack([boxes[:, :2] - boxes[:, 2:] / 2 + offsets, boxes[:, 2:]])
+        indices = np.array(cv2.dnn.NMSBoxes(xywh.tolist(), confidences.tolist(), conf, self.iou), dtype=int).reshape(-1)
+        indices = indices[np.argsort(-confidences[indices], kind="stable")][:self.max_det]
+
+        boxes, confidences, class_ids = boxes[indices], confidences[indices], class_ids[indices]
+
+        # xywh to xyxy in the frame: remove padding, undo scaling
+        xyxy = np.hstack([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2])
+        xyxy -= np.tile(padding, 2)
+        xyxy /= gain
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+
+        return np.hstack([xyxy, confidences[:, None], class_ids[:, None]]).astype(np.float32)
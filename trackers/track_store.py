@@ -0,0 +1,134 @@
+from typing import Dict, List, Tuple
+import numpy as np
+
+class TrackTable:
+    """
+    Tracks of one object type (players, referees or ball) as columns, one row per object and frame, rows sorted by frame.
+    Rows of frame i: frame_slice(i) or frame_rows(i), rows of one tracked object: track_rows(tracker_id).
+    """
+    # columns besides frame, tracker_id and bbox
+    _COLUMNS = ("position", "position_adjusted", "team", "team_colour", "has_ball", "interpolated")
+
+    def __init__(self, num_frames: int, frame: np.ndarray, tracker_id: np.ndarray, bbox: np.ndarray) -> None:
+        num_rows = len(frame)
+
+        self.num_frames = num_frames
+        self.frame = np.asarray(frame, dtype=np.int32)
+        self.tracker_id = np.asarray(tracker_id, dtype=np.int32)
+        self.bbox = np.asarray(bbox, dtype=np.float32).reshape(num_rows, 4)     # xyxy
+        self.position = np.zeros((num_rows, 2), dtype=np.int32)                 # foot position (players, referees) or center (ball)
+        self.position_adjusted = np.zeros((num_rows, 2), dtype=np.float32)      # position minus camera movement
+        self.team = np.zeros(num_rows, dtype=np.int8)                           # 1 or 2, 0 if not assigned
+        self.team_colour = np.zeros((num_rows, 3), dtype=np.float32)
+        self.has_ball = np.zeros(num_rows, dtype=bool)
+        self.interpolated = np.zeros(num_rows, dtype=bool)                      # ball position not detected but interpolated
+
+        # rows of frame i: frame_offsets[i]:frame_offsets[i+1]
+        self.frame_offsets = np.searchsorted(self.frame, np.arange(num_frames + 1)).astype(np.int64)
+
+    @classmethod
+    def from_frames(cls, frames: List[Tuple[np.ndarray, np.ndarray]]) -> "TrackTable":
+        """
+        frames: (tracker_ids, xyxy bboxes) of every frame.
+        """
+        num_objects = [len(tracker_ids) for tracker_ids, _ in frames]
+
+        if sum(num_objects) == 0:
+            return cls(len(frames), np.zeros(0), np.zeros(0), np.zeros((0, 4)))
+
+        frame = np.repeat(np.arange(len(frames)), num_objects)
+        tracker_id = np.concatenate([tracker_ids for tracker_ids, _ in frames])
+        bbox = np.concatenate([np.asarray(bboxes).reshape(-1, 4) for _, bboxes in frames])
+
+        return cls(len(frames), frame, tracker_id, bbox)
+
+    @classmethod
+    def concatenate(cls, num_frames: int, tables: List["TrackTable"], frame_offsets: List[int]) -> "TrackTable":
+        """
+        Joins tables of consecutive parts of a video, frame_offsets: index of the first frame of every part in the video.
+        """
+        table = cls(num_frames, 
+                    np.concatenate([part.frame + offset for part, offset in zip(tables, frame_offsets)]), 
+                    np.concatenate([part.tracker_id for part in tables]), 
+                    np.concatenate([part.bbox for part in tables]))
+        
+        for column in cls._COLUMNS:
+            setattr(table, column, np.concatenate([getattr(part, column) for part in tables]))
+
+        return table
+
+    def window(self, start: int, end: int) -> "TrackTable":
+        """
+        Copy of the rows of the frames start to end (exclusive), frame numbers relative to start.
+        """
+        rows = slice(self.frame_offsets[start], self.frame_offsets[end])
+        table = TrackTable(end - start, self.frame[rows] - start, self.tracker_id[rows], self.bbox[rows])
+
+        for column in self._COLUMNS:
+            setattr(table, column, getattr(self, column)[rows].copy())
+
+        return table
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def frame_slice(self, frame_num: int) -> slice:
+        return slice(self.frame_offsets[frame_num], self.frame_offsets[frame_num+1])
+
+    def frame_rows(self, frame_num: int) -> range:
+        return range(self.frame_offsets[frame_num], self.frame_offsets[frame_num+1])
+
+    def track_rows(self, tracker_id: int) -> np.ndarray:
+        return np.flatnonzero(self.tracker_id == tracker_id)
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        All columns by name, e.g. to save them with np.savez.
+        """
+        return {column: getattr(self, column) for column in ("frame", "tracker_id", "bbox") + self._COLUMNS}
+
+    @classmethod
+    def from_dict(cls, num_frames: int, columns: Dict[str, np.ndarray]) -> "TrackTable":
+        table = cls(num_frames, columns["frame"], columns["tracker_id"], columns["bbox"])
+
+        for column in cls._COLUMNS:
+            setattr(table, column, np.asarray(columns[column], dtype=getattr(table, column).dtype))
+
+        return table
+
+class TrackStore:
+    """
+    Columnar replacement of the dict of per-frame dicts: one TrackTable per object type.
+    tracks["players"].bbox[tracks["players"].frame_slice(frame_num)] --> bboxes of all players in the frame.
+    """
+    def __init__(self, num_frames: int, tables: Dict[str, TrackTable]) -> None:
+        self.num_frames = num_frames
+        self.tables = tables
+
+    def __getitem__(self, object: str) -> TrackTable:
+        return self.tables[object]
+
+    def __setitem__(self, object: str, table: TrackTable) -> None:
+        self.tables[object] = table
+
+    def items(self):
+        return self.tables.items()
+
+    def window(self, start: int, end: int) -> "TrackStore":
+        """
+        Tracks of the frames start to end (exclusive) with frame numbers relative to start, e.g. to render a video in windows.
+        """
+        return TrackStore(end - start, {object: table.window(start, end) for object, table in self.tables.items()})
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        Columns of all tables as "object.column", e.g. "players.bbox".
+        """
+        return {f"{object}.{column}": values for object, table in self.tables.items() for column, values in table.to_dict().items()}
+
+    @classmethod
+    def from_dict(cls, num_frames: int, columns: Dict[str, np.ndarray]) -> "TrackStore":
+        objects = sorted({key.split(".")[0] for key in columns})
+        return cls(num_frames, {object: TrackTable.from_dict(num_frames, {key.split(".", 1)[1]: values for key, values in columns.items() 
+                                                                          if key.startswith(f"{object}.")}) 
+                                for object in objects})
@@ -1,12 +1,19 @@
 import logging
-from typing import List, Dict
+from typing import Dict, List, Union
 import time
 from datetime import datetime
 import numpy as np
-import pandas as pd
 import ultralytics
 import supervision as sv
-from utils import ellipse, triangle, ball_possession_box, get_device, get_center_of_bbox, get_foot_position, options
+from utils import ellipse, triangle, ball_possession_box, get_device, options, OverlayRenderer, Layer, metrics
+from .detection_cache import DetectionCache, DetectionRecorder, get_hash
+from .detection_tuner import DetectionTuner
+from .onnx_detector import OnnxDetector
+from .ball_interpolator import BallInterpolator
+from .ball_roi import BallRoiDetector
+from .keyframe_detector import KeyframeDetector
+from .model_registry import load_model
+from .track_store import TrackStore, TrackTable
 
 file_handler = logging.FileHandler("logs/tracking.log")
 file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
@@ -25,50 +32,194 @@ class Tracker:
     Assigning bounding boxes unique IDs.
     Predicting and then tracking with supervision instead of YOLO tracking due to overwriting goalkeepers.
     """
-    def __init__(self, model_path: str, classes: List[int], verbose: bool=True) -> None: 
-        self.model = ultralytics.YOLO(model_path)
+    def __init__(self, model_path: str, classes: List[int], verbose: bool=True, cache: DetectionCache=None, 
+                 tuner: DetectionTuner=None, batch_size: int=20, imgsz: int=None, threads: int=None, ball_interpolator: BallInterpolator=None, 
+                 ball_roi: BallRoiDetector=None, keyframes: KeyframeDetector=None) -> None: 
+        """
+        model_path: PyTorch model (.pt) or ONNX model (.onnx, see OnnxDetector.export) run with ONNX Runtime.
+        tuner: benchmarks batch size and image size on the first frames to detect, overrides batch_size and imgsz.
+        imgsz: input size of the model, None for the training size of the model.
+        threads: number of CPU threads of ONNX Runtime, None for all cores.
+        ball_interpolator: fills the frames without a ball detection, linear interpolation of all gaps if None.
+        ball_roi: searches the ball in high-resolution crops around its predicted position, imgsz can then be reduced for the players.
+        keyframes: predicts only keyframes and propagates the boxes in between, the ball is interpolated (or searched with ball_roi) there.
+        """
+        self.model_path = model_path
+        self._model = None      # loaded on first prediction, not needed if all detections come from the cache
         self.classes = classes
         self.tracker = sv.ByteTrack()
+        self.tracker.reset()        # track IDs are counted per process, start at 1 for every video (e.g. jobs of a worker)
         self.verbose = verbose
         self.interpolation_tracker = None   # used for ball annotation: don't draw ball in a large interpolation window
+        self.num_interpolated = 0           # consecutive drawn frames with an interpolated ball, continues over the windows (streaming)
+        self.ball_interpolator = ball_interpolator or BallInterpolator()
+        self.ball_roi = ball_roi
+        self.ball_conf = 0.3                # higher confidence threshold for the ball to avoid tracking of field parts etc.
+        self.keyframes = keyframes
+
+        self.conf = 0.15            # confidence threshold of the predictions
+        self.cls_names = None       # class names of the model, e.g. {0: "ball", ...}
+        self.batch_size = batch_size
+        self.imgsz = imgsz
+        self._device = None         # probing torch is slow, only done once
+        self.threads = threads
+
+        self.tuner = tuner
+        self.tuned = tuner is None  # batch size and image size are final
+
+        self.cache = cache
+        self.cache_key = None
+        self.video_hash = None
+        self.cached_detections = None   # detections of the whole video from the cache
+        self.recorder = None            # collects detections for the cache if there is no entry yet
+        self.frame_index = 0            # index of the next frame to detect in the whole video
+
+    @property
+    def model(self) -> Union[ultralytics.YOLO, OnnxDetector]:
+        if self._model is None:
+            self._model = load_model(self.model_path, self.threads, self.verbose)     # shared with the other trackers of the process
+        return self._model
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            self._device = get_device()
+        return self._device
+
+    def set_video(self, data: Union[str, bytes], decode_options: Dict=None) -> None:
+        """
+        Looks up the detections of the video in the cache. 
+        Call before detecting the first frame, frames are then expected in order (whole video or consecutive windows).
+        decode_options: time range, stride and scale of the decoded frames (see VideoDecoder), part of the cache key.
+        """
+        self.frame_index = 0
+        self.num_interpolated = 0
+        self.cached_detections = None
+        self.recorder = None
+
+        if not self.tuned:
+            config = self.tuner.load(self._tuner_key())
+            if config is not None:
+                self._configure(config)
+
+        if self.cache is None:
+            return
+
+        self.video_hash = get_hash(data)
+        decoded = {k: v for k, v in (decode_options or {}).items() if k in ("time_range", "stride", "scale") and v not in (None, 1)}
+        if decoded:
+            # other frames than the whole video at full resolution
+            self.video_hash += "_" + "_".join(f"{k}{'-'.join(map(str, v)) if isinstance(v, tuple) else v}" for k, v in sorted(decoded.items()))
+
+        if not self.tuned:
+            return      # image size is not known before tuning on the first frames, cache is looked up in detect()
+
+        self._load_cache()
+
+    def _load_cache(self) -> None:
+        variants = [f"roi{self.ball_roi.roi_size}"] if self.ball_roi is not None else []
+        variants += [f"stride{self.keyframes.stride}"] if self.keyframes is not None else []
+        variant = "_".join(variants) or None
+        self.cache_key = DetectionCache.get_key(self.video_hash, get_hash(self.model_path), self.conf, self.imgsz, variant)
+        self.cached_detections = self.cache.load(self.cache_key)
+
+        if self.cached_detections is not None:
+            self.cls_names = self.cached_detections.names
+            self.recorder = None
+        else:
+            self.recorder = DetectionRecorder()
+
+    def save_cache(self) -> None:
+        """
+        Writes the detections of the video to the cache, call after all frames are detected.
+        """
+        if self.recorder is not None and len(self.recorder) > 0:
+            self.cache.save(self.cache_key, self.recorder, self.cls_names)
+            self.recorder = None
 
-    def interpolate_ball_positions(self, ball_tracks: List[Dict]) -> List[Dict]:
+    @metrics.timed("detect", lambda self, frames: len(frames))
+    def detect(self, frames: List[np.ndarray]) -> List[sv.Detections]:
         """
-        If the ball is not detected in every frame, take the frames where it is detected and interpolate
-        ball position in the frames between by drawing a line and simulate the position evenly along the line.
+        Detections of the frames in supervision format, from the cache if possible.
         """
-        # tracker_id 1 for ball, {} if nothing found, at tracker_id 1, get bbox, [] if nothing found
-        # {1: {"bbox": [....]}, ...
-        ball_positions = [track.get(1, {}).get("bbox", []) for track in ball_tracks]
+        if not self.tuned:
+            config = self.tuner.tune(self.model_path, frames, self.device, self.conf, self.threads)
+            self.tuner.save(self._tuner_key(), config)
+            self._configure(config)
 
-        self.interpolation_tracker = [1 if not bbox else 0 for bbox in ball_positions]   # if no datapoint: empty list --> interpolation
-        
-        df_ball_positions = pd.DataFrame(ball_positions, columns=["x1", "y1", "x2", "y2"])
+            if self.cache is not None and self.frame_index == 0:
+                self._load_cache()
+
+        if self.cached_detections is not None and self.frame_index + len(frames) <= len(self.cached_detections):
+            detections = [self.cached_detections.frame(frame_num) for frame_num in range(self.frame_index, self.frame_index + len(frames))]
+        else:
+            if self.keyframes is not None:
+                detections = self.keyframes.detect(frames, self._predict)
 
-        df_ball_positions = df_ball_positions.interpolate() # interpolate NaN values, estimation based on previous data
-        df_ball_positions = df_ball_positions.bfill()       # --> edge case beginning: no previous data --> bfill (replace NaN with next following value)
+                # propagated balls are unreliable (small, fast), the interpolator or the ROI search fills these frames
+                ball_id = {v: k for k, v in self.cls_names.items()}["ball"]
+                detections = [detection if is_keyframe else detection[detection.class_id != ball_id]
+                              for detection, is_keyframe in zip(detections, self.keyframes.is_keyframe)]
+            else:
+                detections = self._predict(frames)
 
-        ball_positions = [{1: {"bbox": x}} for x in df_ball_positions.to_numpy().tolist()] # transform back
+            if self.ball_roi is not None:
+                ball_id = {v: k for k, v in self.cls_names.items()}["ball"]
+                detections = self.ball_roi.refine(self.model, frames, detections, ball_id, self.conf, self.device)
 
-        return ball_positions
+            if self.recorder is not None:
+                for detection in detections:
+                    self.recorder.add(detection)
+
+        self.frame_index += len(frames)
+
+        return detections
+
+    def _predict(self, frames: List[np.ndarray]) -> List[sv.Detections]:
+        predictions = self.detect_frames(frames)
+        self.cls_names = predictions[0].names
+        return [sv.Detections.from_ultralytics(prediction) for prediction in predictions]     # xyxy bboxes
+
+    def _tuner_key(self) -> str:
+        return self.tuner.get_key(get_hash(self.model_path), self.device)
+
+    def _configure(self, config: Dict[str, int]) -> None:
+        self.batch_size = config["batch_size"]
+        self.imgsz = config["imgsz"]
+        self.tuned = True
+
+        if self.verbose:
+            logger.info(f"Detecting with batch size {self.batch_size} and image size {self.imgsz}.")
 
-    def detect_frames(self, frames: List[np.ndarray], batch_size: int=20) -> List[ultralytics.engine.results.Results]:
+    def interpolate_ball_positions(self, ball_tracks: TrackTable, next_ball_tracks: TrackTable=None) -> TrackTable:
+        """
+        If the ball is not detected in every frame, fill the frames without a detection with the ball interpolator,
+        e.g. take the frames where it is detected and simulate the position evenly along the line between them.
+        Repeated calls (streaming) continue from the detections of the previous calls, next_ball_tracks are the detections of the next window.
+        """
+        interpolated_tracks = self.ball_interpolator.fill(ball_tracks, next_ball_tracks)
+        self.interpolation_tracker = ~self.ball_interpolator.observed      # True if no datapoint --> interpolation
+
+        return interpolated_tracks
+
+    def detect_frames(self, frames: List[np.ndarray], batch_size: int=None) -> List[ultralytics.engine.results.Results]:
         """
         List of frame predictions processed in batches to avoid memory issues.
         """
-        batch_size=batch_size
+        batch_size = batch_size or self.batch_size
         detections = []
 
         
         start_time = time.time()
 
         if self.verbose:
-            logger.info(f"[Device: {get_device()}] Starting object detection at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info(f"[Device: {self.device}] Starting object detection at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
         for i in range(0, len(frames), batch_size):
             frame_time = time.time()
             
-            detections_batch = self.model.predict(source=frames[i:i+batch_size], conf=0.15, verbose=self.verbose, device=get_device())
+            with metrics.stage("inference", len(frames[i:i+batch_size])):     # latency per batch
+                detections_batch = self.model.predict(source=frames[i:i+batch_size], imgsz=self.imgsz, conf=self.conf, verbose=self.verbose, device=self.device)
             detections += detections_batch
 
             if self.verbose:
@@ -79,12 +230,16 @@ class Tracker:
   
         return detections
 
-    def get_object_tracks(self, frames: List[np.ndarray]) -> Dict[str, List[Dict]]:        
-        detections = self.detect_frames(frames)
+    def get_object_tracks(self, frames: List[np.ndarray], detections: List[sv.Detections]=None) -> TrackStore:
+        """
+        detections: result of detect() if it was already called (pipelined processing).
+        """
+        if detections is None:
+            detections = self.detect(frames)
 
-        # key: tracker_id, value: bbox, index: frame
+        # per frame: (tracker_ids, bboxes)
         tracks = {
-            "players": [],      # {tracker_id: {"bbox": [....]}, tracker_id: {"bbox": [....]}, tracker_id: {"bbox": [....]}, tracker_id: {"bbox": [....]}}  (same for referees and ball)
+            "players": [],
             "referees": [],     
             "ball": []
         }
@@ -92,20 +247,16 @@ class Tracker:
         start_time = time.time()
 
         if self.verbose:
-            logger.info(f"[Device: {get_device()}] Starting object tracking at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info(f"[Device: {self.device}] Starting object tracking at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_switched = {v: k for k, v in cls_names.items()}       # swap keys and values, e.g. ball: 1 --> 1: ball for easier access
+        cls_names = self.cls_names
+        cls_names_switched = {v: k for k, v in cls_names.items()}       # swap keys and values, e.g. ball: 1 --> 1: ball for easier access
 
-            # convert to supervision detection format
-            detection_supervision = sv.Detections.from_ultralytics(detection)      # xyxy bboxes
-            
+        for detection_supervision in detections:
             # convert goalkeeper to player
             # goalkeepers might get predicted as players in some frames and that could cause tracking issues
-            for index, class_id in enumerate(detection_supervision.class_id):
-                if cls_names[class_id] == "goalkeeper":
-                    detection_supervision.class_id[index] = cls_names_switched["player"]
+            if "goalkeeper" in cls_names_switched:
+                detection_supervision.class_id[detection_supervision.class_id == cls_names_switched["goalkeeper"]] = cls_names_switched["player"]
             # before:
             # class_id=array([1, 2, 2, 2, 2, 3, 3]), tracker_id=None, data={'class_name': array(['goalkeeper', 'player', 'player', 'player', 'player', 'referee', 'referee'], dtype='<U7')}
             # after:          ^
@@ -116,30 +267,21 @@ class Tracker:
             # example:
             # class_id=array([2, 2, 2, 2, 2, 3, 3]), tracker_id=array([ 1,  2,  3,  4,  5,  6,  7]), data={'class_name': array(['player', 'player', 'player', 'player', 'player', 'referee', 'referee'], dtype='<U7')}
 
-            tracks["players"].append({}) 
-            tracks["referees"].append({})
-            tracks["ball"].append({})
-
-            for frame_detection in detections_with_tracks:
-                # frame_detection: Detections (bboxes), mask, confidence, class_id, tracker_id, class_name
-                bbox = frame_detection[0].tolist()
-                class_id = frame_detection[3]
-                tracker_id = frame_detection[4]
+            # add objects of the class (players/referees) in this frame with their unique tracker IDs
+            is_player = detections_with_tracks.class_id == cls_names_switched["player"]
+            tracks["players"].append((detections_with_tracks.tracker_id[is_player], detections_with_tracks.xyxy[is_player]))
 
-                # add object at class (players/referees/ball) at index (frame) with its unique tracker ID
-                if class_id == cls_names_switched["player"]:
-                    tracks["players"][frame_num][tracker_id] = {"bbox": bbox}
-
-                if class_id == cls_names_switched["referee"]:
-                    tracks["referees"][frame_num][tracker_id] = {"bbox": bbox}
+            is_referee = detections_with_tracks.class_id == cls_names_switched["referee"]
+            tracks["referees"].append((detections_with_tracks.tracker_id[is_referee], detections_with_tracks.xyxy[is_referee]))
 
             # no tracker for the ball as there is only one
-            for frame_detection in detection_supervision:
-                bbox = frame_detection[0].tolist()
-                class_id = frame_detection[3]
+            # higher confidence for ball to avoid tracking of field parts etc.
+            is_ball = (detection_supervision.class_id == cls_names_switched["ball"]) & (detection_supervision.confidence >= self.ball_conf)
+            ball_bboxes = detection_supervision.xyxy[is_ball][-1:]   # at most one ball per frame
+            tracks["ball"].append((np.ones(len(ball_bboxes)), ball_bboxes))    # ID 1 as there is only one ball
 
-                if class_id == cls_names_switched["ball"] and frame_detection[2] >= 0.3:    # higher confidence for ball to avoid tracking of field parts etc.
-                    tracks["ball"][frame_num][1] = {"bbox": bbox}   # ID 1 as there is only one ball
+        tracks = TrackStore(len(detections), {object: TrackTable.from_frames(object_tracks) for object, object_tracks in tracks.items()})
+        metrics.add("track", time.time() - start_time, len(detections))
 
         if self.verbose:
             logger.info(f"Tracked objects in {len(frames)} frames in {time.time() - start_time:.2f} seconds.")
@@ -149,57 +291,60 @@ class Tracker:
 
         return tracks
     
-    def add_position_to_tracks(self, tracks: Dict[str, List[Dict]]) -> None:
+    def add_position_to_tracks(self, tracks: TrackStore) -> None:
         for object, object_tracks in tracks.items():
-            for frame_num, track_dict in enumerate(object_tracks):
-                for tracker_id, track in track_dict.items():
-                    bbox = track["bbox"]
+            x1, y1, x2, y2 = object_tracks.bbox.T
 
-                    if object == "ball":
-                        position = get_center_of_bbox(bbox)
-                    else:   # player
-                        position = get_foot_position(bbox)
+            if object == "ball":
+                position = np.stack([(x1 + x2) / 2, (y1 + y2) / 2], axis=1)     # center of bbox
+            else:   # player
+                position = np.stack([(x1 + x2) / 2, y2], axis=1)                # foot position: center of x, bottom of y
 
-                    # add new key position
-                    tracks[object][frame_num][tracker_id]["position"] = position
+            object_tracks.position = position.astype(np.int32)  # truncate like int()
     
-    def draw_annotations(self, frames: List[np.ndarray], tracks: Dict[str, List[Dict]], ball_possession: np.ndarray) -> List[np.ndarray]:   # TODO extra folder for custom drawings and then import?
-        output_frames = []  # frames after changing the annotations
-        num_interpolated = 0
-
-        for frame_num, frame in enumerate(frames):
-            frame = frame.copy()       # don't change original
+    def draw_annotations(self, frames: List[np.ndarray], tracks: TrackStore, possession_counts: np.ndarray, frame_offset: int=0) -> List[np.ndarray]:
+        """
+        Annotated copies of the frames, see annotation_layer() to draw into the frames with the other overlays in one pass (OverlayRenderer).
+        """
+        layer = self.annotation_layer(tracks, possession_counts, frame_offset)
+        return list(OverlayRenderer(in_place=True).render([frame.copy() for frame in frames], [layer]))     # don't change original
 
-            player_dict = tracks["players"][frame_num]
-            referee_dict = tracks["referees"][frame_num]
-            ball_dict = tracks["ball"][frame_num]
+    def annotation_layer(self, tracks: TrackStore, possession_counts: np.ndarray, frame_offset: int=0) -> Layer:   # TODO extra folder for custom drawings and then import?
+        """
+        Draws the tracks of a frame in place, frames are expected in order, also over the layers of consecutive windows.
+        possession_counts: frames in possession of both teams up to every frame (PlayerBallAssigner.possession_counts).
+        frame_offset: index of the first frame in the whole video (streaming), possession_counts covers the whole video.
+        """
+        players = tracks["players"]
+        referees = tracks["referees"]
+        ball = tracks["ball"]
+        interpolation_tracker = self.interpolation_tracker
 
+        def draw(frame: np.ndarray, frame_num: int) -> None:
             if options["players"] in self.classes:
-                for tracker_id, player in player_dict.items():
-                    colour = player.get("team_colour", (255, 255, 255))         # get team colour if it exists, else white 
-                    frame = ellipse(frame, player["bbox"], colour, tracker_id)
+                for row in players.frame_rows(frame_num):
+                    colour = players.team_colour[row].tolist() if players.team[row] else (255, 255, 255)    # get team colour if it exists, else white 
+                    ellipse(frame, players.bbox[row], colour, players.tracker_id[row])
 
-                    if player.get("has_ball", False):
-                        frame = triangle(frame, player["bbox"], (0, 0, 255))    # red triangle
+                    if players.has_ball[row]:
+                        triangle(frame, players.bbox[row], (0, 0, 255))    # red triangle
 
             if options["referees"] in self.classes: 
-                for _, referee in referee_dict.items():
-                    frame = ellipse(frame, referee["bbox"], (0, 255, 255))      # yellow ellipse
+                for bbox in referees.bbox[referees.frame_slice(frame_num)]:
+                    ellipse(frame, bbox, (0, 255, 255))      # yellow ellipse
 
             if options["ball"] in self.classes:
-                if self.interpolation_tracker[frame_num] == 1:
-                    num_interpolated += 1
+                if interpolation_tracker[frame_num]:
+                    self.num_interpolated += 1
                 else:
-                    num_interpolated = 0 
+                    self.num_interpolated = 0 
                 
-                for tracker_id, ball in ball_dict.items():
+                for bbox in ball.bbox[ball.frame_slice(frame_num)]:
                     # only draw detected ball or if not too many consecutive interpolated trackings 
-                    if num_interpolated <= 25 or self.interpolation_tracker[frame_num] == 0:
-                        frame = triangle(frame, ball["bbox"], (0, 255, 0))          # green triangle
+                    if self.num_interpolated <= 25 or not interpolation_tracker[frame_num]:
+                        triangle(frame, bbox, (0, 255, 0))          # green triangle
             
             if options["stats"] in self.classes: 
-                frame = ball_possession_box(frame_num, frame, ball_possession)
-
-            output_frames.append(frame)
+                ball_possession_box(frame_offset + frame_num, frame, possession_counts)
 
-        return output_frames
\ No newline at end of file
+        return draw
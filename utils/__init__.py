@@ -1,4 +1,8 @@
+from .metrics import Metrics, StageMetrics, metrics, NESTED_STAGES
 from .device_utils import get_device
-from .video_utils import read_video, save_video
+from .frame_store import FrameStore
+from .video_utils import VideoDecoder, read_video, stream_video, get_frame_count, frame_windows, LiveCapture, VideoWriter
+from .video_encoders import FFmpegVideoWriter, PyAVVideoWriter, get_video_writer, save_video
 from .bbox_utils import get_center_of_bbox, get_bbox_dimensions, get_distance, get_foot_position
-from .annotation_utils import ellipse, triangle, ball_possession_box, options
\ No newline at end of file
+from .annotation_utils import ellipse, triangle, transparent_box, ball_possession_box, options
+from .overlay_renderer import OverlayRenderer, Layer
\ No newline at end of file
@@ -74,20 +74,39 @@ def triangle(frame: np.ndarray, bbox: List[float], colour: Tuple[int, int, int])
 
     return frame 
 
-def ball_possession_box(frame_num: int, frame: np.ndarray, ball_possession: np.ndarray) -> np.ndarray:
-    overlay = frame.copy()
+_fills = {}    # (shape, colour) --> filled patch, the boxes have the same size in every frame
 
-    cv2.rectangle(overlay, pt1=(1350, 850), pt2=(1900, 970), color=(255, 255, 255), thickness=cv2.FILLED)
-    alpha = 0.4
-    cv2.addWeighted(src1=overlay, alpha=alpha, src2=frame, beta=1-alpha, gamma=0, dst=frame)
+def transparent_box(frame: np.ndarray, pt1: Tuple[int, int], pt2: Tuple[int, int], colour: Tuple[int, int, int], alpha: float=0.4) -> np.ndarray:
+    """
+    Filled box blended into the frame in place, like cv2.rectangle on a copy of the frame and cv2.addWeighted of both,
+    but only the pixels of the box are touched. pt2 is included like in cv2.rectangle.
+    """
+    roi = frame[max(pt1[1], 0):pt2[1]+1, max(pt1[0], 0):pt2[0]+1]     # view, clipped to the frame
+    if roi.size == 0:
+        return frame
 
-    ball_possession_till_frame = ball_possession[:frame_num+1]
-    team_1_num_frames = ball_possession_till_frame[ball_possession_till_frame==1].shape[0]
-    team_2_num_frames = ball_possession_till_frame[ball_possession_till_frame==2].shape[0]
+    key = (roi.shape, colour)
+    if key not in _fills:
+        _fills[key] = np.full(roi.shape, colour, dtype=frame.dtype)
+
+    cv2.addWeighted(src1=_fills[key], alpha=alpha, src2=roi, beta=1-alpha, gamma=0, dst=roi)
+
+    return frame
+
+def ball_possession_box(frame_num: int, frame: np.ndarray, possession_counts: np.ndarray) -> np.ndarray:
+    """
+    possession_counts: frames in possession of team 1 and team 2 up to every frame (PlayerBallAssigner.possession_counts), constant work per frame.
+    """
+    transparent_box(frame, (1350, 850), (1900, 970), (255, 255, 255))
+
+    team_1_num_frames, team_2_num_frames = possession_counts[frame_num]
     total = team_1_num_frames + team_2_num_frames
 
-    team_1_possession = int(round(team_1_num_frames / total, 2) * 100)
-    team_2_possession = int(round(team_2_num_frames / total, 2) * 100)
+    if total > 0:
+        team_1_possession = int(round(team_1_num_frames / total, 2) * 100)
+        team_2_possession = int(round(team_2_num_frames / total, 2) * 100)
+    else:   # no team in possession yet
+        team_1_possession, team_2_possession = 0, 0
 
     cv2.putText(frame, text=f"Team 1: {team_1_possession}%", org=(1400, 900), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(0, 0, 0), thickness=3)
     cv2.putText(frame, text=f"Team 2: {team_2_possession}%", org=(1400, 950), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=1, color=(0, 0, 0), thickness=3)
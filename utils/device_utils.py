@@ -1,9 +1,13 @@
-import torch
+import functools
 
+@functools.lru_cache(maxsize=None)
 def get_device() -> str:
+    # torch is imported and probed once per process, not on import of utils
+    import torch
+
     if torch.cuda.is_available():
         return "cuda"  
     elif torch.backends.mps.is_available():
         return "mps"  # Metal Performance Shaders (Apple Silicon)
     else:
-        return "cpu"
\ No newline at end of file
+        return "cpu"
@@ -0,0 +1,81 @@
+from typing import Iterator, List, Tuple, Union
+import os
+import tempfile
+import weakref
+import numpy as np
+
+class FrameStore:
+    """
+    Decoded frames in a raw file on disk, memory-mapped and used like the list of frames of read_video:
+    len(), frames[i], frames[i:j] (list), iteration and in-place drawing into frames[i].
+    The multi-pass stages (detection, camera movement, team assignment, rendering) page the frames in from the file
+    instead of holding every frame of a long match in RAM, repeated access is served by the page cache of the OS.
+    Frames are appended once (decoding) and all have the same shape, the file is deleted by close() or when the store is garbage collected.
+    """
+    def __init__(self, directory: str=None) -> None:
+        """
+        directory: location of the file (e.g. a fast local disk), the temp directory of the system if None.
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        file_descriptor, self.path = tempfile.mkstemp(suffix=".frames", dir=directory)
+        self.file = os.fdopen(file_descriptor, "w+b")
+        self._remove = weakref.finalize(self, os.remove, self.path)
+
+        self.shape = None           # shape of one frame
+        self.num_frames = 0
+        self._frames = None         # memory map of the whole file, recreated after appending
+
+    def append(self, frame: np.ndarray) -> None:
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} differs from the shape of the stored frames {self.shape}.")
+
+        self.file.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        self.num_frames += 1
+        self._frames = None
+
+    def extend(self, frames: Iterator[np.ndarray]) -> None:
+        for frame in frames:
+            self.append(frame)
+
+    @property
+    def frames(self) -> np.ndarray:
+        if self._frames is None and self.num_frames > 0:
+            self.file.flush()
+            self._frames = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(self.num_frames, *self.shape))
+        return self._frames
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[np.ndarray, List[np.ndarray]]:
+        # plain arrays without copy, changes (e.g. drawing) are written to the file
+        if isinstance(index, slice):
+            return [np.asarray(self.frames[i]) for i in range(*index.indices(self.num_frames))]
+        if index < -self.num_frames or index >= self.num_frames:
+            raise IndexError("Frame index out of range.")
+        return np.asarray(self.frames[index])
+
+    def __setitem__(self, index: int, frame: np.ndarray) -> None:
+        self.frames[index] = frame
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for i in range(self.num_frames):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        return self.num_frames * int(np.prod(self.shape)) if self.shape is not None else 0
+
+    def close(self) -> None:
+        self._frames = None
+        self.file.close()
+        self._remove()
+
+    def __enter__(self) -> "FrameStore":
+        return self
+
+    def __exit__(self, *args: Tuple) -> None:
+        self.close()
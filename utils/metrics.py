@@ -0,0 +1,184 @@
+from typing import Callable, Dict, Iterator
+import os
+import functools
+import json
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+import psutil
+
+# stages that are timed inside another stage (stage: outer stage), their time is already part of the outer stage
+NESTED_STAGES = {"inference": "detect"}
+
+class StageMetrics:
+    """
+    Wall time, frames and latency histogram of the calls of one stage.
+    """
+    # upper bounds of the latency buckets in seconds (last bucket: everything above)
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, np.inf)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.frames = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bucket_counts = np.zeros(len(self.BUCKETS), dtype=np.int64)
+
+    def add(self, seconds: float, frames: int) -> None:
+        self.calls += 1
+        self.frames += frames
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bucket_counts[np.searchsorted(self.BUCKETS, seconds)] += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket of the q-quantile of the call latencies.
+        """
+        if self.calls == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.bucket_counts), q * self.calls))
+        return min(self.BUCKETS[bucket], self.max_seconds)
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "frames": self.frames,
+            "seconds": round(self.seconds, 6),
+            "fps": round(self.frames / self.seconds, 2) if self.seconds > 0 else 0.0,
+            "latency_p50": round(self.quantile(0.5), 6),
+            "latency_p95": round(self.quantile(0.95), 6),
+            "latency_max": round(self.max_seconds, 6),
+            "buckets": {str(bound): int(count) for bound, count in zip(self.BUCKETS, self.bucket_counts)}
+        }
+
+class Metrics:
+    """
+    Registry of the stage timings of a run (decode, detect, track, camera_movement, team_assignment, possession, annotate, encode).
+    Stages are timed with the stage() context manager, from any thread.
+    Peak RSS is sampled at the end of the stage calls that took at least RSS_INTERVAL (batches), and at most every RSS_INTERVAL
+    for the per-frame calls (decode, annotate, encode), a syscall per frame would cost more than some of the stages.
+    Exported as JSON or in the Prometheus text format (e.g. for the node exporter textfile collector).
+    """
+    RSS_INTERVAL = 0.05     # seconds
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.process = psutil.Process()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages = {}
+            self.start_time = time.time()
+            self.peak_rss = self.process.memory_info().rss
+            self.rss_time = time.perf_counter()     # time of the last sample
+
+    @contextmanager
+    def stage(self, name: str, frames: int=1) -> Iterator[None]:
+        """
+        Times the block as one call of the stage that processed frames frames.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time, frames)
+
+    def add(self, name: str, seconds: float, frames: int=1) -> None:
+        """
+        One call of the stage measured by the caller.
+        """
+        now = time.perf_counter()
+        if seconds >= self.RSS_INTERVAL or now - self.rss_time >= self.RSS_INTERVAL:
+            self.sample_rss(now)
+
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            self.stages[name].add(seconds, frames)
+
+    def sample_rss(self, now: float=None) -> None:
+        rss = self.process.memory_info().rss
+
+        with self.lock:
+            self.rss_time = now or time.perf_counter()
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def merge(self, summary: Dict) -> None:
+        """
+        Adds the stages of the summary of another registry, e.g. of a worker process.
+        """
+        with self.lock:
+            for name, stage in summary["stages"].items():
+                if name not in self.stages:
+                    self.stages[name] = StageMetrics(name)
+                self.stages[name].calls += stage["calls"]
+                self.stages[name].frames += stage["frames"]
+                self.stages[name].seconds += stage["seconds"]
+                self.stages[name].max_seconds = max(self.stages[name].max_seconds, stage["latency_max"])
+                self.stages[name].bucket_counts += np.array(list(stage["buckets"].values()), dtype=np.int64)
+            self.peak_rss = max(self.peak_rss, int(summary["peak_rss_mb"] * 1024**2))
+
+    def timed(self, name: str, frames: Callable[..., int]=None) -> Callable:
+        """
+        Decorator timing every call of the function as the stage, frames: number of frames from the arguments of the call, 1 if None.
+        """
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name, frames(*args, **kwargs) if frames is not None else 1):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self) -> Dict:
+        self.sample_rss()
+
+        with self.lock:
+            wall_time = time.time() - self.start_time
+            return {
+                "wall_time": round(wall_time, 6),
+                "peak_rss_mb": round(self.peak_rss / 1024**2, 2),
+                "stages": {name: stage.to_dict() for name, stage in self.stages.items()}
+            }
+
+    def save(self, path: str) -> None:
+        """
+        Prometheus text format for .prom files, else JSON.
+        """
+        if path.endswith(".prom"):
+            self.save_prometheus(path)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.summary(), f, indent=2)
+
+    def save_prometheus(self, path: str) -> None:
+        summary = self.summary()
+        lines = [
+            "# TYPE matchvision_wall_time_seconds gauge",
+            f"matchvision_wall_time_seconds {summary['wall_time']}",
+            "# TYPE matchvision_peak_rss_bytes gauge",
+            f"matchvision_peak_rss_bytes {self.peak_rss}",
+            "# TYPE matchvision_stage_frames_total counter",
+            *[f'matchvision_stage_frames_total{{stage="{name}"}} {stage["frames"]}' for name, stage in summary["stages"].items()],
+            "# TYPE matchvision_stage_seconds histogram"
+        ]
+
+        for name, stage in summary["stages"].items():
+            cumulative = 0
+            for bound, count in stage["buckets"].items():
+                cumulative += count
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'matchvision_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'matchvision_stage_seconds_sum{{stage="{name}"}} {stage["seconds"]}')
+            lines.append(f'matchvision_stage_seconds_count{{stage="{name}"}} {stage["calls"]}')
+
+        # write and rename: the collector never reads a partial file
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+metrics = Metrics()     # registry of the process, reset at the start of every run
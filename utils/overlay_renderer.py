@@ -0,0 +1,35 @@
+from typing import Callable, Iterable, Iterator, List
+import numpy as np
+from .metrics import metrics
+
+# draws one overlay (ellipses, triangles, stats boxes, ...) into the frame in place, frame_num: index of the frame in the frames to render
+Layer = Callable[[np.ndarray, int], None]
+
+class OverlayRenderer:
+    """
+    Composes all overlay layers of a frame in one pass.
+    in_place: draw directly into the decoded frames (no copy, the frames are changed), for frames that are not needed after rendering.
+    Else every frame is copied into one reusable output buffer before drawing: the yielded frame is only valid until the next one is rendered,
+    so it has to be written (or copied) before the iteration continues.
+    """
+    def __init__(self, in_place: bool=False) -> None:
+        self.in_place = in_place
+        self.buffer = None
+
+    def render(self, frames: Iterable[np.ndarray], layers: List[Layer]) -> Iterator[np.ndarray]:
+        layers = [layer for layer in layers if layer is not None]
+
+        for frame_num, frame in enumerate(frames):
+            with metrics.stage("annotate"):
+                if self.in_place:
+                    output = frame
+                else:
+                    if self.buffer is None or self.buffer.shape != frame.shape or self.buffer.dtype != frame.dtype:
+                        self.buffer = np.empty_like(frame)
+                    np.copyto(self.buffer, frame)
+                    output = self.buffer
+
+                for layer in layers:
+                    layer(output, frame_num)
+
+            yield output
@@ -0,0 +1,151 @@
+from typing import List, Iterable
+import os
+import time
+import logging
+import subprocess
+from fractions import Fraction
+import numpy as np
+from .video_utils import VideoWriter
+from .metrics import metrics
+
+logger = logging.getLogger("memory_access")
+
+class FFmpegVideoWriter:
+    """
+    Incremental video writer that pipes the raw frames into an ffmpeg process (ffmpeg has to be installed),
+    encoding runs in parallel to the processing in its own process.
+    preset, crf, threads: x264 speed/size tradeoff, quality (lower is better) and number of encoding threads (None: ffmpeg decides).
+    fragmented: fragmented MP4 that can be read while it is written.
+    segment_time: write segments of this many seconds (path_000.mp4, path_001.mp4, ...) instead of one file, finished segments can be read.
+    """
+    def __init__(self, path: str, fps: float=24, codec: str="libx264", preset: str="veryfast", crf: int=23, threads: int=None,
+                 fragmented: bool=False, segment_time: float=None, binary: str="ffmpeg") -> None:
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.fragmented = fragmented
+        self.segment_time = segment_time
+        self.binary = binary
+        self.process = None
+        self.num_frames = 0
+
+    def get_command(self, width: int, height: int) -> List[str]:
+        command = [self.binary, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",    # raw BGR frames from stdin
+                   "-c:v", self.codec, "-pix_fmt", "yuv420p"]       # yuv420p: playable in browsers
+
+        if self.codec.startswith("libx26"):
+            command += ["-preset", self.preset, "-crf", str(self.crf)]
+        if self.threads is not None:
+            command += ["-threads", str(self.threads)]
+
+        movflags = "+frag_keyframe+empty_moov+default_base_moof" if self.fragmented else "+faststart"
+        if self.segment_time is not None:
+            root, ext = os.path.splitext(self.path)
+            command += ["-force_key_frames", f"expr:gte(t,n_forced*{self.segment_time})",     # segments can only start at a keyframe
+                        "-f", "segment", "-segment_time", str(self.segment_time), "-reset_timestamps", "1",
+                        "-segment_format_options", f"movflags={movflags}", f"{root}_%03d{ext}"]
+        else:
+            command += ["-movflags", movflags, self.path]
+
+        return command
+
+    def write(self, frame: np.ndarray) -> None:
+        if self.process is None:
+            self.process = subprocess.Popen(self.get_command(frame.shape[1], frame.shape[0]), stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        try:
+            with metrics.stage("encode"):
+                self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(f"ffmpeg failed: {self.process.stderr.read().decode(errors='replace')}")
+        self.num_frames += 1
+
+    def release(self) -> None:
+        if self.process is None:
+            raise ValueError("No frames to save.")
+
+        # end of input, ffmpeg finishes the file
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {self.process.stderr.read().decode(errors='replace')}")
+
+class PyAVVideoWriter:
+    """
+    Incremental video writer with PyAV (FFmpeg libraries in this process, no ffmpeg binary needed), same options as FFmpegVideoWriter without segments.
+    """
+    def __init__(self, path: str, fps: float=24, codec: str="libx264", preset: str="veryfast", crf: int=23, threads: int=None, fragmented: bool=False) -> None:
+        import av     # optional dependency, only needed for this writer
+
+        self.av = av
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.options = {"preset": preset, "crf": str(crf)} if codec.startswith("libx26") else {}
+        self.threads = threads
+        self.fragmented = fragmented
+        self.container = None
+        self.stream = None
+        self.num_frames = 0
+
+    def write(self, frame: np.ndarray) -> None:
+        if self.container is None:
+            movflags = "frag_keyframe+empty_moov+default_base_moof" if self.fragmented else "faststart"
+            self.container = self.av.open(self.path, mode="w", options={"movflags": movflags})
+            # PyAV needs a fraction, e.g. 12.5 --> 25/2, 29.97 --> 2997/100
+            self.stream = self.container.add_stream(self.codec, rate=Fraction(self.fps).limit_denominator(1001), options=self.options)
+            self.stream.width, self.stream.height = frame.shape[1], frame.shape[0]
+            self.stream.pix_fmt = "yuv420p"
+            if self.threads is not None:
+                self.stream.codec_context.thread_count = self.threads
+
+        with metrics.stage("encode"):
+            for packet in self.stream.encode(self.av.VideoFrame.from_ndarray(frame, format="bgr24")):
+                self.container.mux(packet)
+        self.num_frames += 1
+
+    def release(self) -> None:
+        if self.container is None:
+            raise ValueError("No frames to save.")
+
+        # flush the frames buffered in the encoder
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+encoders = {"opencv": VideoWriter, "ffmpeg": FFmpegVideoWriter, "pyav": PyAVVideoWriter}
+
+def get_video_writer(path: str, fps: float=24, encoder: str="opencv", **options) -> VideoWriter:
+    """
+    encoder: "opencv" (cv2.VideoWriter with the bundled openh264, no options), "ffmpeg" (FFmpegVideoWriter) or "pyav" (PyAVVideoWriter).
+    options: keyword arguments of the writer, e.g. preset, crf, threads, fragmented, None and False values are left out (defaults of the writer).
+    """
+    if encoder not in encoders:
+        raise ValueError(f"Unknown encoder {encoder}, valid options are: {', '.join(encoders)}.")
+
+    options = {k: v for k, v in options.items() if v is not None and v is not False}     # defaults of the writer
+    if encoder == "opencv" and options:
+        raise ValueError(f"Options {', '.join(options)} are only supported by the ffmpeg and pyav encoders.")
+
+    return encoders[encoder](path, fps, **options)
+
+def save_video(frames: Iterable[np.ndarray], path: str, fps: float=24, verbose: bool=True, encoder: str="opencv", **options) -> None:
+    """
+    Frames can be a list or a generator, every frame is encoded as soon as it is produced.
+    encoder, options: see get_video_writer.
+    """
+    start_time = time.time()
+
+    out = get_video_writer(path, fps, encoder, **options)
+    
+    for frame in frames:
+        out.write(frame)
+    
+    out.release()   
+
+    if verbose:
+            logger.info(f"Saving video in {time.time() - start_time:.2f} seconds.")
@@ -1,10 +1,16 @@
-from typing import List, Union, Tuple
+from typing import List, Union, Tuple, Iterable, Iterator
+import os
 import numpy as np
 import cv2
 import time
 from datetime import datetime
 import logging
 import tempfile
+import threading
+import queue
+from collections import deque
+from .metrics import metrics
+from .frame_store import FrameStore
 
 file_handler = logging.FileHandler("logs/memory_access.log")
 file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
@@ -16,50 +22,348 @@ logger.setLevel(logging.INFO)
 logger.addHandler(file_handler)
 logger.addHandler(stream_handler)
 
-def read_video(input: Union[str, bytes], verbose: bool=True) -> Tuple[List[np.ndarray], int, int, str]:
-    start_time = time.time()
-
+def _open_capture(input: Union[str, bytes]) -> Tuple[cv2.VideoCapture, str]:
+    """
+    Returns the capture and the path of the temporary file (None for path input) that has to be removed after reading.
+    """
     if isinstance(input, bytes):
         with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as f:
             f.write(input)
             temp_filename = f.name
-        cap = cv2.VideoCapture(temp_filename)
+        return cv2.VideoCapture(temp_filename), temp_filename
     elif isinstance(input, str):
-        cap = cv2.VideoCapture(input)
+        return cv2.VideoCapture(input), None
     else:
         raise ValueError("Input data must be either bytes or a string file path.")
-    
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
 
-    frames = []
-    while True:
-        # ret: True/False if there is a next frame
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
+class VideoDecoder:
+    """
+    Decodes a video file or the bytes of a video file, one pass over the frames.
+    start, end: only the frames start to end (exclusive), e.g. a segment of the video.
+    time_range: (start, end) in seconds instead of start and end, None for the beginning or the end of the video.
+    stride: only every stride-th frame, the frames in between are skipped without conversion to BGR, the fps of the output is divided by stride.
+    scale: downscale factor at decode time, e.g. 0.5 for analysis-only runs (the overlays are drawn for full HD frames).
+    threaded: decode in a background thread up to queue_size frames ahead of the consumer.
+    Bytes are decoded in memory with PyAV if it is installed, else from a temporary file that is removed after reading.
+    """
+    def __init__(self, input: Union[str, bytes], start: int=0, end: int=None, stride: int=1, scale: float=None, threaded: bool=True, 
+                 queue_size: int=8, time_range: Tuple[float, float]=None) -> None:
+        if stride < 1:
+            raise ValueError("Stride must be at least 1.")
 
-    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
-    codec = "".join([chr((fourcc >> 8 * i) & 0xFF) for i in range(4)])
+        self.cap = None
+        self.container = None
+        self.temp_filename = None
 
-    cap.release()
+        if isinstance(input, bytes) and _has_pyav():
+            import av, io
+            self.container = av.open(io.BytesIO(input))
+            self.stream = self.container.streams.video[0]
+            self.stream.thread_type = "AUTO"     # multi-threaded decoding of the codec
+            frame_rate = float(self.stream.average_rate or 25)
+            codec = self.stream.codec_context.codec_tag or self.stream.codec_context.name
+            self.fourcc = sum(ord(c) << 8 * i for i, c in enumerate(codec[:4]))
+        else:
+            self.cap, self.temp_filename = _open_capture(input)
+            frame_rate = self.cap.get(cv2.CAP_PROP_FPS)
+            self.fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+
+        self.codec = "".join([chr((self.fourcc >> 8 * i) & 0xFF) for i in range(4)])
+        self.frame_rate = frame_rate
+        self.fps = frame_rate / stride    # fps of the decoded frames, e.g. 12.5 for every 2nd frame of 25 fps
+
+        if time_range is not None:
+            start = int(round(time_range[0] * frame_rate)) if time_range[0] is not None else 0
+            end = int(round(time_range[1] * frame_rate)) if time_range[1] is not None else None
+
+        self.start = start
+        self.end = end
+        self.stride = stride
+        self.scale = scale
+        self.threaded = threaded
+        self.queue_size = queue_size
+        self.num_frames = 0     # decoded frames
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        frames = self._decode_pyav() if self.container is not None else self._decode_capture()
+        return _prefetch(frames, self.queue_size) if self.threaded else frames
+
+    def _resize(self, frame: np.ndarray) -> np.ndarray:
+        if self.scale is None or self.scale == 1:
+            return frame
+        return cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+    def _decode_capture(self) -> Iterator[np.ndarray]:
+        if self.start > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start)     # seeks to the previous keyframe and decodes up to the frame
+
+        position = self.start
+        try:
+            while self.end is None or position < self.end:
+                if (position - self.start) % self.stride:
+                    # decoded, but not converted and copied
+                    decode_time = time.perf_counter()
+                    if not self.cap.grab():
+                        break
+                    metrics.add("decode", time.perf_counter() - decode_time, 0)
+                else:
+                    # ret: True/False if there is a next frame
+                    decode_time = time.perf_counter()
+                    ret, frame = self.cap.read()
+                    if not ret:
+                        break
+                    metrics.add("decode", time.perf_counter() - decode_time)
+                    self.num_frames += 1
+                    yield self._resize(frame)
+                position += 1
+        finally:
+            # also runs if the consumer stops early
+            self.release()
+
+    def _decode_pyav(self) -> Iterator[np.ndarray]:
+        time_base = float(self.stream.time_base)
+        first_pts = self.stream.start_time or 0
+
+        if self.start > 0:
+            self.container.seek(int(self.start / self.frame_rate / time_base) + first_pts, stream=self.stream)     # previous keyframe
+
+        try:
+            decode_time = time.perf_counter()
+            for frame in self.container.decode(self.stream):
+                position = int(round((frame.pts - first_pts) * time_base * self.frame_rate))
+                if position < self.start or (position - self.start) % self.stride:
+                    continue
+                if self.end is not None and position >= self.end:
+                    break
+
+                self.num_frames += 1
+                frame = self._resize(frame.to_ndarray(format="bgr24"))
+                metrics.add("decode", time.perf_counter() - decode_time)
+                yield frame
+                decode_time = time.perf_counter()
+        finally:
+            self.release()
+
+    def release(self) -> None:
+        if self.cap is not None:
+            self.cap.release()
+        if self.container is not None:
+            self.container.close()
+        if self.temp_filename is not None and os.path.exists(self.temp_filename):
+            os.remove(self.temp_filename)
+
+def _has_pyav() -> bool:
+    try:
+        import av
+        return True
+    except ImportError:
+        return False
+
+def _prefetch(frames: Iterator[np.ndarray], queue_size: int) -> Iterator[np.ndarray]:
+    """
+    Runs the frames iterator in a background thread, at most queue_size frames ahead of the consumer.
+    """
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+    end = object()      # marks the end of the frames
+
+    def read() -> None:
+        try:
+            for frame in frames:
+                # wait for space in the queue, unless the consumer stopped
+                while not stopped.is_set():
+                    try:
+                        frame_queue.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stopped.is_set():
+                    break
+            frame_queue.put(end)
+        except Exception as e:
+            frame_queue.put(e)
+        finally:
+            frames.close()
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            frame = frame_queue.get()
+            if frame is end:
+                break
+            if isinstance(frame, Exception):
+                raise frame
+            yield frame
+    finally:
+        stopped.set()
+        # unblock the reader if the queue is full
+        while thread.is_alive():
+            try:
+                frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+def read_video(input: Union[str, bytes], verbose: bool=True, frame_store: FrameStore=None, **options) -> Tuple[Union[List[np.ndarray], FrameStore], float, int, str]:
+    """
+    frame_store: the frames are appended to this store on disk and it is returned instead of a list, for long videos.
+    options: start, end, time_range, stride, scale, threaded, see VideoDecoder.
+    """
+    start_time = time.time()
+
+    decoder = VideoDecoder(input, **options)
+    if frame_store is not None:
+        frame_store.extend(decoder)
+        frames = frame_store
+    else:
+        frames = list(decoder)
 
     if verbose:
             logger.info(f"Reading input video from memory in {time.time() - start_time:.2f} seconds.")
 
-    return frames, fps, fourcc, codec
+    return frames, decoder.fps, decoder.fourcc, decoder.codec
 
-def save_video(frames: List[np.ndarray], path: str, fps: int=24, verbose: bool=True) -> None:
-    start_time = time.time()
+def stream_video(input: Union[str, bytes], verbose: bool=True, start: int=0, end: int=None, **options) -> Tuple[Iterator[np.ndarray], float]:
+    """
+    Lazy counterpart of read_video.
+    Returns a generator decoding one frame at a time and the fps of the video, so only the frames currently in use are held in memory.
+    start, end: only the frames start to end (exclusive), e.g. a segment of the video.
+    options: time_range, stride, scale, threaded, see VideoDecoder.
+    """
+    decoder = VideoDecoder(input, start, end, **options)
+
+    def frames() -> Iterator[np.ndarray]:
+        start_time = time.time()
 
-    fourcc = cv2.VideoWriter_fourcc(*"avc1")    # codec for compressing the video
-    out = cv2.VideoWriter(filename=path, fourcc=fourcc, fps=fps, frameSize=(frames[0].shape[1], frames[0].shape[0]))
-    
+        try:
+            yield from decoder
+        finally:
+            # also runs if the consumer stops early
+            decoder.release()
+
+            if verbose:
+                logger.info(f"Streamed {decoder.num_frames} frames from input video in {time.time() - start_time:.2f} seconds.")
+
+    return frames(), decoder.fps
+
+class LiveCapture:
+    """
+    Reads a live source (webcam index, RTSP/HTTP URL or file) in a background thread into a buffer of the latest buffer_size frames.
+    If the consumer is slower than the source, the oldest frames are dropped instead of building up latency.
+    realtime: read a file at its fps, a file-backed stand-in for a camera (tests, replays).
+    """
+    def __init__(self, source: Union[int, str], buffer_size: int=32, realtime: bool=False) -> None:
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open the video source {source}.")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25     # webcams and streams might not report it
+        self.realtime = realtime
+
+        self.buffer = deque(maxlen=buffer_size)     # (capture time, frame)
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.finished = False       # source has no more frames
+        self.num_frames = 0         # frames read from the source
+        self.num_dropped = 0        # frames dropped because the buffer was full
+
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self) -> None:
+        start_time = time.time()
+
+        while not self.stopped.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+
+            if self.realtime:
+                # wait until the frame would arrive from a camera
+                time.sleep(max(0.0, start_time + self.num_frames / self.fps - time.time()))
+
+            with self.condition:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.num_dropped += 1
+                self.buffer.append((time.time(), frame))
+                self.num_frames += 1
+                self.condition.notify()
+
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+
+    def read(self, max_frames: int, timeout: float=1.0) -> List[Tuple[float, np.ndarray]]:
+        """
+        Up to max_frames buffered (capture time, frame) pairs, oldest first, waits up to timeout seconds for the first one.
+        Empty if the source has ended or nothing arrived in time.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.buffer or self.finished, timeout)
+
+            return [self.buffer.popleft() for _ in range(min(max_frames, len(self.buffer)))]
+
+    @property
+    def ended(self) -> bool:
+        with self.condition:
+            return self.finished and not self.buffer
+
+    def release(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.cap.release()
+
+def get_frame_count(path: str) -> int:
+    """
+    Number of frames from the container metadata, without decoding.
+    """
+    cap = cv2.VideoCapture(path)
+    num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    return num_frames
+
+def frame_windows(frames: Iterable[np.ndarray], window_size: int) -> Iterator[List[np.ndarray]]:
+    """
+    Groups a frame iterable into lists of at most window_size consecutive frames.
+    """
+    if window_size < 1:
+        raise ValueError("Window size must be at least 1.")
+
+    window = []
     for frame in frames:
-        out.write(frame)
-    
-    # close video file and release ressources
-    out.release()   
+        window.append(frame)
 
-    if verbose:
-            logger.info(f"Saving video in {time.time() - start_time:.2f} seconds.")
\ No newline at end of file
+        if len(window) == window_size:
+            yield window
+            window = []
+
+    if window:
+        yield window
+
+class VideoWriter:
+    """
+    Incremental video writer, opened with the size of the first written frame.
+    """
+    def __init__(self, path: str, fps: float=24) -> None:
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*"avc1")    # codec for compressing the video
+        self.out = None
+        self.num_frames = 0
+
+    def write(self, frame: np.ndarray) -> None:
+        if self.out is None:
+            self.out = cv2.VideoWriter(filename=self.path, fourcc=self.fourcc, fps=self.fps, frameSize=(frame.shape[1], frame.shape[0]))
+        with metrics.stage("encode"):
+            self.out.write(frame)
+        self.num_frames += 1
+
+    def release(self) -> None:
+        if self.out is None:
+            raise ValueError("No frames to save.")
+
+        # close video file and release ressources
+        self.out.release()